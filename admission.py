@@ -0,0 +1,88 @@
+import threading
+import time
+
+# share of the in-flight limit and of the queue time a priority may use
+PRIORITIES = {
+    "normal": 1.0,
+    "low": 0.8,
+    "lowest": 0.6,
+}
+
+
+def parse_priorities(spec):
+    """``"clients_interests=low,batch=lowest"`` -> {'clients_interests': 'low', ...}"""
+    priorities = {}
+    for part in filter(None, (p.strip() for p in spec.split(','))):
+        name, _, priority = part.partition('=')
+        if priority not in PRIORITIES:
+            raise ValueError('Unknown priority %r, must be one of %s' % (priority, ', '.join(PRIORITIES)))
+        priorities[name] = priority
+    return priorities
+
+
+class AdmissionController:
+    """Sheds requests before they are handled when the server is overloaded.
+
+    A request is rejected when ``max_in_flight`` requests are already being
+    handled or when it has waited too long for a worker. The allowed wait follows
+    CoDel: it is ``interval`` seconds while the queue drains, and drops to
+    ``target`` seconds once the shortest wait seen during a whole ``interval``
+    stayed above ``target``, i.e. the queue never emptied. Only requests that
+    really waited for a worker pass ``queued``; an interval without such samples
+    does not count as overloaded. A method gets the full limits unless it is given
+    a lower priority, which gets only its PRIORITIES share of both, so it is shed
+    first.
+    Zero disables a limit.
+    """
+
+    def __init__(self, max_in_flight=0, target=0.005, interval=0.1, priorities=None, default_priority="normal"):
+        self.max_in_flight = max_in_flight
+        self.target = target
+        self.interval = interval
+        self.priorities = priorities or {}
+        self.default_priority = default_priority
+        self.in_flight = 0
+        self.admitted = 0
+        self.shed_in_flight = 0
+        self.shed_queued = 0
+        self._overloaded = False
+        self._min_queued = None
+        self._interval_end = time.monotonic() + interval
+        self._lock = threading.Lock()
+
+    def priority(self, name):
+        return self.priorities.get(name, self.default_priority)
+
+    def admit(self, name, queued=None):
+        """Returns None once the request may run (call ``release`` when it is done),
+        or the reason it was shed, "in_flight" or "queue_time". ``queued`` is None for
+        a request that did not wait for a worker, e.g. the next one on a kept-alive
+        connection."""
+        share = PRIORITIES[self.priority(name)]
+        now = time.monotonic()
+        with self._lock:
+            if now >= self._interval_end:
+                self._overloaded = self._min_queued is not None and self._min_queued > self.target
+                self._min_queued = None
+                self._interval_end = now + self.interval
+            if queued is not None:
+                self._min_queued = queued if self._min_queued is None else min(self._min_queued, queued)
+            if self.max_in_flight and self.in_flight >= self.max_in_flight * share:
+                self.shed_in_flight += 1
+                return "in_flight"
+            limit = self.target if self._overloaded else self.interval
+            if self.target and queued is not None and queued > limit * share:
+                self.shed_queued += 1
+                return "queue_time"
+            self.in_flight += 1
+            self.admitted += 1
+            return None
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def stats(self):
+        with self._lock:
+            return {"in_flight": self.in_flight, "admitted": self.admitted, "shed_in_flight": self.shed_in_flight,
+                    "shed_queue_time": self.shed_queued, "overloaded": int(self._overloaded)}
@@ -1,16 +1,34 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import hmac
 import json
 import logging
 import hashlib
+import os
+import signal
+import sys
+import threading
+import time
 import uuid
+from collections import OrderedDict
+from contextlib import nullcontext
 from datetime import datetime, timedelta
+from functools import partial
 from optparse import OptionParser
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from http.server import BaseHTTPRequestHandler
 from weakref import WeakKeyDictionary
+import metrics
+from admission import AdmissionController, parse_priorities
+from log_queue import setup_logging
 import scoring
+from metrics import REGISTRY
+from profiling import SampledProfiler, format_timings, mark
+from server import ListeningHTTPServer, PooledHTTPServer, PreforkServer
+from sharding import parse_servers
 from store import Store
+from value_codec import make_codec
+from warmup import hot_keys, read_keys, save_keys, warm_up
 
 SALT = "Otus"
 ADMIN_LOGIN = "admin"
@@ -21,13 +39,23 @@ FORBIDDEN = 403
 NOT_FOUND = 404
 INVALID_REQUEST = 422
 INTERNAL_ERROR = 500
+SERVICE_UNAVAILABLE = 503
 ERRORS = {
     BAD_REQUEST: "Bad Request",
     FORBIDDEN: "Forbidden",
     NOT_FOUND: "Not Found",
     INVALID_REQUEST: "Invalid Request",
     INTERNAL_ERROR: "Internal Server Error",
+    SERVICE_UNAVAILABLE: "Service Unavailable",
 }
+MAX_BATCH_SIZE = 100
+AUTH_CACHE_SIZE = 10000
+ADMIN_TOKEN_GRACE = 60
+STREAM_BATCH_SIZE = 100
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+INSUFFICIENT_DATA = ('Insufficient data to assess, must be at least one pair:'
+                     ' (phone - email) or (first name - last name) or (gender - birthday)')
+BREAKER_STATES = {"closed": 0, "half-open": 1, "open": 2}
 UNKNOWN = 0
 MALE = 1
 FEMALE = 2
@@ -39,31 +67,86 @@ GENDERS = {
 
 
 class FieldsOwner(type):
+    """Compiles the fields of a request class once, at class creation.
+
+    Field values live in per-instance slots, ``_fields`` is the ordered tuple of
+    fields including inherited ones, and ``_populate`` is a validation routine
+    generated for exactly these fields.
+    """
+
     def __new__(cls, name, bases, attrs):
+        own = []
         for n, v in attrs.items():
             if isinstance(v, Field):
                 v.label = n
-        return super().__new__(cls, name, bases, attrs)
+                v.slot = '_' + n
+                own.append(v)
+        attrs['__slots__'] = tuple(attrs.get('__slots__', ())) + tuple(v.slot for v in own)
+        new_class = super().__new__(cls, name, bases, attrs)
+        fields = {}
+        for klass in reversed(new_class.__mro__):
+            for v in klass.__dict__.get('_own_fields', ()):
+                fields[v.label] = v
+        for v in own:
+            fields[v.label] = v
+        new_class._own_fields = tuple(own)
+        new_class._fields = tuple(fields.values())
+        new_class._populate = compile_populate(new_class._fields)
+        return new_class
+
+
+def compile_populate(fields):
+    lines = ['def populate(self, kwargs):', '    pass']
+    namespace = {}
+    for i, field in enumerate(fields):
+        validate = f'validate{i}'
+        namespace[validate] = field.validate
+        label, slot = field.label, field.slot
+        not_nullable = f'raise ValueError("Field {label} is not nullable.")'
+        lines.append(f'    if {label!r} in kwargs:')
+        lines.append(f'        value = kwargs[{label!r}]')
+        if field.nullable:
+            lines.append(f'        self.{slot} = None if value is None else {validate}(value)')
+        else:
+            lines.append('        if value is None:')
+            lines.append(f'            {not_nullable}')
+            lines.append(f'        self.{slot} = {validate}(value)')
+        lines.append('    else:')
+        if field.required:
+            lines.append(f'        raise ValueError("Field {label} is required")')
+        elif field.nullable:
+            lines.append(f'        self.{slot} = None')
+        else:
+            lines.append(f'        {not_nullable}')
+    exec('\n'.join(lines), namespace)
+    return namespace['populate']
 
 
 class Field(object):
     def __init__(self, required=False, nullable=True):
         self.label = None
+        self.slot = None
         self.required = required
         self.nullable = nullable
         self.data = WeakKeyDictionary()
 
     def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        if self.slot is not None:
+            return getattr(instance, self.slot, None)
         return self.data.get(instance)
 
     def __set__(self, instance, value):
         if value is None:
-            if self.nullable:
-                self.data[instance] = value
-            else:
+            if not self.nullable:
                 raise ValueError(f"Field {self.label} is not nullable.")
         else:
-            self.data[instance] = self.validate(value)
+            value = self.validate(value)
+        if self.slot is not None:
+            setattr(instance, self.slot, value)
+        else:
+            self.data[instance] = value
 
     def validate(self, value):
         return value
@@ -140,15 +223,11 @@ class ArgumentsField(Field):
 
 class Request(metaclass=FieldsOwner):
     def __init__(self, **kwargs):
-        self.fields = {}
-        for n, v in self.__class__.__dict__.items():
-            if isinstance(v, Field):
-                if v.required and n not in kwargs:
-                    raise ValueError(f'Field {v.label} is required')
-                value = kwargs.get(n, None)
-                v.__set__(self, value)
-                self.fields[n] = v.__get__(self, Request)
-        super().__init__()
+        self._populate(kwargs)
+
+    @property
+    def fields(self):
+        return {f.label: getattr(self, f.slot) for f in self._fields}
 
 
 class MethodRequest(Request):
@@ -169,11 +248,28 @@ class ClientsInterestsRequest(Request):
 
     def get_response(self, ctx, store):
         ctx.update({'nclients': len(self.client_ids)})
-        res = {cid: scoring.get_interests(store, cid) for cid in self.client_ids}
+        res = scoring.get_interests_many(store, self.client_ids)
         return res
 
+    @classmethod
+    def get_responses(cls, requests, store):
+        found = scoring.get_interests_many(store, [cid for r in requests for cid in r.client_ids])
+        return [{cid: found[cid] for cid in r.client_ids} for r in requests]
+
+    async def get_response_async(self, ctx, store):
+        ctx.update({'nclients': len(self.client_ids)})
+        return await scoring.get_interests_many_async(store, self.client_ids)
+
+    def iter_response(self, ctx, store, batch_size=STREAM_BATCH_SIZE):
+        """Yields the interests of at most batch_size distinct clients at a time."""
+        ctx.update({'nclients': len(self.client_ids)})
+        cids = list(dict.fromkeys(self.client_ids))
+        for i in range(0, len(cids), batch_size):
+            yield scoring.get_interests_many(store, cids[i:i + batch_size])
+
 
 class OnlineScoreRequest(Request):
+    __slots__ = ('is_admin',)
     first_name = CharField(required=False, nullable=True)
     last_name = CharField(required=False, nullable=True)
     email = EmailField(required=False, nullable=True)
@@ -185,8 +281,7 @@ class OnlineScoreRequest(Request):
         super().__init__(**kwargs)
         self.is_admin = kwargs.get('is_admin', False)
         if not self.validate():
-            raise ValueError('Insufficient data to assess, must be at least one pair:'
-                             ' (phone - email) or (first name - last name) or (gender - birthday)')
+            raise ValueError(INSUFFICIENT_DATA)
 
     def validate(self):
         return (self.phone is not None and self.email is not None
@@ -201,112 +296,650 @@ class OnlineScoreRequest(Request):
             res = scoring.get_score(store, **self.fields)
         return {'score': res}
 
+    @classmethod
+    def get_responses(cls, requests, store):
+        scores = iter(scoring.get_score_many(store, [r.fields for r in requests if not r.is_admin]))
+        return [{'score': 42 if r.is_admin else next(scores)} for r in requests]
 
-def check_auth(request):
-    if request.is_admin:
-        digest = hashlib.sha512((datetime.now().strftime("%Y%m%d%H") + ADMIN_SALT).encode()).hexdigest()
-    else:
-        digest = hashlib.sha512((request.account + request.login + SALT).encode()).hexdigest()
-    if digest == request.token:
+    async def get_response_async(self, ctx, store):
+        ctx.update({'has': [n for n, v in self.fields.items() if v is not None]})
+        if self.is_admin:
+            res = 42
+        else:
+            res = await scoring.get_score_async(store, **self.fields)
+        return {'score': res}
+
+
+def admin_digest(hour):
+    return hashlib.sha512((hour.strftime("%Y%m%d%H") + ADMIN_SALT).encode()).hexdigest().encode()
+
+
+def user_digest(account, login):
+    return hashlib.sha512((account + login + SALT).encode()).hexdigest().encode()
+
+
+class AuthVerifier:
+    """Checks request tokens without hashing on every request.
+
+    Digests of (account, login) pairs that authenticated successfully are kept in
+    a bounded LRU. The admin digests of the current and the previous hour are
+    computed once per hour; the previous one is still accepted during the first
+    ``admin_grace`` seconds of an hour. Tokens are compared in constant time.
+    """
+
+    def __init__(self, max_entries=AUTH_CACHE_SIZE, admin_grace=ADMIN_TOKEN_GRACE):
+        self.max_entries = max_entries
+        self.admin_grace = admin_grace
+        self._digests = OrderedDict()
+        self._lock = threading.Lock()
+        self._admin = None
+        self.hits = 0
+        self.misses = 0
+        self.hash_seconds = 0.0
+
+    def _admin_digests(self):
+        now = time.time()
+        admin = self._admin
+        if admin is None or now >= admin[0]:
+            hour = datetime.now().replace(minute=0, second=0, microsecond=0)
+            expires_at = (hour + timedelta(hours=1)).timestamp()
+            admin = self._admin = (expires_at, hour.timestamp(), admin_digest(hour),
+                                   admin_digest(hour - timedelta(hours=1)))
+        _, started_at, current, previous = admin
+        return current, previous if now - started_at < self.admin_grace else None
+
+    def _hash(self, account, login):
+        started = time.perf_counter()
+        digest = user_digest(account, login)
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.hash_seconds += elapsed
+        return digest
+
+    def check(self, request):
+        if request.is_admin:
+            current, previous = self._admin_digests()
+            token = (request.token or '').encode()
+            return hmac.compare_digest(current, token) or previous is not None and hmac.compare_digest(previous, token)
+        key = (request.account, request.login)
+        with self._lock:
+            digest = self._digests.get(key)
+            if digest is not None:
+                self._digests.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        if digest is None:
+            digest = self._hash(request.account, request.login)
+        if request.token is None or not hmac.compare_digest(digest, request.token.encode()):
+            return False
+        with self._lock:
+            self._digests[key] = digest
+            if len(self._digests) > self.max_entries:
+                self._digests.popitem(last=False)
         return True
-    return False
 
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._digests),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'cpu_saved_seconds': self.hits * self.hash_seconds / self.misses if self.misses else 0.0,
+            }
 
-def method_handler(request, ctx, store):
-    response, code = None, None
-    methods = {
-        "online_score": OnlineScoreRequest,
-        "clients_interests": ClientsInterestsRequest
-    }
 
+auth_verifier = AuthVerifier()
+
+
+def check_auth(request):
+    authorized = auth_verifier.check(request)
+    AUTH_CHECKS.inc('admin' if request.is_admin else 'user', 'ok' if authorized else 'forbidden')
+    return authorized
+
+
+METHODS = {
+    "online_score": OnlineScoreRequest,
+    "clients_interests": ClientsInterestsRequest
+}
+
+
+def build_method_request(request, ctx, auth_cache=None):
+    """Validate and authorize a request, returning (method_request, response, code).
+
+    method_request is None when the request has already failed and response/code
+    describe the failure. auth_cache, when given, memoizes check_auth results by
+    (account, login, token). The validate and auth phase timings go to ctx.
+    """
+    started = time.perf_counter()
     try:
         request_body = MethodRequest(**request['body'])
     except Exception as ex:
-        logging.exception("Invalid request: %s" % ex)
-        if isinstance(ex, (ValueError, TypeError)):
-            response = str(ex)
+        logging.exception("Invalid request: %s", ex)
+        response = str(ex) if isinstance(ex, (ValueError, TypeError)) else None
+        return None, response, INVALID_REQUEST
+    finally:
+        started = mark(ctx, 'validate', started)
+
+    if auth_cache is None:
+        authorized = check_auth(request_body)
+    else:
+        key = (request_body.account, request_body.login, request_body.token)
+        authorized = auth_cache.get(key)
+        if authorized is None:
+            authorized = auth_cache[key] = check_auth(request_body)
+    started = mark(ctx, 'auth', started)
+    if not authorized:
+        return None, None, FORBIDDEN
+    try:
+        method_request = METHODS[request_body.method](**{**request_body.arguments, 'is_admin': request_body.is_admin})
+    except (ValueError, TypeError) as ex:
+        logging.exception("Invalid request: %s", ex)
+        return None, str(ex), INVALID_REQUEST
+    finally:
+        mark(ctx, 'validate', started)
+    return method_request, None, None
+
+
+def method_label(request):
+    method = request['body'].get('method') if isinstance(request['body'], dict) else None
+    return method if method in METHODS else 'unknown'
+
+
+def method_handler(request, ctx, store):
+    started = time.perf_counter()
+    response, code = handle_method(request, ctx, store)
+    method = method_label(request)
+    METHOD_REQUESTS.inc(method, code)
+    METHOD_DURATION.observe(time.perf_counter() - started, method)
+    return response, code
+
+
+def handle_method(request, ctx, store):
+    method_request, response, code = build_method_request(request, ctx)
+    if method_request is None:
+        return response, code
+    started = time.perf_counter()
+    try:
+        response = method_request.get_response(ctx, store)
+        code = OK
+    except (ValueError, TypeError) as ex:
+        logging.exception("Invalid request: %s", ex)
+        response = str(ex)
         code = INVALID_REQUEST
+    except MemoryError as ex:
+        logging.exception("Storage error: %s", ex)
+        code = INTERNAL_ERROR
+    mark(ctx, 'handle', started)
+    return response, code
+
+
+def stream_method(request, ctx, store, batch_size=STREAM_BATCH_SIZE):
+    """Validates a clients_interests request and returns (batches, OK) with an iterator
+    of the interests of batch_size clients at a time, or the error response and code."""
+    method_request, response, code = build_method_request(request, ctx)
+    if method_request is None:
+        METHOD_REQUESTS.inc(method_label(request), code)
+        return response, code
+    METHOD_REQUESTS.inc(method_label(request), OK)
+    return method_request.iter_response(ctx, store, batch_size), OK
+
+
+async def method_handler_async(request, ctx, store):
+    started = time.perf_counter()
+    response, code = await handle_method_async(request, ctx, store)
+    method = method_label(request)
+    METHOD_REQUESTS.inc(method, code)
+    METHOD_DURATION.observe(time.perf_counter() - started, method)
+    return response, code
+
+
+async def handle_method_async(request, ctx, store):
+    method_request, response, code = build_method_request(request, ctx)
+    if method_request is None:
         return response, code
+    started = time.perf_counter()
+    try:
+        response = await method_request.get_response_async(ctx, store)
+        code = OK
+    except (ValueError, TypeError) as ex:
+        logging.exception("Invalid request: %s", ex)
+        response = str(ex)
+        code = INVALID_REQUEST
+    except MemoryError as ex:
+        logging.exception("Storage error: %s", ex)
+        code = INTERNAL_ERROR
+    mark(ctx, 'handle', started)
+    return response, code
+
 
-    if check_auth(request_body):
+def batch_handler(request, ctx, store, max_size=MAX_BATCH_SIZE):
+    """Handle a list of method requests, answering with a list of per-item responses.
+
+    Every distinct (account, login, token) is checked once, and the store is queried
+    once per request type for all items of that type.
+    """
+    items = request['body']
+    if not isinstance(items, list) or not items:
+        return 'Batch must be a non-empty list of method requests.', INVALID_REQUEST
+    if len(items) > max_size:
+        return f'Batch of {len(items)} requests exceeds the limit of {max_size}.', INVALID_REQUEST
+    ctx.update({'nitems': len(items)})
+
+    results = [None] * len(items)
+    groups = {}
+    auth_cache = {}
+    for i, body in enumerate(items):
+        try:
+            method_request, response, code = build_method_request({"body": body, "headers": request['headers']},
+                                                                  ctx, auth_cache)
+        except (TypeError, ValueError) as ex:
+            logging.exception(ex)
+            method_request, response, code = None, str(ex), INVALID_REQUEST
+        except Exception as ex:
+            logging.exception("Unexpected error: %s", ex)
+            method_request, response, code = None, None, INTERNAL_ERROR
+        if method_request is None:
+            results[i] = make_response(response, code)
+        else:
+            groups.setdefault(type(method_request), []).append((i, method_request))
+
+    started = time.perf_counter()
+    for request_class, members in groups.items():
         try:
-            method_request_body = (
-                methods[request_body.method](**{**request_body.arguments, 'is_admin': request_body.is_admin}))
-
-            response = method_request_body.get_response(ctx, store)
-            code = OK
-        except (ValueError, TypeError) as ex:
-            logging.exception("Invalid request: %s" % ex)
-            response = str(ex)
-            code = INVALID_REQUEST
+            responses = request_class.get_responses([r for _, r in members], store)
+            for (i, _), response in zip(members, responses):
+                results[i] = make_response(response, OK)
         except MemoryError as ex:
-            logging.exception("Storage error: %s" % ex)
-            code = INTERNAL_ERROR
-    else:
-        code = FORBIDDEN
-    return response, code
+            logging.exception("Storage error: %s", ex)
+            for i, _ in members:
+                results[i] = make_response(None, INTERNAL_ERROR)
+    mark(ctx, 'handle', started)
+    return results, OK
+
+
+HTTP_REQUESTS = REGISTRY.counter('http_requests_total', 'HTTP requests by path and response code.', ('path', 'code'))
+HTTP_DURATION = REGISTRY.histogram('http_request_duration_seconds', 'HTTP request handling time.', ('path',))
+REQUESTS_SHED = REGISTRY.counter('http_requests_shed_total', 'Requests rejected by admission control.',
+                                 ('method', 'reason'))
+METHOD_REQUESTS = REGISTRY.counter('method_requests_total', 'Method requests by method and response code.',
+                                   ('method', 'code'))
+METHOD_DURATION = REGISTRY.histogram('method_duration_seconds', 'Method request handling time.', ('method',))
+AUTH_CHECKS = REGISTRY.counter('auth_checks_total', 'Token checks by login kind and result.', ('login', 'result'))
+
+
+def stats_values(stats, *labels):
+    return {labels + (name,): value for name, value in stats.items() if isinstance(value, (int, float))}
+
+
+def store_stats(attribute):
+    def collect():
+        stats = getattr(MainHTTPHandler.store, attribute)
+        return stats_values(stats.stats()) if stats is not None else {}
+    return collect
+
+
+def breaker_values():
+    values = {}
+    for role, stats in MainHTTPHandler.store.breaker_stats().items():
+        values.update(stats_values({**stats, 'state': BREAKER_STATES[stats['state']]}, role))
+    return values
+
+
+REGISTRY.gauge('auth_cache', 'Token digest cache statistics.', ('stat',), lambda: stats_values(auth_verifier.stats()))
+REGISTRY.gauge('http_admission', 'Admission control statistics.', ('stat',),
+               lambda: stats_values(MainHTTPHandler.admission.stats()) if MainHTTPHandler.admission else {})
+REGISTRY.gauge('store_local_cache', 'In-process cache statistics.', ('stat',), store_stats('local_cache'))
+REGISTRY.gauge('store_single_flight', 'Coalesced storage reads.', ('stat',), store_stats('flights'))
+REGISTRY.gauge('store_write_behind', 'Queued cache writes.', ('stat',), store_stats('write_queue'))
+REGISTRY.gauge('store_hedged_reads', 'Storage reads hedged to replicas.', ('stat',), store_stats('hedged_reads'))
+REGISTRY.gauge('store_pool', 'Memcached client pool statistics.', ('role', 'stat'),
+               lambda: {key: value for role, stats in MainHTTPHandler.store.pool_stats().items()
+                        for key, value in stats_values(stats, role).items()})
+REGISTRY.gauge('store_breaker', 'Circuit breaker statistics, state 0 closed, 1 half-open, 2 open.', ('role', 'stat'),
+               breaker_values)
+
+
+def make_response(response, code):
+    if code not in ERRORS:
+        return {"response": response, "code": code}
+    return {"error": response or ERRORS.get(code, "Unknown Error"), "code": code}
 
 
 class MainHTTPHandler(BaseHTTPRequestHandler):
     router = {
-        "method": method_handler
+        "method": method_handler,
+        "batch": batch_handler,
     }
     store = Store()
+    # seconds, requests taking longer are logged with their phase timings
+    slow_request_threshold = None
+    profiler = None
+    # clients fetched and written at a time in a streamed clients_interests response
+    stream_batch_size = STREAM_BATCH_SIZE
+    # AdmissionController, requests it sheds get 503 with Retry-After seconds
+    admission = None
+    retry_after = 1
+    protocol_version = "HTTP/1.1"
+    # seconds an idle connection is kept open, with 0 it is closed after every response
+    keepalive_timeout = 0
+    # responses on one connection before it is closed
+    keepalive_requests = 100
+    # headers and body are buffered and sent together when the request is done
+    wbufsize = 64 * 1024
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        if self.keepalive_timeout:
+            self.timeout = self.keepalive_timeout
+        super().setup()
+        self.requests_served = 0
+        # seconds the connection waited for a worker, known only in a pooled server
+        accepted_at = getattr(self.server, 'accepted_at', None)
+        accepted = accepted_at() if accepted_at is not None else None
+        self.queued = time.monotonic() - accepted if accepted is not None else None
+
+    def handle_one_request(self):
+        super().handle_one_request()
+        # only the first request of a connection waited for a worker
+        self.queued = None
 
     def get_request_id(self, headers):
         return headers.get('HTTP_X_REQUEST_ID', uuid.uuid4().hex)
 
+    def start_response(self, code, content_type, headers):
+        self.requests_served += 1
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if self.close_connection or not self.keepalive_timeout or self.requests_served >= self.keepalive_requests:
+            self.send_header("Connection", "close")
+        self.end_headers()
+
+    def send_body(self, code, data, content_type="application/json", headers=None):
+        self.start_response(code, content_type, {"Content-Length": str(len(data)), **(headers or {})})
+        self.wfile.write(data)
+
+    def wants_stream(self, path, request):
+        return (path == "method" and self.request_version == "HTTP/1.1"
+                and NDJSON_CONTENT_TYPE in self.headers.get("Accept", "")
+                and method_label({"body": request}) == "clients_interests")
+
+    def send_stream(self, batches):
+        """Writes every batch of interests as a chunk of NDJSON lines as soon as it is fetched.
+
+        The status is sent before the first batch, so a failure is reported as a last
+        error line; the returned code tells whether the stream completed.
+        """
+        self.start_response(OK, NDJSON_CONTENT_TYPE, {"Transfer-Encoding": "chunked"})
+        code = OK
+        while code == OK:
+            try:
+                batch = next(batches, None)
+            except Exception as ex:
+                logging.exception("Error while streaming interests: %s", ex)
+                code = INTERNAL_ERROR
+                lines = [make_response(None, code)]
+            else:
+                if batch is None:
+                    break
+                lines = [{"client_id": cid, "interests": interests} for cid, interests in batch.items()]
+            data = "".join(json.dumps(line) + "\n" for line in lines).encode()
+            if data:
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+        return code
+
+    def do_GET(self):
+        if self.path.strip("/") != "metrics":
+            self.send_body(NOT_FOUND, json.dumps(make_response(None, NOT_FOUND)).encode())
+            return
+        self.send_body(OK, REGISTRY.render().encode(), metrics.CONTENT_TYPE)
+
+    def admit(self, path, request):
+        if self.admission is None:
+            return True
+        name = method_label({"body": request}) if path == "method" else path
+        reason = self.admission.admit(name, self.queued)
+        if reason is None:
+            return True
+        REQUESTS_SHED.inc(name, reason)
+        return False
+
     def do_POST(self):
+        with self.profiler.sample() if self.profiler is not None else nullcontext():
+            self.handle_post()
+
+    def handle_post(self):
+        started = time.perf_counter()
         response, code = {}, OK
         context = {"request_id": self.get_request_id(self.headers)}
-        request = None
+        request = stream = None
         try:
             data_string = self.rfile.read(int(self.headers['Content-Length']))
+            phase_started = mark(context, 'read', started)
             request = json.loads(data_string)
+            phase_started = mark(context, 'decode', phase_started)
         except Exception as ex:
-            logging.exception("Bad request: %s" % ex)
+            logging.exception("Bad request: %s", ex)
             code = BAD_REQUEST
+            # the rest of the body, if any, can't be told from the next request
+            self.close_connection = True
 
         if code == OK:
             path = self.path.strip("/")
-            logging.info("%s: %s %s" % (self.path, request, context["request_id"]))
-            if path in self.router:
+            logging.info("%s: %s %s", self.path, request, context["request_id"])
+            if path not in self.router:
+                code = NOT_FOUND
+            elif not self.admit(path, request):
+                code = SERVICE_UNAVAILABLE
+            else:
                 try:
-                    response, code = self.router[path]({"body": request, "headers": self.headers}, context, self.store)
+                    if self.wants_stream(path, request):
+                        response, code = stream_method({"body": request, "headers": self.headers}, context,
+                                                       self.store, self.stream_batch_size)
+                        if code == OK:
+                            stream, response = response, None
+                    else:
+                        response, code = self.router[path]({"body": request, "headers": self.headers}, context,
+                                                           self.store)
                 except (TypeError, ValueError) as ex:
                     logging.exception(ex)
                     response = str(ex)
                     code = INVALID_REQUEST
                 except Exception as e:
-                    logging.exception("Unexpected error: %s" % e)
+                    logging.exception("Unexpected error: %s", e)
                     code = INTERNAL_ERROR
-            else:
-                code = NOT_FOUND
-
-        self.send_response(code)
-        self.send_header("Content-Type", "application/json")
-        self.end_headers()
-        if code not in ERRORS:
-            r = {"response": response, "code": code}
+                finally:
+                    if self.admission is not None and stream is None:
+                        self.admission.release()
+
+        phase_started = time.perf_counter()
+        if stream is not None:
+            try:
+                code = self.send_stream(stream)
+            finally:
+                if self.admission is not None:
+                    self.admission.release()
+            r = {"code": code}
+            mark(context, 'stream', phase_started)
         else:
-            r = {"error": response or ERRORS.get(code, "Unknown Error"), "code": code}
+            r = make_response(response, code)
+            data = json.dumps(r).encode()
+            phase_started = mark(context, 'serialize', phase_started)
+            headers = {"Retry-After": str(self.retry_after)} if code == SERVICE_UNAVAILABLE else None
+            self.send_body(code, data, headers=headers)
+            self.wfile.flush()
+            mark(context, 'write', phase_started)
+        elapsed = time.perf_counter() - started
         context.update(r)
-        logging.info(context)
-        self.wfile.write(json.dumps(r).encode())
+        logging.info(context, extra={"response_code": code})
+        if self.slow_request_threshold is not None and elapsed >= self.slow_request_threshold:
+            logging.warning("Slow request %s %s: %.2fms %s", self.path, context["request_id"], elapsed * 1000,
+                            format_timings(context["timings"]))
+        path = self.path.strip("/")
+        path = path if path in self.router else 'other'
+        HTTP_REQUESTS.inc(path, code)
+        HTTP_DURATION.observe(elapsed, path)
         return
 
 
+def hedge_workers(opts):
+    if opts.hedge_workers > 0:
+        return opts.hedge_workers
+    # a read and its hedge per request thread, and a write to every replica
+    replicas = len(parse_servers(opts.db_replicas)) if opts.db_replicas else 0
+    return max(opts.workers, 1) * max(replicas, 2)
+
+
+def build_store(opts):
+    return Store(opts.store_host, opts.store_port, l1_entries=opts.l1_entries, l1_bytes=opts.l1_bytes,
+                 l1_ttl=opts.l1_ttl, pool_size=opts.pool_size, pool_min=opts.pool_min,
+                 pool_idle_timeout=opts.pool_idle_timeout, pool_timeout=opts.pool_timeout,
+                 cache_failure_threshold=opts.cache_failures, db_failure_threshold=opts.db_failures,
+                 probe_interval=opts.probe_interval, coalesce_timeout=opts.coalesce_timeout,
+                 write_behind=opts.write_behind, write_behind_batch=opts.write_behind_batch,
+                 write_behind_interval=opts.write_behind_interval, write_behind_timeout=opts.write_behind_timeout,
+                 codec=make_codec(opts.interests_vocab),
+                 cache_servers=parse_servers(opts.cache_servers) if opts.cache_servers else None,
+                 db_servers=parse_servers(opts.db_servers) if opts.db_servers else None,
+                 db_replicas=parse_servers(opts.db_replicas) if opts.db_replicas else None,
+                 hedge_percentile=opts.hedge_percentile, hedge_max_delay=opts.hedge_max_delay,
+                 hedge_budget=opts.hedge_budget, hedge_workers=hedge_workers(opts))
+
+
+def make_server(opts, bind_and_activate=True):
+    address = ("localhost", opts.port)
+    if opts.workers > 0:
+        # an open connection holds its worker, so without workers it would hold the server
+        MainHTTPHandler.keepalive_timeout = opts.keepalive_timeout
+        MainHTTPHandler.keepalive_requests = opts.keepalive_requests
+        return PooledHTTPServer(address, MainHTTPHandler, opts.workers, opts.queue, bind_and_activate)
+    return ListeningHTTPServer(address, MainHTTPHandler, bind_and_activate)
+
+
+# QueueListener of a forked worker, stopped when it exits
+worker_log_listener = None
+
+
+def init_worker(opts):
+    global worker_log_listener
+    MainHTTPHandler.store = build_store(opts)
+    if opts.processes > 0 and opts.log_queue > 0:
+        # the writer thread of the parent does not exist in a forked child
+        worker_log_listener = setup_logging(opts.log, opts.log_queue, opts.log_sample)
+    if opts.slow_ms is not None:
+        MainHTTPHandler.slow_request_threshold = opts.slow_ms / 1000
+    if opts.max_in_flight > 0 or opts.codel_target > 0:
+        MainHTTPHandler.admission = AdmissionController(opts.max_in_flight, opts.codel_target, opts.codel_interval,
+                                                        parse_priorities(opts.priorities))
+        MainHTTPHandler.retry_after = opts.retry_after
+    MainHTTPHandler.stream_batch_size = opts.stream_batch
+    if opts.profile_every > 0:
+        MainHTTPHandler.profiler = SampledProfiler(opts.profile_every, opts.profile_path, opts.profile_interval)
+    if opts.warmup_keys and os.path.exists(opts.warmup_keys):
+        started = time.perf_counter()
+        keys = read_keys(opts.warmup_keys)
+        found = warm_up(MainHTTPHandler.store, keys)
+        logging.info("Warmed up %s of %s keys in %.2fs", found, len(keys), time.perf_counter() - started)
+
+
+def shutdown_worker(opts):
+    if opts.warmup_keys:
+        # the keys in the L1 cache are the ones to read on the next start
+        keys = hot_keys(MainHTTPHandler.store)
+        if keys:
+            save_keys(opts.warmup_keys, keys)
+            logging.info("Recorded %s hot keys to %s", len(keys), opts.warmup_keys)
+    # writes the queued cache values before the process goes away
+    MainHTTPHandler.store.close()
+    if MainHTTPHandler.profiler is not None:
+        MainHTTPHandler.profiler.dump()
+    if worker_log_listener is not None:
+        # writes the queued records, the process exits without running atexit
+        worker_log_listener.stop()
+
+
 if __name__ == "__main__":
     op = OptionParser()
     op.add_option("-p", "--port", action="store", type=int, default=8080)
     op.add_option("-l", "--log", action="store", default=None)
+    op.add_option("-w", "--workers", action="store", type=int, default=0)
+    op.add_option("--queue", action="store", type=int, default=None)
+    op.add_option("--processes", action="store", type=int, default=0)
+    op.add_option("--reuse-port", action="store_true", default=False)
+    op.add_option("--store-host", action="store", default="localhost")
+    op.add_option("--store-port", action="store", type=int, default=11211)
+    op.add_option("--cache-servers", action="store", default=None)
+    op.add_option("--db-servers", action="store", default=None)
+    op.add_option("--db-replicas", action="store", default=None)
+    op.add_option("--hedge-percentile", action="store", type=float, default=95)
+    op.add_option("--hedge-max-delay", action="store", type=float, default=0.05)
+    op.add_option("--hedge-budget", action="store", type=float, default=0.05)
+    op.add_option("--hedge-workers", action="store", type=int, default=0)
+    op.add_option("--l1-entries", action="store", type=int, default=0)
+    op.add_option("--l1-bytes", action="store", type=int, default=0)
+    op.add_option("--l1-ttl", action="store", type=int, default=60)
+    op.add_option("--pool-size", action="store", type=int, default=0)
+    op.add_option("--pool-min", action="store", type=int, default=0)
+    op.add_option("--pool-idle-timeout", action="store", type=float, default=60)
+    op.add_option("--pool-timeout", action="store", type=float, default=1.0)
+    op.add_option("--cache-failures", action="store", type=int, default=0)
+    op.add_option("--db-failures", action="store", type=int, default=0)
+    op.add_option("--probe-interval", action="store", type=float, default=5.0)
+    op.add_option("--coalesce-timeout", action="store", type=float, default=1.0)
+    op.add_option("--write-behind", action="store", type=int, default=0)
+    op.add_option("--write-behind-batch", action="store", type=int, default=100)
+    op.add_option("--write-behind-interval", action="store", type=float, default=0.05)
+    op.add_option("--write-behind-timeout", action="store", type=float, default=0.1)
+    op.add_option("--interests-vocab", action="store", default=None)
+    op.add_option("--warmup-keys", action="store", default=None)
+    op.add_option("--auth-cache-size", action="store", type=int, default=AUTH_CACHE_SIZE)
+    op.add_option("--admin-grace", action="store", type=int, default=ADMIN_TOKEN_GRACE)
+    op.add_option("--max-batch", action="store", type=int, default=MAX_BATCH_SIZE)
+    op.add_option("--max-in-flight", action="store", type=int, default=0)
+    op.add_option("--codel-target", action="store", type=float, default=0.0)
+    op.add_option("--codel-interval", action="store", type=float, default=0.1)
+    op.add_option("--retry-after", action="store", type=int, default=1)
+    op.add_option("--priorities", action="store", default="")
+    op.add_option("--stream-batch", action="store", type=int, default=STREAM_BATCH_SIZE)
+    op.add_option("--keepalive-timeout", action="store", type=float, default=5.0)
+    op.add_option("--keepalive-requests", action="store", type=int, default=100)
+    op.add_option("--log-queue", action="store", type=int, default=0)
+    op.add_option("--log-sample", action="store", type=float, default=1.0)
+    op.add_option("--slow-ms", action="store", type=float, default=None)
+    op.add_option("--profile-every", action="store", type=int, default=0)
+    op.add_option("--profile-path", action="store", default="profile-{pid}.prof")
+    op.add_option("--profile-interval", action="store", type=float, default=60.0)
     (opts, args) = op.parse_args()
-    logging.basicConfig(filename=opts.log, level=logging.INFO,
-                        format='[%(asctime)s] %(levelname).1s %(message)s', datefmt='%Y.%m.%d %H:%M:%S')
-    server = HTTPServer(("localhost", opts.port), MainHTTPHandler)
-    logging.info("Starting server at %s" % opts.port)
+    log_listener = setup_logging(opts.log, opts.log_queue, opts.log_sample)
+    MainHTTPHandler.router["batch"] = partial(batch_handler, max_size=opts.max_batch)
+    auth_verifier = AuthVerifier(opts.auth_cache_size, opts.admin_grace)
     try:
-        server.serve_forever()
-    except KeyboardInterrupt:
-        pass
-    server.server_close()
+        if opts.processes > 0:
+            server = PreforkServer(lambda: make_server(opts, bind_and_activate=False), opts.processes,
+                                   reuse_port=opts.reuse_port, child_init=lambda: init_worker(opts),
+                                   child_exit=lambda: shutdown_worker(opts))
+            logging.info("Starting %s worker processes at %s", opts.processes, opts.port)
+            server.serve_forever()
+        else:
+            # SIGTERM unwinds like Ctrl-C, so the queued cache writes are flushed
+            signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+            init_worker(opts)
+            server = make_server(opts)
+            logging.info("Starting server at %s", opts.port)
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                server.server_close()
+                shutdown_worker(opts)
+    finally:
+        if log_listener is not None:
+            log_listener.stop()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import http.client
+import io
+import json
+import logging
+import uuid
+from http import HTTPStatus
+from optparse import OptionParser
+
+from api import BAD_REQUEST, INTERNAL_ERROR, INVALID_REQUEST, NOT_FOUND, OK, make_response, method_handler_async
+from async_store import AsyncStore
+from log_queue import setup_logging
+from value_codec import make_codec
+
+MAX_HEADER_SIZE = 64 * 1024
+NOT_IMPLEMENTED = 501
+
+
+class AsyncHTTPServer:
+    """HTTP/1.1 server running the method handlers on asyncio.
+
+    Every connection is a coroutine, so a request waiting on memcached costs no
+    thread. Connections are kept alive until the client closes them, asks to
+    close them or stays idle for ``idle_timeout`` seconds.
+    """
+    router = {
+        "method": method_handler_async
+    }
+
+    def __init__(self, host, port, store, idle_timeout=15.0):
+        self.host = host
+        self.port = port
+        self.store = store
+        self.idle_timeout = idle_timeout
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self.handle_connection, self.host, self.port, limit=MAX_HEADER_SIZE)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def serve_forever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), self.idle_timeout)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+                try:
+                    method, path, version, headers = self.parse_head(head)
+                    body = await reader.readexactly(int(headers.get('Content-Length') or 0))
+                except (ValueError, asyncio.IncompleteReadError):
+                    writer.write(self.render(BAD_REQUEST, make_response(None, BAD_REQUEST), False))
+                    break
+                keep_alive = self.keep_alive(version, headers)
+                code, r = await self.dispatch(method, path, headers, body)
+                writer.write(self.render(code, r, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def parse_head(head):
+        request_line, _, rest = head.partition(b'\r\n')
+        method, path, version = request_line.decode('iso-8859-1').split()
+        headers = http.client.parse_headers(io.BytesIO(rest))
+        return method, path, version, headers
+
+    @staticmethod
+    def keep_alive(version, headers):
+        connection = (headers.get('Connection') or '').lower()
+        if version == 'HTTP/1.0':
+            return connection == 'keep-alive'
+        return connection != 'close'
+
+    @staticmethod
+    def render(code, r, keep_alive):
+        body = json.dumps(r).encode()
+        status = HTTPStatus(code)
+        return b''.join([
+            b'HTTP/1.1 %d %s\r\n' % (code, status.phrase.encode()),
+            b'Content-Type: application/json\r\n',
+            b'Content-Length: %d\r\n' % len(body),
+            b'Connection: %s\r\n\r\n' % (b'keep-alive' if keep_alive else b'close'),
+            body,
+        ])
+
+    async def dispatch(self, method, path, headers, body):
+        if method != 'POST':
+            return NOT_IMPLEMENTED, {"error": "Unsupported method (%s)" % method, "code": NOT_IMPLEMENTED}
+        response, code = {}, OK
+        context = {"request_id": headers.get('HTTP_X_REQUEST_ID', uuid.uuid4().hex)}
+        request = None
+        try:
+            request = json.loads(body)
+        except Exception as ex:
+            logging.exception("Bad request: %s", ex)
+            code = BAD_REQUEST
+
+        if code == OK:
+            route = path.strip("/")
+            logging.info("%s: %s %s", path, request, context["request_id"])
+            if route in self.router:
+                try:
+                    response, code = await self.router[route]({"body": request, "headers": headers}, context,
+                                                              self.store)
+                except (TypeError, ValueError) as ex:
+                    logging.exception(ex)
+                    response = str(ex)
+                    code = INVALID_REQUEST
+                except Exception as e:
+                    logging.exception("Unexpected error: %s", e)
+                    code = INTERNAL_ERROR
+            else:
+                code = NOT_FOUND
+
+        r = make_response(response, code)
+        context.update(r)
+        logging.info(context, extra={"response_code": code})
+        return code, r
+
+
+async def main(opts):
+    store = AsyncStore(opts.store_host, opts.store_port, max_connections=opts.store_connections,
+                       codec=make_codec(opts.interests_vocab))
+    server = await AsyncHTTPServer("localhost", opts.port, store).start()
+    logging.info("Starting asyncio server at %s", server.port)
+    try:
+        await server.serve_forever()
+    finally:
+        await store.close()
+
+
+if __name__ == "__main__":
+    op = OptionParser()
+    op.add_option("-p", "--port", action="store", type=int, default=8080)
+    op.add_option("-l", "--log", action="store", default=None)
+    op.add_option("--store-host", action="store", default="localhost")
+    op.add_option("--store-port", action="store", type=int, default=11211)
+    op.add_option("--store-connections", action="store", type=int, default=10)
+    op.add_option("--interests-vocab", action="store", default=None)
+    op.add_option("--log-queue", action="store", type=int, default=0)
+    op.add_option("--log-sample", action="store", type=float, default=1.0)
+    (opts, args) = op.parse_args()
+    log_listener = setup_logging(opts.log, opts.log_queue, opts.log_sample)
+    try:
+        asyncio.run(main(opts))
+    except KeyboardInterrupt:
+        pass
+    if log_listener is not None:
+        log_listener.stop()
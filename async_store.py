@@ -0,0 +1,202 @@
+import asyncio
+import logging
+
+from store import check_key
+from value_codec import JSON_CODEC
+
+MAX_CONNECTIONS = 10
+
+
+class MemcacheProtocolError(Exception):
+    pass
+
+
+class AsyncMemcacheClient:
+    """memcached text-protocol client on top of asyncio streams.
+
+    Up to ``max_connections`` commands run at once, each on its own connection;
+    a connection that failed in the middle of a command is dropped.
+    """
+
+    def __init__(self, host, port, connect_timeout=0.05, timeout=0.05, max_connections=MAX_CONNECTIONS):
+        self.host = host
+        self.port = port
+        self.connect_timeout = connect_timeout
+        self.timeout = timeout
+        self._idle = []
+        self._slots = asyncio.Semaphore(max_connections)
+
+    async def _connect(self):
+        return await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.connect_timeout)
+
+    async def _run(self, command):
+        async with self._slots:
+            conn = self._idle.pop() if self._idle else await self._connect()
+            try:
+                result = await asyncio.wait_for(command(*conn), self.timeout)
+            except BaseException:
+                conn[1].close()
+                raise
+            self._idle.append(conn)
+            return result
+
+    @staticmethod
+    async def _read_line(reader):
+        line = await reader.readuntil(b'\r\n')
+        if line.startswith((b'ERROR', b'CLIENT_ERROR', b'SERVER_ERROR')):
+            raise MemcacheProtocolError(line.decode(errors='replace').strip())
+        return line[:-2]
+
+    async def get_many(self, keys):
+        if not keys:
+            return {}
+        encoded = {check_key(key): key for key in keys}
+
+        async def command(reader, writer):
+            writer.write(b'get ' + b' '.join(encoded) + b'\r\n')
+            await writer.drain()
+            found = {}
+            while True:
+                line = await self._read_line(reader)
+                if line == b'END':
+                    return found
+                _, key, _, size = line.split()[:4]
+                found[encoded[key]] = (await reader.readexactly(int(size) + 2))[:-2]
+
+        return await self._run(command)
+
+    async def get(self, key):
+        return (await self.get_many([key])).get(key)
+
+    async def set_many(self, values, expire=0):
+        if not values:
+            return []
+        items = [(key, check_key(key), value if isinstance(value, bytes) else str(value).encode())
+                 for key, value in values.items()]
+
+        async def command(reader, writer):
+            writer.write(b''.join(b'set %s 0 %d %d\r\n%s\r\n' % (encoded, expire, len(data), data)
+                                  for _, encoded, data in items))
+            await writer.drain()
+            failed = []
+            for key, _, _ in items:
+                if await self._read_line(reader) != b'STORED':
+                    failed.append(key)
+            return failed
+
+        return await self._run(command)
+
+    async def set(self, key, value, expire=0):
+        return not await self.set_many({key: value}, expire)
+
+    async def delete(self, key):
+        async def command(reader, writer):
+            writer.write(b'delete %s\r\n' % check_key(key))
+            await writer.drain()
+            return await self._read_line(reader) == b'DELETED'
+
+        return await self._run(command)
+
+    async def close(self):
+        idle, self._idle = self._idle, []
+        for reader, writer in idle:
+            writer.close()
+
+
+class AsyncRetryingClient:
+    def __init__(self, client, attempts=2, retry_delay=0):
+        self._client = client
+        self._attempts = attempts
+        self._retry_delay = retry_delay
+
+    async def _retry(self, func, *args, **kwargs):
+        for attempt in range(self._attempts):
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                if attempt >= self._attempts - 1:
+                    raise
+                await asyncio.sleep(self._retry_delay)
+
+    async def get(self, key):
+        return await self._retry(self._client.get, key)
+
+    async def set(self, key, value, expire=0):
+        return await self._retry(self._client.set, key, value, expire)
+
+    async def get_many(self, keys):
+        return await self._retry(self._client.get_many, keys)
+
+    async def set_many(self, values, expire=0):
+        return await self._retry(self._client.set_many, values, expire)
+
+    async def close(self):
+        await self._client.close()
+
+
+class AsyncStore:
+    """asyncio counterpart of store.Store with the same retry and error semantics."""
+
+    def __init__(self, host='localhost', port=11211, max_connections=MAX_CONNECTIONS, codec=None):
+        self.codec = codec or JSON_CODEC
+        self._cache_client = AsyncRetryingClient(
+            AsyncMemcacheClient(host, port, max_connections=max_connections),
+            attempts=2,
+            retry_delay=0.05
+        )
+        self._db_client = AsyncRetryingClient(
+            AsyncMemcacheClient(host, port, max_connections=max_connections),
+            attempts=3,
+            retry_delay=0.1
+        )
+
+    async def cache_get(self, key):
+        try:
+            res = await self._cache_client.get(key)
+            return res
+        except Exception as ex:
+            logging.error('Error while getting value from cache by key %s: %s', key, ex)
+
+    async def cache_set(self, key, value, expire=60):
+        try:
+            await self._cache_client.set(key, value, expire)
+        except Exception as ex:
+            logging.error('Error while setting value %s by key %s: %s', value, key, ex)
+
+    async def cache_get_many(self, keys):
+        try:
+            return await self._cache_client.get_many(keys)
+        except Exception as ex:
+            logging.error('Error while getting values from cache by keys %s: %s', keys, ex)
+            return {}
+
+    async def get(self, key):
+        res = await self.cache_get(key)
+        if res is None:
+            try:
+                res = await self._db_client.get(key)
+            except Exception as ex:
+                logging.error('Error while getting value from storage by key %s: %s', key, ex)
+                raise MemoryError(ex)
+        return res
+
+    async def get_many(self, keys):
+        res = await self.cache_get_many(keys)
+        missed = [key for key in keys if res.get(key) is None]
+        if missed:
+            try:
+                res.update(await self._db_client.get_many(missed))
+            except Exception as ex:
+                logging.error('Error while getting values from storage by keys %s: %s', missed, ex)
+                raise MemoryError(ex)
+        return res
+
+    async def set(self, key, value):
+        try:
+            await self._db_client.set(key, value)
+        except Exception as ex:
+            logging.error('Error while setting value %s by key %s: %s', value, key, ex)
+
+    async def close(self):
+        await self._cache_client.close()
+        await self._db_client.close()
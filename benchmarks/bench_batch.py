@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""N online_score requests sent one by one to /method against one /batch call.
+
+    python -m benchmarks.bench_batch --latency 0.001 --sizes 1,10,100
+"""
+
+import logging
+import time
+from optparse import OptionParser
+
+import api
+from benchmarks.common import free_port, post, quiet, serve_in_thread, signed_request
+from fake_memcached import FakeMemcached
+from server import ListeningHTTPServer
+from store import Store
+
+
+def profile(i):
+    return {"phone": "7917%07d" % i, "email": "user%s@otus.ru" % i}
+
+
+def timed(func):
+    started = time.perf_counter()
+    func()
+    return (time.perf_counter() - started) * 1000
+
+
+if __name__ == "__main__":
+    op = OptionParser()
+    op.add_option("--latency", action="store", type=float, default=0.001)
+    op.add_option("--sizes", action="store", default="1,10,100")
+    (opts, args) = op.parse_args()
+    logging.disable(logging.CRITICAL)
+    memcached = FakeMemcached(latency=opts.latency).start()
+    api.MainHTTPHandler.store = Store(port=memcached.port)
+    port = free_port()
+    server = ListeningHTTPServer(("localhost", port), quiet(api.MainHTTPHandler))
+    serve_in_thread(server)
+    print("%6s %12s %12s" % ("items", "single_ms", "batch_ms"))
+    for size in [int(s) for s in opts.sizes.split(",")]:
+        bodies = [signed_request("online_score", profile(i)) for i in range(size)]
+        memcached.flush()
+        single = timed(lambda: [post(port, body) for body in bodies])
+        memcached.flush()
+        batch = timed(lambda: post(port, bodies, "/batch"))
+        print("%6d %12.2f %12.2f" % (size, single, batch))
+    server.shutdown()
+    server.server_close()
+    memcached.stop()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Records per second of offline scoring: one OnlineScoreRequest per record against
+the column-wise NumPy engine in bulk_scoring, over the same generated JSONL.
+
+    python -m benchmarks.bench_bulk_scoring --records 200000 --chunk-size 65536
+"""
+
+import io
+import json
+import random
+import time
+from optparse import OptionParser
+
+import api
+import bulk_scoring
+import scoring
+
+
+def generate(records, seed=1):
+    rnd = random.Random(seed)
+    lines = []
+    for i in range(records):
+        record = {"phone": "7917%07d" % rnd.randrange(10 ** 7), "email": "user%s@otus.ru" % i}
+        if rnd.random() < 0.5:
+            record.update(first_name="Ivan", last_name="Petrov")
+        if rnd.random() < 0.5:
+            record.update(gender=rnd.randrange(3), birthday="%02d.%02d.%d" % (rnd.randrange(1, 29),
+                                                                              rnd.randrange(1, 13),
+                                                                              rnd.randrange(1960, 2005)))
+        lines.append(json.dumps(record) + "\n")
+    return lines
+
+
+def per_request(lines, dst):
+    for line in lines:
+        try:
+            request = api.OnlineScoreRequest(**json.loads(line))
+            result = api.make_response({"score": scoring.compute_score(**request.fields)}, api.OK)
+        except (TypeError, ValueError) as ex:
+            result = api.make_response(str(ex), api.INVALID_REQUEST)
+        dst.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    op = OptionParser()
+    op.add_option("--records", action="store", type=int, default=200000)
+    op.add_option("--chunk-size", action="store", type=int, default=bulk_scoring.CHUNK_SIZE)
+    (opts, args) = op.parse_args()
+    lines = generate(opts.records)
+    outputs = {}
+    print("%12s %10s %12s" % ("engine", "seconds", "records/s"))
+    for name, run in (("per-request", per_request),
+                      ("bulk", lambda src, dst: bulk_scoring.score_file(src, dst, opts.chunk_size))):
+        dst = outputs[name] = io.StringIO()
+        started = time.perf_counter()
+        run(lines, dst)
+        elapsed = time.perf_counter() - started
+        print("%12s %10.2f %12.0f" % (name, elapsed, opts.records / elapsed))
+    print("identical output:", outputs["per-request"].getvalue() == outputs["bulk"].getvalue())
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Construction time and memory of MethodRequest/OnlineScoreRequest with the
+compiled schema, against the previous implementation that scanned the class
+dict on every instantiation and kept values in per-field WeakKeyDictionaries.
+
+    python -m benchmarks.bench_fields --number 100000
+"""
+
+import gc
+import timeit
+import tracemalloc
+from optparse import OptionParser
+from weakref import WeakKeyDictionary
+
+import api
+
+
+class LegacyField:
+    def __init__(self, field):
+        self.field = field
+        self.data = WeakKeyDictionary()
+
+    def __get__(self, instance, owner):
+        return self.data.get(instance)
+
+    def __set__(self, instance, value):
+        if value is None:
+            if self.field.nullable:
+                self.data[instance] = value
+            else:
+                raise ValueError(f"Field {self.field.label} is not nullable.")
+        else:
+            self.data[instance] = self.field.validate(value)
+
+
+class LegacyRequest:
+    def __init__(self, **kwargs):
+        self.fields = {}
+        for n, v in self.__class__.__dict__.items():
+            if isinstance(v, LegacyField):
+                if v.field.required and n not in kwargs:
+                    raise ValueError(f'Field {n} is required')
+                value = kwargs.get(n, None)
+                v.__set__(self, value)
+                self.fields[n] = v.__get__(self, LegacyRequest)
+
+
+def legacy_class(request_class):
+    attrs = {f.label: LegacyField(f) for f in request_class._fields}
+    return type('Legacy' + request_class.__name__, (LegacyRequest,), attrs)
+
+
+LegacyMethodRequest = legacy_class(api.MethodRequest)
+LegacyOnlineScoreRequest = legacy_class(api.OnlineScoreRequest)
+
+METHOD_KWARGS = {"account": "horns&hoofs", "login": "h&f", "method": "online_score", "token": "t" * 128,
+                 "arguments": {}}
+SCORE_KWARGS = {"phone": "79175002040", "email": "stupnikov@otus.ru", "first_name": "a", "last_name": "b",
+                "gender": 1, "birthday": "01.01.2000"}
+
+
+def per_instance_bytes(request_class, kwargs, count=10000):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    instances = [request_class(**kwargs) for _ in range(count)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del instances
+    return (after - before) / count
+
+
+if __name__ == "__main__":
+    op = OptionParser()
+    op.add_option("--number", action="store", type=int, default=100000)
+    (opts, args) = op.parse_args()
+    print("%-20s %10s %10s %12s %12s" % ("request", "legacy_us", "new_us", "legacy_bytes", "new_bytes"))
+    for name, legacy, new, kwargs in [("MethodRequest", LegacyMethodRequest, api.MethodRequest, METHOD_KWARGS),
+                                      ("OnlineScoreRequest", LegacyOnlineScoreRequest, api.OnlineScoreRequest,
+                                       SCORE_KWARGS)]:
+        legacy_us = min(timeit.repeat(lambda: legacy(**kwargs), number=opts.number, repeat=3)) / opts.number * 1e6
+        new_us = min(timeit.repeat(lambda: new(**kwargs), number=opts.number, repeat=3)) / opts.number * 1e6
+        print("%-20s %10.2f %10.2f %12.0f %12.0f" % (name, legacy_us, new_us, per_instance_bytes(legacy, kwargs),
+                                                      per_instance_bytes(new, kwargs)))
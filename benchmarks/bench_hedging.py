@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""clients_interests storage read latency with a heavy-tailed db node, alone and
+with a replica taking hedged reads. The cache role runs on an empty node, so
+every read goes to the db role.
+
+    python -m benchmarks.bench_hedging --latency pareto:0.001,1.5 --reads 3000 --budget 0.05
+"""
+
+import logging
+import time
+from optparse import OptionParser
+
+import scoring
+from benchmarks.common import summarize
+from fake_memcached import FakeMemcached, parse_latency
+from store import Store
+
+
+def run(store, reads, cids):
+    latencies, errors = [], 0
+    started = time.perf_counter()
+    for i in range(reads):
+        begin = time.perf_counter()
+        try:
+            scoring.get_interests_many(store, cids[i % len(cids):i % len(cids) + 10])
+        except MemoryError:
+            errors += 1
+        latencies.append(time.perf_counter() - begin)
+    return {"elapsed": time.perf_counter() - started, "latencies": latencies, "errors": errors}
+
+
+if __name__ == "__main__":
+    op = OptionParser()
+    op.add_option("--latency", action="store", default="pareto:0.001,1.5")
+    op.add_option("--reads", action="store", type=int, default=3000)
+    op.add_option("--budget", action="store", type=float, default=0.05)
+    op.add_option("--percentile", action="store", type=float, default=95)
+    (opts, args) = op.parse_args()
+    logging.disable(logging.CRITICAL)
+    cids = list(range(1000))
+    cache = FakeMemcached().start()
+    nodes = [FakeMemcached(latency=parse_latency(opts.latency)).start() for _ in range(2)]
+    for node in nodes:
+        node.preload({"i:%s" % cid: '["books", "cars"]' for cid in cids})
+    print("%10s %10s %10s %10s %10s %7s %8s" % ("replicas", "rps", "p50_ms", "p99_ms", "p99.9_ms", "errors",
+                                                "hedged"))
+    for replicas in ([], [("localhost", nodes[1].port)]):
+        store = Store(port=nodes[0].port, cache_servers=[("localhost", cache.port)], db_replicas=replicas,
+                      hedge_percentile=opts.percentile, hedge_budget=opts.budget)
+        r = summarize(run(store, opts.reads, cids))
+        stats = store.hedge_stats()
+        print("%10d %10.1f %10.2f %10.2f %10.2f %7d %8s" % (len(replicas), r["rps"], r["p50_ms"], r["p99_ms"],
+                                                            r["p999_ms"], r["errors"], stats.get("hedged", "-")))
+        store.close()
+    for node in nodes + [cache]:
+        node.stop()
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""clients_interests latency by number of client ids: one Store.get per id
+against one Store.get_many per request.
+
+    python -m benchmarks.bench_interests --latency 0.001 --sizes 1,10,100,500
+"""
+
+import logging
+import time
+from optparse import OptionParser
+
+import scoring
+from fake_memcached import FakeMemcached
+from store import Store
+
+
+def timed(func, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+if __name__ == "__main__":
+    op = OptionParser()
+    op.add_option("--latency", action="store", type=float, default=0.001)
+    op.add_option("--sizes", action="store", default="1,10,100,500")
+    op.add_option("--repeat", action="store", type=int, default=3)
+    (opts, args) = op.parse_args()
+    logging.disable(logging.CRITICAL)
+    sizes = [int(s) for s in opts.sizes.split(",")]
+    memcached = FakeMemcached(latency=opts.latency).start()
+    memcached.preload({"i:%s" % cid: '["books", "cars"]' for cid in range(max(sizes))})
+    store = Store(port=memcached.port)
+    print("%6s %12s %12s" % ("ids", "get_ms", "get_many_ms"))
+    for size in sizes:
+        cids = list(range(size))
+        one_by_one = timed(lambda: {cid: scoring.get_interests(store, cid) for cid in cids}, opts.repeat)
+        batched = timed(lambda: scoring.get_interests_many(store, cids), opts.repeat)
+        print("%6d %12.2f %12.2f" % (size, one_by_one, batched))
+    store.close()
+    memcached.stop()
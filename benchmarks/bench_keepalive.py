@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Throughput of MainHTTPHandler with a new connection per request against
+keep-alive connections (one per client thread).
+
+    python -m benchmarks.bench_keepalive --requests 4000 --concurrency 8 --workers 8
+"""
+
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from optparse import OptionParser
+
+import api
+from benchmarks.common import free_port, post, quiet, serve_in_thread, signed_request, summarize
+from benchmarks.load_test import LoadClient
+from fake_memcached import FakeMemcached
+from server import PooledHTTPServer
+from store import Store
+
+
+def run(port, body, requests, concurrency, keepalive):
+    client = LoadClient(port)
+    data = json.dumps(body).encode()
+
+    def one(_):
+        started = time.perf_counter()
+        if keepalive:
+            status = client.send(data)
+        else:
+            try:
+                status, _ = post(port, body)
+            except OSError:
+                status = None
+        return status, time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(one, range(requests)))
+    return {"elapsed": time.perf_counter() - started, "latencies": [latency for _, latency in results],
+            "errors": sum(1 for status, _ in results if status != api.OK)}
+
+
+if __name__ == "__main__":
+    op = OptionParser()
+    op.add_option("--latency", action="store", type=float, default=0.0)
+    op.add_option("--requests", action="store", type=int, default=4000)
+    op.add_option("--concurrency", action="store", type=int, default=8)
+    op.add_option("--workers", action="store", type=int, default=8)
+    (opts, args) = op.parse_args()
+    logging.disable(logging.CRITICAL)
+    memcached = FakeMemcached(latency=opts.latency).start()
+    api.MainHTTPHandler.store = Store(port=memcached.port)
+    body = signed_request("online_score", {"phone": "79175002040", "email": "stupnikov@otus.ru"})
+    print("%12s %10s %10s %10s %10s %7s" % ("connections", "rps", "p50_ms", "p99_ms", "p99.9_ms", "errors"))
+    for keepalive in (False, True):
+        port = free_port()
+        api.MainHTTPHandler.keepalive_timeout = 5 if keepalive else 0
+        api.MainHTTPHandler.keepalive_requests = opts.requests
+        server = PooledHTTPServer(("localhost", port), quiet(api.MainHTTPHandler), opts.workers)
+        serve_in_thread(server)
+        r = summarize(run(port, body, opts.requests, opts.concurrency, keepalive))
+        print("%12s %10.1f %10.2f %10.2f %10.2f %7d" % ("keep-alive" if keepalive else "per request", r["rps"],
+                                                        r["p50_ms"], r["p99_ms"], r["p999_ms"], r["errors"]))
+        server.shutdown()
+        server.server_close()
+    api.MainHTTPHandler.store.close()
+    memcached.stop()
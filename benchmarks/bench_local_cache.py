@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Latency of hot-key scoring.get_score / Store.get calls with and without the
+in-process L1 cache in front of memcached.
+
+    python -m benchmarks.bench_local_cache --latency 0.0005 --keys 100 --calls 5000
+"""
+
+import logging
+import random
+import time
+from optparse import OptionParser
+
+import scoring
+from benchmarks.common import percentile
+from fake_memcached import FakeMemcached
+from store import Store
+
+
+def measure(func, calls):
+    latencies = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - started)
+    return percentile(latencies, 50) * 1000, percentile(latencies, 99) * 1000
+
+
+if __name__ == "__main__":
+    op = OptionParser()
+    op.add_option("--latency", action="store", type=float, default=0.0005)
+    op.add_option("--keys", action="store", type=int, default=100)
+    op.add_option("--calls", action="store", type=int, default=5000)
+    (opts, args) = op.parse_args()
+    logging.disable(logging.CRITICAL)
+    memcached = FakeMemcached(latency=opts.latency).start()
+    memcached.preload({"i:%s" % cid: '["books", "cars"]' for cid in range(opts.keys)})
+    profiles = [{"phone": "7917%07d" % i, "email": "user%s@otus.ru" % i} for i in range(opts.keys)]
+    print("%10s %10s %10s %10s %10s" % ("l1", "score_p50", "score_p99", "get_p50", "get_p99"))
+    for l1_entries in (0, opts.keys):
+        store = Store(port=memcached.port, l1_entries=l1_entries)
+        score = measure(lambda: scoring.get_score(store, **random.choice(profiles)), opts.calls)
+        get = measure(lambda: store.get("i:%s" % random.randrange(opts.keys)), opts.calls)
+        print("%10s %10.3f %10.3f %10.3f %10.3f" % (l1_entries or "off", score[0], score[1], get[0], get[1]))
+        if store.local_cache is not None:
+            print(store.local_cache.stats())
+        store.close()
+    memcached.stop()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Request latency with logging written by the request threads, queued to a
+writer thread, and queued with sampled success logs. Logs go to a temporary file.
+
+    python -m benchmarks.bench_logging --requests 4000 --concurrency 16 --workers 16
+"""
+
+import logging
+import os
+import tempfile
+from optparse import OptionParser
+
+import api
+import log_queue
+from benchmarks.common import free_port, quiet, run_load, serve_in_thread, signed_request, summarize
+from fake_memcached import FakeMemcached
+from server import PooledHTTPServer
+from store import Store
+
+MODES = (
+    ("sync", 0, 1.0),
+    ("queued", 10000, 1.0),
+    ("queued+10%", 10000, 0.1),
+)
+
+
+def bench(memcached, path, queue_size, sample_rate, opts):
+    listener = log_queue.setup_logging(path, queue_size, sample_rate)
+    port = free_port()
+    api.MainHTTPHandler.store = Store(port=memcached.port)
+    server = PooledHTTPServer(("localhost", port), quiet(api.MainHTTPHandler), opts.workers)
+    serve_in_thread(server)
+    bodies = [signed_request("clients_interests", {"client_ids": [1, 2]}),
+              signed_request("online_score", {"phone": "79175002040", "email": "a@b.ru"})] * (opts.requests // 2)
+    try:
+        return summarize(run_load(port, bodies, opts.concurrency)), log_queue.log_stats()
+    finally:
+        server.shutdown()
+        server.server_close()
+        api.MainHTTPHandler.store.close()
+        if listener is not None:
+            listener.stop()
+
+
+if __name__ == "__main__":
+    op = OptionParser()
+    op.add_option("--latency", action="store", type=float, default=0.0005)
+    op.add_option("--requests", action="store", type=int, default=4000)
+    op.add_option("--concurrency", action="store", type=int, default=16)
+    op.add_option("--workers", action="store", type=int, default=16)
+    (opts, args) = op.parse_args()
+    memcached = FakeMemcached(latency=opts.latency).start()
+    memcached.preload({"i:1": '["books", "cars"]', "i:2": '["music"]'})
+    print("%12s %10s %10s %10s %10s %7s %8s %8s" % ("logging", "rps", "p50_ms", "p99_ms", "p99.9_ms", "errors",
+                                                    "dropped", "sampled"))
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, queue_size, sample_rate in MODES:
+            r, stats = bench(memcached, os.path.join(tmp, name + ".log"), queue_size, sample_rate, opts)
+            print("%12s %10.1f %10.2f %10.2f %10.2f %7d %8s %8s" % (
+                name, r["rps"], r["p50_ms"], r["p99_ms"], r["p999_ms"], r["errors"], stats.get("dropped", "-"),
+                stats.get("sampled_out", "-")))
+        logging.shutdown()
+    memcached.stop()
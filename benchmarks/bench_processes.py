@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Throughput of api.py by number of pre-forked worker processes.
+
+Admin online_score requests never touch the store, so this measures the CPU
+bound part of a request (JSON, validation, SHA-512) that threads cannot scale.
+
+    python -m benchmarks.bench_processes --processes 1,2,4 --reuse-port
+"""
+
+import logging
+from optparse import OptionParser
+
+from benchmarks.common import (admin_request, free_port, run_load_processes, signed_request, start_api, stop_api,
+                               summarize)
+from fake_memcached import FakeMemcached
+
+ARGUMENTS = {"phone": "79175002040", "email": "stupnikov@otus.ru"}
+
+
+def bench(processes, memcached, opts):
+    port = free_port()
+    options = ["--processes", processes, "--store-port", memcached.port]
+    if opts.reuse_port:
+        options.append("--reuse-port")
+    api = start_api(port, *options)
+    if opts.admin:
+        bodies = [admin_request("online_score", ARGUMENTS)] * opts.requests
+    else:
+        bodies = [signed_request("online_score", ARGUMENTS)] * opts.requests
+    try:
+        return summarize(run_load_processes(port, bodies, opts.concurrency, opts.clients))
+    finally:
+        stop_api(api)
+
+
+if __name__ == "__main__":
+    op = OptionParser()
+    op.add_option("--requests", action="store", type=int, default=2000)
+    op.add_option("--concurrency", action="store", type=int, default=32)
+    op.add_option("--clients", action="store", type=int, default=4)
+    op.add_option("--processes", action="store", default="1,2,4")
+    op.add_option("--reuse-port", action="store_true", default=False)
+    op.add_option("--no-admin", action="store_false", dest="admin", default=True)
+    (opts, args) = op.parse_args()
+    logging.disable(logging.CRITICAL)
+    memcached = FakeMemcached().start()
+    print("%9s %10s %10s %10s %10s %7s" % ("processes", "rps", "p50_ms", "p95_ms", "p99_ms", "errors"))
+    for processes in [int(p) for p in opts.processes.split(",")]:
+        r = bench(processes, memcached, opts)
+        print("%9d %10.1f %10.2f %10.2f %10.2f %7d" % (processes, r["rps"], r["p50_ms"], r["p95_ms"], r["p99_ms"],
+                                                       r["errors"]))
+    memcached.stop()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Key distribution over memcached nodes and the share of keys remapped when a
+node is added or removed: ketama consistent hashing against ``hash % nodes``.
+``spread`` is the largest node share over the mean, 1.00 being perfectly even.
+
+    python -m benchmarks.bench_sharding --keys 100000 --nodes 2,4,8,16
+"""
+
+import hashlib
+from collections import Counter
+from optparse import OptionParser
+
+from sharding import HashRing
+
+
+class ModuloRing:
+    def __init__(self, nodes):
+        self.nodes = list(nodes)
+
+    def get_node(self, key):
+        return self.nodes[int.from_bytes(hashlib.md5(key.encode()).digest()[:4], 'little') % len(self.nodes)]
+
+
+def spread(ring, keys):
+    shares = Counter(ring.get_node(key) for key in keys)
+    return max(shares.values()) / (len(keys) / len(ring.nodes))
+
+
+def remapped(before, after, keys):
+    return sum(1 for key in keys if before.get_node(key) != after.get_node(key)) / len(keys)
+
+
+if __name__ == "__main__":
+    op = OptionParser()
+    op.add_option("--keys", action="store", type=int, default=100000)
+    op.add_option("--nodes", action="store", default="2,4,8,16")
+    op.add_option("--points", action="store", type=int, default=160)
+    (opts, args) = op.parse_args()
+    keys = ["i:%s" % i for i in range(opts.keys)]
+    print("%6s %8s %8s %10s %10s %10s %10s" % ("nodes", "hashing", "spread", "add_moved", "add_ideal", "del_moved",
+                                              "del_ideal"))
+    for count in (int(n) for n in opts.nodes.split(",")):
+        nodes = ["10.0.0.%s:11211" % i for i in range(count + 1)]
+        for name, make in (("ketama", lambda n: HashRing(n, opts.points)), ("modulo", ModuloRing)):
+            ring = make(nodes[:count])
+            print("%6d %8s %8.2f %10.3f %10.3f %10.3f %10.3f" % (
+                count, name, spread(ring, keys), remapped(ring, make(nodes), keys), 1 / (count + 1),
+                remapped(ring, make(nodes[1:count]), keys) if count > 1 else 1.0, 1 / count))
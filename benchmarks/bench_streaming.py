@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""clients_interests time to first byte, total time and peak memory allocated by
+the process (tracemalloc) for one request, by number of client ids: one JSON
+response against a chunked NDJSON stream.
+
+    python -m benchmarks.bench_streaming --latency 0.0005 --sizes 100,1000,10000 --batch 100
+"""
+
+import json
+import logging
+import socket
+import time
+import tracemalloc
+from optparse import OptionParser
+
+import api
+from benchmarks.common import free_port, quiet, serve_in_thread, signed_request
+from fake_memcached import FakeMemcached
+from server import PooledHTTPServer
+from store import Store
+
+
+def request(port, body, accept):
+    data = json.dumps(body).encode()
+    head = "POST /method HTTP/1.1\r\nHost: localhost\r\nAccept: %s\r\nContent-Length: %d\r\n\r\n" % (accept,
+                                                                                                 len(data))
+    tracemalloc.reset_peak()
+    started = time.perf_counter()
+    with socket.create_connection(("localhost", port)) as sock:
+        sock.sendall(head.encode() + data)
+        first = sock.recv(65536)
+        first_byte = time.perf_counter() - started
+        while sock.recv(65536):
+            pass
+    elapsed = time.perf_counter() - started
+    return first_byte * 1000, elapsed * 1000, tracemalloc.get_traced_memory()[1] / 1024
+
+
+if __name__ == "__main__":
+    op = OptionParser()
+    op.add_option("--latency", action="store", type=float, default=0.0005)
+    op.add_option("--sizes", action="store", default="100,1000,10000")
+    op.add_option("--batch", action="store", type=int, default=api.STREAM_BATCH_SIZE)
+    (opts, args) = op.parse_args()
+    logging.disable(logging.CRITICAL)
+    sizes = [int(s) for s in opts.sizes.split(",")]
+    memcached = FakeMemcached(latency=opts.latency).start()
+    memcached.preload({"i:%s" % cid: '["books", "cars", "music"]' for cid in range(max(sizes))})
+    api.MainHTTPHandler.store = Store(port=memcached.port)
+    api.MainHTTPHandler.stream_batch_size = opts.batch
+    port = free_port()
+    server = PooledHTTPServer(("localhost", port), quiet(api.MainHTTPHandler), 2)
+    serve_in_thread(server)
+    tracemalloc.start()
+    print("%7s %8s %10s %10s %10s" % ("ids", "format", "ttfb_ms", "total_ms", "peak_kb"))
+    for size in sizes:
+        body = signed_request("clients_interests", {"client_ids": list(range(size))})
+        for name, accept in (("json", "application/json"), ("ndjson", api.NDJSON_CONTENT_TYPE)):
+            # the first request of a kind also pays for the lazy imports and the connections
+            request(port, body, accept)
+            print("%7d %8s %10.2f %10.2f %10.1f" % ((size, name) + request(port, body, accept)))
+    tracemalloc.stop()
+    server.shutdown()
+    server.server_close()
+    api.MainHTTPHandler.store.close()
+    memcached.stop()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Bytes per client and decode time of stored interests: JSON against the packed
+vocabulary format, by interest list length. ``memcached`` is the memory the fake
+memcached accounts for one client, item overhead included.
+
+    python -m benchmarks.bench_value_codec --clients 10000 --sizes 2,10,50,200 --vocab 500
+"""
+
+import random
+import time
+from optparse import OptionParser
+
+from fake_memcached import FakeMemcached
+from value_codec import JSON_CODEC, InterestsCodec
+
+
+def generate(clients, size, vocabulary, seed=1):
+    rnd = random.Random(seed)
+    return [rnd.sample(vocabulary, size) for _ in range(clients)]
+
+
+def decode_us(codec, values, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for raw in values:
+            codec.decode(raw)
+    return (time.perf_counter() - started) / repeat / len(values) * 1e6
+
+
+def memcached_bytes(values):
+    memcached = FakeMemcached()
+    try:
+        memcached.preload({"i:%s" % cid: raw for cid, raw in enumerate(values)})
+        return memcached.stats()["bytes"] / len(values)
+    finally:
+        memcached.server_close()
+
+
+if __name__ == "__main__":
+    op = OptionParser()
+    op.add_option("--clients", action="store", type=int, default=10000)
+    op.add_option("--sizes", action="store", default="2,10,50,200")
+    op.add_option("--vocab", action="store", type=int, default=500)
+    op.add_option("--repeat", action="store", type=int, default=3)
+    (opts, args) = op.parse_args()
+    vocabulary = ["interest-%s" % i for i in range(opts.vocab)]
+    codec = InterestsCodec(vocabulary)
+    print("%6s %8s %12s %12s %12s" % ("size", "codec", "value_bytes", "memcached", "decode_us"))
+    for size in (int(s) for s in opts.sizes.split(",")):
+        interests = generate(opts.clients, min(size, opts.vocab), vocabulary)
+        for name, value_codec in (("json", JSON_CODEC), ("packed", codec)):
+            values = [value_codec.encode(value) for value in interests]
+            print("%6d %8s %12.1f %12.1f %12.2f" % (size, name, sum(map(len, values)) / len(values),
+                                                   memcached_bytes(values), decode_us(codec, values, opts.repeat)))
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Throughput of MainHTTPHandler by worker count against a slow memcached.
+
+    python -m benchmarks.bench_workers --latency 0.01 --requests 400
+"""
+
+import logging
+from optparse import OptionParser
+
+import api
+from benchmarks.common import free_port, quiet, run_load, serve_in_thread, signed_request, summarize
+from fake_memcached import FakeMemcached
+from server import ListeningHTTPServer, PooledHTTPServer
+from store import Store
+
+
+def bench(workers, memcached, opts):
+    port = free_port()
+    api.MainHTTPHandler.store = Store(port=memcached.port)
+    if workers:
+        server = PooledHTTPServer(("localhost", port), quiet(api.MainHTTPHandler), workers)
+    else:
+        server = ListeningHTTPServer(("localhost", port), quiet(api.MainHTTPHandler))
+    serve_in_thread(server)
+    body = signed_request("clients_interests", {"client_ids": [1, 2]})
+    try:
+        return summarize(run_load(port, [body] * opts.requests, opts.concurrency))
+    finally:
+        server.shutdown()
+        server.server_close()
+        api.MainHTTPHandler.store.close()
+
+
+if __name__ == "__main__":
+    op = OptionParser()
+    op.add_option("--latency", action="store", type=float, default=0.01)
+    op.add_option("--requests", action="store", type=int, default=400)
+    op.add_option("--concurrency", action="store", type=int, default=32)
+    op.add_option("--workers", action="store", default="0,1,2,4,8,16,32")
+    (opts, args) = op.parse_args()
+    logging.disable(logging.CRITICAL)
+    memcached = FakeMemcached(latency=opts.latency).start()
+    memcached.preload({"i:1": '["books", "cars"]', "i:2": '["music"]'})
+    print("%8s %10s %10s %10s %10s %7s" % ("workers", "rps", "p50_ms", "p95_ms", "p99_ms", "errors"))
+    for workers in [int(w) for w in opts.workers.split(",")]:
+        r = bench(workers, memcached, opts)
+        print("%8d %10.1f %10.2f %10.2f %10.2f %7d" % (workers, r["rps"], r["p50_ms"], r["p95_ms"], r["p99_ms"],
+                                                       r["errors"]))
+    memcached.stop()
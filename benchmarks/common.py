@@ -0,0 +1,149 @@
+import hashlib
+import http.client
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import api
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+
+def signed_request(method, arguments, account="horns&hoofs", login="h&f"):
+    token = hashlib.sha512((account + login + api.SALT).encode()).hexdigest()
+    return {"account": account, "login": login, "method": method, "token": token, "arguments": arguments}
+
+
+def admin_request(method, arguments, account="horns&hoofs"):
+    token = hashlib.sha512((datetime.now().strftime("%Y%m%d%H") + api.ADMIN_SALT).encode()).hexdigest()
+    return {"account": account, "login": api.ADMIN_LOGIN, "method": method, "token": token, "arguments": arguments}
+
+
+def post(port, body, path="/method", conn=None):
+    own = conn is None
+    if own:
+        conn = http.client.HTTPConnection("localhost", port, timeout=30)
+    try:
+        data = json.dumps(body).encode()
+        conn.request("POST", path, body=data, headers={"Content-Length": str(len(data))})
+        response = conn.getresponse()
+        data = response.read()
+        return response.status, json.loads(data) if data else None
+    finally:
+        if own:
+            conn.close()
+
+
+def quiet(handler_class):
+    """A subclass of handler_class that does not log every request."""
+    return type(handler_class.__name__, (handler_class,), {"log_message": lambda self, format, *args: None})
+
+
+def serve_in_thread(server):
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return thread
+
+
+def run_load(port, bodies, concurrency, path="/method"):
+    latencies = []
+    errors = 0
+
+    def one(body):
+        started = time.perf_counter()
+        try:
+            status, _ = post(port, body, path)
+        except OSError:
+            status = None
+        return status, time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for status, latency in executor.map(one, bodies):
+            latencies.append(latency)
+            if status != api.OK:
+                errors += 1
+    return {"elapsed": time.perf_counter() - started, "latencies": latencies, "errors": errors}
+
+
+def _run_load_chunk(args):
+    return run_load(*args)
+
+
+def run_load_processes(port, bodies, concurrency, processes, path="/method"):
+    chunks = [(port, bodies[i::processes], max(1, concurrency // processes), path) for i in range(processes)]
+    started = time.perf_counter()
+    with multiprocessing.Pool(processes) as pool:
+        results = pool.map(_run_load_chunk, chunks)
+    return {
+        "elapsed": time.perf_counter() - started,
+        "latencies": [latency for r in results for latency in r["latencies"]],
+        "errors": sum(r["errors"] for r in results),
+    }
+
+
+def wait_for_port(port, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("localhost", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError("Server on port %s did not start in %s seconds" % (port, timeout))
+
+
+def start_api(port, *options):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    process = subprocess.Popen([sys.executable, os.path.join(root, "api.py"), "--port", str(port)] +
+                               [str(o) for o in options],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, cwd=root)
+    try:
+        wait_for_port(port)
+    except RuntimeError:
+        process.kill()
+        raise
+    return process
+
+
+def stop_api(process):
+    if process.poll() is None:
+        process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(p / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def summarize(result):
+    latencies = result["latencies"]
+    return {
+        "requests": len(latencies),
+        "errors": result["errors"],
+        "rps": len(latencies) / result["elapsed"] if result["elapsed"] else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "p999_ms": percentile(latencies, 99.9) * 1000,
+    }
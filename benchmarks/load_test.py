@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Load test of api.py running as a separate process against a fake memcached.
+
+Sends a weighted mix of valid online_score, clients_interests, invalid and admin
+requests, either from a fixed number of concurrent clients (closed loop) or at a
+fixed arrival rate (open loop, where latency counts from the scheduled send time,
+so a stalled server is not hidden by clients that stop sending). Prints the
+throughput and latency percentiles, optionally saves them as JSON and compares them
+with a saved baseline, exiting with status 1 on a regression beyond the threshold.
+
+    python -m benchmarks.load_test --concurrency 32 --duration 10 --save base.json
+    python -m benchmarks.load_test --rate 500 --duration 10 --baseline base.json --threshold 10 \\
+        --api-options="--workers 32"
+"""
+
+import http.client
+import json
+import logging
+import random
+import shlex
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from optparse import OptionParser
+
+import api
+from benchmarks.common import admin_request, free_port, signed_request, start_api, stop_api, summarize
+from fake_memcached import FakeMemcached
+
+DEFAULT_MIX = "online_score=60,clients_interests=30,invalid=5,admin=5"
+CLIENTS = 1000
+# summary keys compared with the baseline and whether a higher value is better
+COMPARED = {"rps": True, "p50_ms": False, "p95_ms": False, "p99_ms": False, "p999_ms": False}
+
+
+def parse_mix(spec):
+    mix = {}
+    for part in spec.split(","):
+        kind, _, weight = part.partition("=")
+        if kind not in REQUESTS:
+            raise ValueError("Unknown request kind %r, expected one of %s" % (kind, ", ".join(REQUESTS)))
+        mix[kind] = float(weight or 1)
+    return mix
+
+
+def online_score(rnd):
+    cid = rnd.randrange(CLIENTS)
+    return signed_request("online_score", {"phone": "7917%07d" % cid, "email": "user%s@otus.ru" % cid}), api.OK
+
+
+def clients_interests(rnd):
+    return signed_request("clients_interests", {"client_ids": rnd.sample(range(CLIENTS), 3)}), api.OK
+
+
+def invalid(rnd):
+    return signed_request("online_score", {"phone": "8917"}), api.INVALID_REQUEST
+
+
+def admin(rnd):
+    return admin_request("online_score", {"first_name": "a", "last_name": "b"}), api.OK
+
+
+REQUESTS = {
+    "online_score": online_score,
+    "clients_interests": clients_interests,
+    "invalid": invalid,
+    "admin": admin,
+}
+
+
+def make_requests(mix, count, seed=0):
+    """Return ``count`` (kind, encoded body, expected status) tuples drawn from the mix."""
+    rnd = random.Random(seed)
+    kinds = rnd.choices(list(mix), weights=list(mix.values()), k=count)
+    requests = []
+    for kind in kinds:
+        body, expected = REQUESTS[kind](rnd)
+        requests.append((kind, json.dumps(body).encode(), expected))
+    return requests
+
+
+class LoadClient:
+    """Sends requests over one keep-alive connection per thread, reconnecting when needed."""
+
+    def __init__(self, port):
+        self.port = port
+        self._local = threading.local()
+
+    def send(self, body):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection("localhost", self.port, timeout=30)
+        try:
+            conn.request("POST", "/method", body=body, headers={"Content-Length": str(len(body))})
+            response = conn.getresponse()
+            response.read()
+            return response.status
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            self._local.conn = None
+            return None
+
+
+def run_closed(client, requests, concurrency, duration):
+    """Every one of ``concurrency`` clients sends its next request as soon as the last one is answered."""
+    results = []
+    position = iter(range(sys.maxsize))
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        own = []
+        while time.perf_counter() < deadline:
+            kind, body, expected = requests[next(position) % len(requests)]
+            started = time.perf_counter()
+            status = client.send(body)
+            own.append((kind, time.perf_counter() - started, status == expected))
+        results.extend(own)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - started
+
+
+def run_open(client, requests, rate, duration, max_in_flight):
+    """Requests are sent at ``rate`` per second whatever the response times are."""
+    results = []
+    count = int(rate * duration)
+
+    def one(scheduled, kind, body, expected):
+        status = client.send(body)
+        results.append((kind, time.perf_counter() - scheduled, status == expected))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        for i in range(count):
+            scheduled = started + i / rate
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(one, scheduled, *requests[i % len(requests)])
+    return results, time.perf_counter() - started
+
+
+def report(results, elapsed):
+    def summary(rows):
+        return summarize({"elapsed": elapsed, "latencies": [latency for _, latency, _ in rows],
+                          "errors": sum(1 for _, _, ok in rows if not ok)})
+
+    kinds = sorted({kind for kind, _, _ in results})
+    return {
+        "summary": summary(results),
+        "by_kind": {kind: summary([r for r in results if r[0] == kind]) for kind in kinds},
+    }
+
+
+def compare(baseline, current, threshold):
+    """Return messages for the summary values that got worse by more than ``threshold`` percent."""
+    regressions = []
+    for key, higher_is_better in COMPARED.items():
+        old, new = baseline["summary"].get(key), current["summary"].get(key)
+        if not old or new is None:
+            continue
+        change = (new - old) / old * 100
+        if -change > threshold if higher_is_better else change > threshold:
+            regressions.append("%s: %.2f -> %.2f (%+.1f%%)" % (key, old, new, change))
+    return regressions
+
+
+def print_report(result):
+    print("%18s %8s %7s %9s %9s %9s %9s %9s" % ("kind", "requests", "errors", "rps", "p50_ms", "p95_ms", "p99_ms",
+                                                "p99.9_ms"))
+    for kind, r in list(result["by_kind"].items()) + [("total", result["summary"])]:
+        print("%18s %8d %7d %9.1f %9.2f %9.2f %9.2f %9.2f" % (kind, r["requests"], r["errors"], r["rps"], r["p50_ms"],
+                                                              r["p95_ms"], r["p99_ms"], r["p999_ms"]))
+
+
+if __name__ == "__main__":
+    op = OptionParser()
+    op.add_option("--concurrency", action="store", type=int, default=16)
+    op.add_option("--rate", action="store", type=float, default=0,
+                  help="requests per second; when set, the load is open loop")
+    op.add_option("--max-in-flight", action="store", type=int, default=256)
+    op.add_option("--duration", action="store", type=float, default=10)
+    op.add_option("--warmup", action="store", type=float, default=1)
+    op.add_option("--mix", action="store", default=DEFAULT_MIX)
+    op.add_option("--seed", action="store", type=int, default=0)
+    op.add_option("--latency", action="store", type=float, default=0.0005,
+                  help="memcached latency per command, seconds")
+    op.add_option("--api-options", action="store", default="")
+    op.add_option("--save", action="store", default=None)
+    op.add_option("--baseline", action="store", default=None)
+    op.add_option("--threshold", action="store", type=float, default=10,
+                  help="percent a value may get worse than in the baseline")
+    (opts, args) = op.parse_args()
+    logging.disable(logging.CRITICAL)
+    mix = parse_mix(opts.mix)
+    requests = make_requests(mix, 10000, opts.seed)
+    memcached = FakeMemcached(latency=opts.latency).start()
+    memcached.preload({"i:%s" % cid: '["books", "cars"]' for cid in range(CLIENTS)})
+    port = free_port()
+    process = start_api(port, "--store-port", memcached.port, *shlex.split(opts.api_options))
+    client = LoadClient(port)
+    try:
+        if opts.rate:
+            run_open(client, requests, opts.rate, opts.warmup, opts.max_in_flight)
+            results, elapsed = run_open(client, requests, opts.rate, opts.duration, opts.max_in_flight)
+        else:
+            run_closed(client, requests, opts.concurrency, opts.warmup)
+            results, elapsed = run_closed(client, requests, opts.concurrency, opts.duration)
+    finally:
+        stop_api(process)
+        memcached.stop()
+    result = report(results, elapsed)
+    result["config"] = {"mode": "open" if opts.rate else "closed", "concurrency": opts.concurrency,
+                        "rate": opts.rate, "duration": opts.duration, "mix": mix, "latency": opts.latency,
+                        "api_options": opts.api_options}
+    result["timestamp"] = datetime.now().isoformat(timespec="seconds")
+    print_report(result)
+    if opts.save:
+        with open(opts.save, "w") as f:
+            json.dump(result, f, indent=2)
+    if opts.baseline:
+        with open(opts.baseline) as f:
+            regressions = compare(json.load(f), result, opts.threshold)
+        for message in regressions:
+            print("REGRESSION", message)
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Offline scoring of stored profiles without going through HTTP.
+
+Reads JSONL with one online_score ``arguments`` object (or a whole method request
+holding one, checked for its token like the API does) per line and writes one JSON result per line, in the format of the
+/batch items: ``{"response": {"score": ...}, "code": 200}`` or ``{"error": ..., "code": ...}``.
+Records are processed in chunks: every field is validated column-wise (cheap type
+checks first, the field validator once per distinct remaining value) and the scores
+of a chunk are computed with NumPy.
+
+    python bulk_scoring.py -i profiles.jsonl -o scores.jsonl --chunk-size 100000
+"""
+
+import json
+import sys
+import time
+from itertools import islice
+from optparse import OptionParser
+
+import numpy as np
+
+from api import (BAD_REQUEST, FORBIDDEN, GENDERS, INSUFFICIENT_DATA, INVALID_REQUEST, OK, CharField,
+                 EmailField, GenderField, MethodRequest, OnlineScoreRequest, PhoneField, check_auth, make_response)
+
+CHUNK_SIZE = 65536
+FIELDS = {field.label: field for field in OnlineScoreRequest._fields}
+
+
+def parse_record(line):
+    """Return the arguments of a JSONL record and whether it is an admin one, or an
+    error response for a broken or unauthorized one."""
+    try:
+        record = json.loads(line)
+    except ValueError as ex:
+        return None, False, make_response(f'Invalid JSON: {ex}', BAD_REQUEST)
+    if not isinstance(record, dict):
+        return None, False, make_response('Field arguments must be a dictionary.', INVALID_REQUEST)
+    if 'method' not in record or 'arguments' not in record:
+        return record, False, None
+    # a whole method request is validated and authorized as the API does it
+    try:
+        request = MethodRequest(**record)
+        if not check_auth(request):
+            return None, False, make_response(None, FORBIDDEN)
+        if request.method != 'online_score':
+            return None, False, make_response(f'Method {request.method} can not be scored offline.',
+                                              INVALID_REQUEST)
+        # unpacked like the API does, so a null is reported the same way
+        arguments = {**request.arguments}
+    except (TypeError, ValueError) as ex:
+        return None, False, make_response(str(ex), INVALID_REQUEST)
+    return arguments, request.is_admin, None
+
+
+def is_char(value):
+    return type(value) is str
+
+
+def is_email(value):
+    return type(value) is str and '@' in value
+
+
+def is_phone(value):
+    return type(value) is str and len(value) == 11 and value[0] == '7' or type(value) is int and 7e10 <= value < 8e10
+
+
+def is_gender(value):
+    return type(value) is int and value in GENDERS
+
+
+# cheap checks accepting only values the field validator accepts unchanged;
+# everything else goes through the validator itself
+FAST_CHECKS = {
+    CharField: is_char,
+    EmailField: is_email,
+    PhoneField: is_phone,
+    GenderField: is_gender,
+}
+
+
+def validate_column(field, values):
+    """Validate one field across a chunk.
+
+    Returns the masks of rows where the field is set and where its validated value
+    is truthy, and the validation error messages by row. Values that fail the fast
+    check are validated by the field, once per distinct value.
+    """
+    count = len(values)
+    present = np.fromiter((value is not None for value in values), dtype=bool, count=count)
+    truthy = np.fromiter(map(bool, values), dtype=bool, count=count)
+    check = FAST_CHECKS.get(type(field))
+    if check is None:
+        slow = np.flatnonzero(present)
+    else:
+        slow = np.flatnonzero(present & ~np.fromiter(map(check, values), dtype=bool, count=count))
+    errors = {}
+    outcomes = {}
+    for i in slow.tolist():
+        value = values[i]
+        try:
+            key = (type(value), value)
+            outcome = outcomes.get(key)
+        except TypeError:
+            key = outcome = None
+        if outcome is None:
+            try:
+                outcome = True, bool(field.validate(value))
+            except (TypeError, ValueError) as ex:
+                outcome = False, str(ex)
+            if key is not None:
+                outcomes[key] = outcome
+        valid, result = outcome
+        if valid:
+            truthy[i] = result
+        else:
+            present[i] = truthy[i] = False
+            errors[i] = result
+    return present, truthy, errors
+
+
+def score_chunk(records):
+    """Score a list of argument dicts, returning one result per record.
+
+    Equivalent to building an OnlineScoreRequest for every record and calling
+    scoring.compute_score with its fields.
+    """
+    present, truthy, failed = {}, {}, {}
+    for label, field in FIELDS.items():
+        present[label], truthy[label], errors = validate_column(field, [r.get(label) for r in records])
+        for i, error in errors.items():
+            # the first invalid field in declaration order is the one reported
+            failed.setdefault(i, error)
+    sufficient = (present['phone'] & present['email']
+                  | present['first_name'] & present['last_name']
+                  | present['gender'] & present['birthday'])
+    scores = (1.5 * truthy['phone'] + 1.5 * truthy['email']
+              + 1.5 * (truthy['birthday'] & truthy['gender'])
+              + 0.5 * (truthy['first_name'] & truthy['last_name']))
+    results = []
+    for i, score in enumerate(scores.tolist()):
+        if i in failed:
+            results.append(make_response(failed[i], INVALID_REQUEST))
+        elif not sufficient[i]:
+            results.append(make_response(INSUFFICIENT_DATA, INVALID_REQUEST))
+        else:
+            # compute_score returns an integer zero when nothing counts
+            results.append(make_response({'score': score or 0}, OK))
+    return results
+
+
+def score_lines(lines, chunk_size=CHUNK_SIZE):
+    """Yield one result per JSONL line, holding at most ``chunk_size`` records at a time."""
+    lines = iter(lines)
+    while True:
+        chunk = list(islice(lines, chunk_size))
+        if not chunk:
+            return
+        parsed = [parse_record(line) for line in chunk]
+        scored = iter(score_chunk([record for record, _, _ in parsed if record is not None]))
+        for record, is_admin, error in parsed:
+            if record is None:
+                yield error
+                continue
+            result = next(scored)
+            # admins get a fixed score once their arguments are valid
+            yield make_response({'score': 42}, OK) if is_admin and result['code'] == OK else result
+
+
+def score_file(src, dst, chunk_size=CHUNK_SIZE):
+    """Score every non-blank line of src into dst, returning the number of records."""
+    count = 0
+    encoded = {}
+    for result in score_lines((line for line in src if line.strip()), chunk_size):
+        if result['code'] == OK:
+            # a handful of distinct scores, encode each once
+            score = result['response']['score']
+            line = encoded.get((type(score), score))
+            if line is None:
+                line = encoded[type(score), score] = json.dumps(result) + '\n'
+        else:
+            line = json.dumps(result) + '\n'
+        dst.write(line)
+        count += 1
+    return count
+
+
+if __name__ == "__main__":
+    op = OptionParser()
+    op.add_option("-i", "--input", action="store", default=None)
+    op.add_option("-o", "--output", action="store", default=None)
+    op.add_option("--chunk-size", action="store", type=int, default=CHUNK_SIZE)
+    (opts, args) = op.parse_args()
+    src = open(opts.input) if opts.input else sys.stdin
+    dst = open(opts.output, 'w') if opts.output else sys.stdout
+    started = time.perf_counter()
+    with src, dst:
+        count = score_file(src, dst, opts.chunk_size)
+    elapsed = time.perf_counter() - started
+    print("%s records in %.2fs, %.0f records/s" % (count, elapsed, count / elapsed if elapsed else 0),
+          file=sys.stderr)
@@ -0,0 +1,112 @@
+import logging
+import threading
+import time
+
+from pymemcache.exceptions import MemcacheClientError
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """Stops calling a backend after ``failure_threshold`` failures in a row.
+
+    While open every call is rejected at once. After ``probe_interval`` seconds one
+    call is let through as a probe (half-open): its success closes the breaker,
+    its failure opens it for another interval.
+    """
+
+    def __init__(self, name, failure_threshold=5, probe_interval=5.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.probe_interval = probe_interval
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.rejected = 0
+
+    def allow(self):
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() >= self._opened_at + self.probe_interval:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self.rejected += 1
+            return False
+
+    def release(self):
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != CLOSED:
+                logging.info('Circuit breaker %s closed', self.name)
+            self.state = CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self.state == HALF_OPEN or self.state == CLOSED and self._failures >= self.failure_threshold:
+                if self.state == CLOSED:
+                    logging.warning('Circuit breaker %s opened after %s failures', self.name, self._failures)
+                    self.opened += 1
+                self.state = OPEN
+                self._opened_at = time.monotonic()
+
+    def call(self, func, *args, **kwargs):
+        if not self.allow():
+            raise CircuitOpenError(f'Circuit breaker {self.name} is open')
+        try:
+            res = func(*args, **kwargs)
+        except MemcacheClientError:
+            # the request was wrong, not the backend
+            self.release()
+            raise
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success()
+        return res
+
+    def stats(self):
+        with self._lock:
+            return {'state': self.state, 'failures': self._failures, 'opened': self.opened, 'rejected': self.rejected}
+
+
+class CircuitBreakerClient:
+    def __init__(self, client, breaker):
+        self._client = client
+        self.breaker = breaker
+
+    def get(self, *args, **kwargs):
+        return self.breaker.call(self._client.get, *args, **kwargs)
+
+    def set(self, *args, **kwargs):
+        return self.breaker.call(self._client.set, *args, **kwargs)
+
+    def get_many(self, *args, **kwargs):
+        return self.breaker.call(self._client.get_many, *args, **kwargs)
+
+    def set_many(self, *args, **kwargs):
+        return self.breaker.call(self._client.set_many, *args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        return self.breaker.call(self._client.delete, *args, **kwargs)
+
+    def close(self):
+        self._client.close()
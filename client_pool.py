@@ -0,0 +1,137 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class PoolTimeoutError(Exception):
+    pass
+
+
+class ClientPool:
+    """Pool of memcached clients shared between threads.
+
+    Keeps at least ``min_size`` and at most ``max_size`` clients. A client idle for
+    longer than ``idle_timeout`` seconds is closed (down to ``min_size``), a thread
+    that finds every client busy waits up to ``checkout_timeout`` seconds for one and
+    then gets PoolTimeoutError. A client that raised an error is closed instead of
+    being returned to the pool, so a broken connection is never reused.
+    """
+
+    def __init__(self, factory, min_size=0, max_size=10, idle_timeout=60, checkout_timeout=1.0):
+        self._factory = factory
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size, 1)
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+        self._idle = deque()
+        self._size = 0
+        self._in_use = 0
+        self._cond = threading.Condition()
+        self.created = 0
+        self.destroyed = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.timeouts = 0
+        with self._cond:
+            for _ in range(min_size):
+                self._idle.append((self._create(), time.monotonic()))
+
+    def _create(self):
+        client = self._factory()
+        self._size += 1
+        self.created += 1
+        return client
+
+    def _destroy(self, client):
+        self._size -= 1
+        self.destroyed += 1
+        try:
+            client.close()
+        except Exception:
+            pass
+
+    def _evict_idle(self, now):
+        while self._idle and self._size > self.min_size and self._idle[0][1] + self.idle_timeout <= now:
+            self._destroy(self._idle.popleft()[0])
+
+    def checkout(self):
+        deadline = time.monotonic() + self.checkout_timeout
+        with self._cond:
+            waited = False
+            while True:
+                now = time.monotonic()
+                self._evict_idle(now)
+                if self._idle:
+                    client = self._idle.pop()[0]
+                    break
+                if self._size < self.max_size:
+                    client = self._create()
+                    break
+                if not waited:
+                    self.waits += 1
+                    waited = True
+                if now >= deadline:
+                    self.timeouts += 1
+                    raise PoolTimeoutError(f'No free memcached client in {self.checkout_timeout} seconds')
+                self._cond.wait(deadline - now)
+            self._in_use += 1
+            self.checkouts += 1
+            return client
+
+    def checkin(self, client, discard=False):
+        with self._cond:
+            self._in_use -= 1
+            if discard:
+                self._destroy(client)
+            else:
+                self._idle.append((client, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def client(self):
+        client = self.checkout()
+        try:
+            yield client
+        except BaseException:
+            self.checkin(client, discard=True)
+            raise
+        self.checkin(client)
+
+    def get(self, *args, **kwargs):
+        with self.client() as client:
+            return client.get(*args, **kwargs)
+
+    def set(self, *args, **kwargs):
+        with self.client() as client:
+            return client.set(*args, **kwargs)
+
+    def get_many(self, *args, **kwargs):
+        with self.client() as client:
+            return client.get_many(*args, **kwargs)
+
+    def set_many(self, *args, **kwargs):
+        with self.client() as client:
+            return client.set_many(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with self.client() as client:
+            return client.delete(*args, **kwargs)
+
+    def close(self):
+        with self._cond:
+            while self._idle:
+                self._destroy(self._idle.popleft()[0])
+
+    def stats(self):
+        with self._cond:
+            return {
+                'size': self._size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'created': self.created,
+                'destroyed': self.destroyed,
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'timeouts': self.timeouts,
+            }
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Rewrites stored client interests from JSON to the packed vocabulary format (or back).
+
+First append the interests missing from the vocabulary, deploy the vocabulary file
+to the API servers and restart them with ``--interests-vocab``, then convert: the
+servers read both formats, so values can be converted while they are serving.
+
+    python convert_interests.py --vocab interests.txt --ids 1-1000000 --extend-vocab
+    python convert_interests.py --vocab interests.txt --ids 1-1000000
+    python convert_interests.py --vocab interests.txt --ids-file ids.txt --to-json
+"""
+
+import logging
+import time
+from collections import Counter
+from itertools import islice
+from optparse import OptionParser
+
+from scoring import get_interests_key
+from store import Store
+from value_codec import JSON_CODEC, InterestsCodec, is_packed, load_vocabulary, save_vocabulary
+
+BATCH_SIZE = 100
+
+
+def parse_ids(spec):
+    """Client ids from ``"1-100,200"`` style ranges (inclusive)."""
+    for part in spec.split(','):
+        first, _, last = part.strip().partition('-')
+        yield from range(int(first), int(last or first) + 1)
+
+
+def batches(items, size):
+    items = iter(items)
+    while True:
+        batch = list(islice(items, size))
+        if not batch:
+            return
+        yield batch
+
+
+def read_interests(store, codec, cids, batch_size=BATCH_SIZE):
+    """Yields (key, raw, interests) for every stored client in cids."""
+    for batch in batches(cids, batch_size):
+        keys = [get_interests_key(cid) for cid in batch]
+        found = store.get_many(keys)
+        for key in keys:
+            raw = found.get(key)
+            yield key, raw, codec.decode(raw) if raw else None
+
+
+def scan_vocabulary(store, codec, cids, batch_size=BATCH_SIZE):
+    """Interests missing from the vocabulary of codec, the most frequent first."""
+    known = set(codec.vocabulary)
+    missing = Counter()
+    for _, _, interests in read_interests(store, codec, cids, batch_size):
+        missing.update(item for item in interests or () if isinstance(item, str) and item not in known)
+    return [item for item, _ in missing.most_common()]
+
+
+def convert(store, codec, cids, target=None, batch_size=BATCH_SIZE, dry_run=False):
+    """Rewrites the interests of cids in the format of target (codec by default).
+
+    Values are read with codec, so both formats are accepted. Returns the number
+    of values rewritten, left as JSON, left unchanged and missing, and the bytes
+    taken before and after.
+    """
+    target = target or codec
+    stats = Counter(converted=0, json=0, unchanged=0, missing=0, bytes_before=0, bytes_after=0)
+    for key, raw, interests in read_interests(store, codec, cids, batch_size):
+        if raw is None:
+            stats['missing'] += 1
+            continue
+        encoded = target.encode(interests)
+        stats['bytes_before'] += len(raw)
+        if encoded == raw or not is_packed(raw) and not is_packed(encoded):
+            stats['unchanged'] += 1
+            stats['bytes_after'] += len(raw)
+            continue
+        stats['converted' if is_packed(encoded) or target is JSON_CODEC else 'json'] += 1
+        stats['bytes_after'] += len(encoded)
+        if not dry_run:
+            store.set(key, encoded)
+    return dict(stats)
+
+
+if __name__ == "__main__":
+    op = OptionParser()
+    op.add_option("--store-host", action="store", default="localhost")
+    op.add_option("--store-port", action="store", type=int, default=11211)
+    op.add_option("--vocab", action="store", default=None)
+    op.add_option("--ids", action="store", default=None)
+    op.add_option("--ids-file", action="store", default=None)
+    op.add_option("--batch-size", action="store", type=int, default=BATCH_SIZE)
+    op.add_option("--extend-vocab", action="store_true", default=False)
+    op.add_option("--to-json", action="store_true", default=False)
+    op.add_option("--dry-run", action="store_true", default=False)
+    (opts, args) = op.parse_args()
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname).1s %(message)s',
+                        datefmt='%Y.%m.%d %H:%M:%S')
+    if not opts.vocab or not (opts.ids or opts.ids_file):
+        op.error("--vocab and --ids or --ids-file are required")
+    try:
+        vocabulary = load_vocabulary(opts.vocab)
+    except FileNotFoundError:
+        if not opts.extend_vocab:
+            raise
+        vocabulary = []
+    codec = InterestsCodec(vocabulary)
+    if opts.ids_file:
+        with open(opts.ids_file) as f:
+            cids = [int(line) for line in f if line.strip()]
+    else:
+        cids = parse_ids(opts.ids)
+    # pooled connections wait for the write replies, so a failed write is logged
+    store = Store(opts.store_host, opts.store_port, pool_size=1)
+    started = time.perf_counter()
+    try:
+        if opts.extend_vocab:
+            added = scan_vocabulary(store, codec, cids, opts.batch_size)
+            if added and not opts.dry_run:
+                save_vocabulary(opts.vocab, vocabulary + added)
+            logging.info("%s interests added to %s entries", len(added), len(vocabulary))
+        else:
+            stats = convert(store, codec, cids, JSON_CODEC if opts.to_json else codec, opts.batch_size,
+                            opts.dry_run)
+            logging.info("%s", ", ".join("%s %s" % (name, value) for name, value in stats.items()))
+    finally:
+        store.close()
+    logging.info("Done in %.2fs", time.perf_counter() - started)
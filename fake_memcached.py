@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Minimal memcached text-protocol server for tests and benchmarks.
+
+It keeps everything in an LRU dict, optionally capped in size, and can misbehave
+the way a real memcached behind a real network does: delay commands by a fixed or
+random latency, drop replies and reset connections. That is enough to reproduce a
+slow or flaky memcached without running the real one.
+
+    python fake_memcached.py --port 11211 --latency exp:0.002 --drop 0.001 --max-bytes 64m
+"""
+
+import logging
+import random
+import socket
+import socketserver
+import struct
+import threading
+import time
+from collections import OrderedDict
+from optparse import OptionParser
+
+MAX_RELATIVE_EXPIRE = 60 * 60 * 24 * 30
+# memcached's per-item overhead, roughly
+ITEM_OVERHEAD = 48
+SIZE_SUFFIXES = {'k': 1 << 10, 'm': 1 << 20, 'g': 1 << 30}
+
+
+def parse_latency(spec, rnd=random):
+    """Make a latency from a spec: seconds, or ``kind:params`` for a random one.
+
+    ``uniform:low,high``, ``normal:mean,stddev``, ``exp:mean`` and
+    ``pareto:minimum,alpha`` (a heavy tail) return a function giving seconds.
+    """
+    kind, _, params = str(spec).partition(':')
+    if not params:
+        return float(kind)
+    args = [float(p) for p in params.split(',')]
+    if kind == 'uniform':
+        low, high = args
+        return lambda: rnd.uniform(low, high)
+    if kind == 'normal':
+        mean, stddev = args
+        return lambda: max(0.0, rnd.gauss(mean, stddev))
+    if kind == 'exp':
+        mean, = args
+        return lambda: rnd.expovariate(1 / mean)
+    if kind == 'pareto':
+        minimum, alpha = args
+        return lambda: minimum * rnd.paretovariate(alpha)
+    raise ValueError(f'Unknown latency distribution {kind}')
+
+
+def parse_size(spec):
+    spec = str(spec).lower()
+    if spec and spec[-1] in SIZE_SUFFIXES:
+        return int(float(spec[:-1]) * SIZE_SUFFIXES[spec[-1]])
+    return int(spec)
+
+
+class MemcachedHandler(socketserver.StreamRequestHandler):
+    dropping = False
+
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            parts = line.split()
+            if not parts:
+                continue
+            command = parts[0].lower().decode()
+            handler = getattr(self, 'cmd_' + command, None)
+            if handler is None:
+                self.wfile.write(b'ERROR\r\n')
+                continue
+            delay = self.server.command_delay(command)
+            if delay:
+                time.sleep(delay)
+            if self.server.chance(self.server.reset_rate):
+                self.server.count('resets')
+                self.reset()
+                return
+            self.dropping = self.server.chance(self.server.drop_rate)
+            if self.dropping:
+                self.server.count('drops')
+            if handler(parts[1:]) is False:
+                return
+
+    def reset(self):
+        # close with a zero linger time, so the client gets RST instead of FIN
+        self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+        self.connection.close()
+
+    def write(self, data):
+        if not self.dropping:
+            self.wfile.write(data)
+
+    def reply(self, data, noreply=False):
+        if not noreply:
+            self.write(data)
+
+    def cmd_get(self, keys, with_cas=False):
+        out = []
+        found = self.server.get_many(keys)
+        self.server.count('get_hits', len(found))
+        self.server.count('get_misses', len(keys) - len(found))
+        for key, (flags, value, cas) in found.items():
+            header = b'VALUE %s %d %d' % (key, flags, len(value))
+            if with_cas:
+                header += b' %d' % cas
+            out.append(header + b'\r\n' + value + b'\r\n')
+        out.append(b'END\r\n')
+        self.write(b''.join(out))
+
+    def cmd_gets(self, keys):
+        self.cmd_get(keys, with_cas=True)
+
+    def _read_store_command(self, args):
+        key, flags, exptime, size = args[0], int(args[1]), int(args[2]), int(args[3])
+        noreply = args[-1] == b'noreply'
+        value = self.rfile.read(size + 2)[:-2]
+        return key, flags, exptime, value, noreply
+
+    def cmd_set(self, args):
+        key, flags, exptime, value, noreply = self._read_store_command(args)
+        self.server.store(key, flags, exptime, value)
+        self.reply(b'STORED\r\n', noreply)
+
+    def cmd_add(self, args):
+        key, flags, exptime, value, noreply = self._read_store_command(args)
+        if self.server.get_many([key]):
+            self.reply(b'NOT_STORED\r\n', noreply)
+        else:
+            self.server.store(key, flags, exptime, value)
+            self.reply(b'STORED\r\n', noreply)
+
+    def cmd_replace(self, args):
+        key, flags, exptime, value, noreply = self._read_store_command(args)
+        if self.server.get_many([key]):
+            self.server.store(key, flags, exptime, value)
+            self.reply(b'STORED\r\n', noreply)
+        else:
+            self.reply(b'NOT_STORED\r\n', noreply)
+
+    def cmd_delete(self, args):
+        noreply = args[-1] == b'noreply'
+        found = self.server.delete(args[0])
+        self.reply(b'DELETED\r\n' if found else b'NOT_FOUND\r\n', noreply)
+
+    def cmd_flush_all(self, args):
+        self.server.flush()
+        self.reply(b'OK\r\n', bool(args) and args[-1] == b'noreply')
+
+    def cmd_version(self, args):
+        self.write(b'VERSION fake-1.0\r\n')
+
+    def cmd_stats(self, args):
+        self.write(b''.join(b'STAT %s %d\r\n' % (name.encode(), value)
+                            for name, value in self.server.stats().items()) + b'END\r\n')
+
+    def cmd_quit(self, args):
+        return False
+
+
+class FakeMemcached(socketserver.ThreadingTCPServer):
+    """The server. ``latency`` is seconds or a function returning them, and
+    ``command_latency`` overrides it per command (e.g. ``{'get': parse_latency('exp:0.001')}``).
+    ``drop_rate`` is the share of commands executed without sending a reply and
+    ``reset_rate`` the share of commands answered with a connection reset instead.
+    With ``max_bytes`` set, least recently used items are evicted to stay under it.
+    """
+
+    allow_reuse_address = True
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, host='localhost', port=0, latency=0.0, command_latency=None, drop_rate=0.0, reset_rate=0.0,
+                 max_bytes=0, seed=None):
+        super().__init__((host, port), MemcachedHandler)
+        self.latency = latency
+        self.command_latency = command_latency or {}
+        self.drop_rate = drop_rate
+        self.reset_rate = reset_rate
+        self.max_bytes = max_bytes
+        self._random = random.Random(seed)
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._cas = 0
+        self._counters = dict.fromkeys(('get_hits', 'get_misses', 'evictions', 'drops', 'resets'), 0)
+        self._thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def command_delay(self, command):
+        latency = self.command_latency.get(command, self.latency)
+        return latency() if callable(latency) else latency
+
+    def chance(self, rate):
+        return rate > 0 and self._random.random() < rate
+
+    def count(self, name, value=1):
+        with self._lock:
+            self._counters[name] += value
+
+    def _expire_at(self, exptime):
+        if exptime == 0:
+            return None
+        if exptime < 0:
+            return 0
+        if exptime <= MAX_RELATIVE_EXPIRE:
+            return time.time() + exptime
+        return exptime
+
+    def _remove(self, key):
+        item = self._data.pop(key, None)
+        if item is not None:
+            self._bytes -= len(key) + len(item[1]) + ITEM_OVERHEAD
+        return item
+
+    def store(self, key, flags, exptime, value):
+        with self._lock:
+            self._cas += 1
+            self._remove(key)
+            self._data[key] = (flags, value, self._cas, self._expire_at(exptime))
+            self._bytes += len(key) + len(value) + ITEM_OVERHEAD
+            while self.max_bytes and self._bytes > self.max_bytes and self._data:
+                self._remove(next(iter(self._data)))
+                self._counters['evictions'] += 1
+
+    def get_many(self, keys):
+        now = time.time()
+        found = {}
+        with self._lock:
+            for key in keys:
+                item = self._data.get(key)
+                if item is None:
+                    continue
+                flags, value, cas, expire_at = item
+                if expire_at is not None and expire_at <= now:
+                    self._remove(key)
+                    continue
+                self._data.move_to_end(key)
+                found[key] = (flags, value, cas)
+        return found
+
+    def delete(self, key):
+        with self._lock:
+            return self._remove(key) is not None
+
+    def flush(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {'curr_items': len(self._data), 'bytes': self._bytes, 'limit_maxbytes': self.max_bytes,
+                    **self._counters}
+
+    def preload(self, items, exptime=0):
+        for key, value in items.items():
+            if isinstance(value, str):
+                value = value.encode()
+            self.store(key.encode(), 0, exptime, value)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+
+if __name__ == "__main__":
+    op = OptionParser()
+    op.add_option("--host", action="store", default="localhost")
+    op.add_option("-p", "--port", action="store", type=int, default=11211)
+    op.add_option("--latency", action="store", default="0",
+                  help="seconds, or uniform:low,high / normal:mean,stddev / exp:mean / pareto:minimum,alpha")
+    op.add_option("--get-latency", action="store", default=None, help="latency of get/gets only")
+    op.add_option("--set-latency", action="store", default=None, help="latency of set/add/replace only")
+    op.add_option("--drop", action="store", type=float, default=0.0)
+    op.add_option("--reset", action="store", type=float, default=0.0)
+    op.add_option("--max-bytes", action="store", default="0", help="memory cap, e.g. 64m")
+    op.add_option("--seed", action="store", type=int, default=None)
+    (opts, args) = op.parse_args()
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname).1s %(message)s',
+                        datefmt='%Y.%m.%d %H:%M:%S')
+    rnd = random.Random(opts.seed)
+    command_latency = {}
+    for commands, spec in ((('get', 'gets'), opts.get_latency), (('set', 'add', 'replace'), opts.set_latency)):
+        if spec is not None:
+            command_latency.update(dict.fromkeys(commands, parse_latency(spec, rnd)))
+    server = FakeMemcached(opts.host, opts.port, parse_latency(opts.latency, rnd), command_latency,
+                           opts.drop, opts.reset, parse_size(opts.max_bytes), opts.seed)
+    logging.info("Fake memcached listening at %s:%s", opts.host, server.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
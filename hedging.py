@@ -0,0 +1,153 @@
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import cycle
+
+HEDGE_WORKERS = 32
+
+
+class LatencyTracker:
+    """Percentile of the last ``window`` latencies, recomputed every ``refresh`` samples."""
+
+    def __init__(self, percentile=95, window=1000, refresh=100):
+        self.percentile = percentile
+        self.refresh = refresh
+        self._samples = deque(maxlen=window)
+        self._since_refresh = 0
+        self.value = None
+
+    def add(self, latency):
+        self._samples.append(latency)
+        self._since_refresh += 1
+        if self._since_refresh >= self.refresh:
+            self._since_refresh = 0
+            ordered = sorted(self._samples)
+            self.value = ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))]
+
+
+class HedgeBudget:
+    """Token bucket of hedged reads: every read adds ``ratio`` of a token, up to ``burst``."""
+
+    def __init__(self, ratio=0.05, burst=10):
+        self.ratio = ratio
+        self.burst = burst
+        self._tokens = burst
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + self.ratio)
+
+    def withdraw(self):
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class HedgedClient:
+    """Reads from a primary node and hedges slow reads to replicas.
+
+    A read that the primary has not answered (or has failed) within the
+    ``percentile`` of its recent latencies, kept between ``min_delay`` and
+    ``max_delay`` seconds, is also sent to the next replica, and the first
+    successful answer wins. HedgeBudget caps the hedged reads at ``budget`` of
+    all reads. Writes go to the primary and every replica in parallel; only a
+    failed primary write raises.
+
+    Reads and replica writes run on a pool of ``workers`` threads, which should be
+    enough for every thread using the client to have its read and a hedge running
+    at once. Latencies are measured from the submit, so a read waiting for a pool
+    thread counts as slow, the same as in the hedge delay.
+    """
+
+    def __init__(self, primary, replicas, percentile=95, min_delay=0.002, max_delay=0.05, budget=0.05,
+                 workers=HEDGE_WORKERS):
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.latencies = LatencyTracker(percentile)
+        self.budget = HedgeBudget(budget)
+        self._replica = cycle(self.replicas)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='hedge')
+        self._lock = threading.Lock()
+        self.reads = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.over_budget = 0
+
+    def delay(self):
+        latency = self.latencies.value
+        return self.max_delay if latency is None else min(max(latency, self.min_delay), self.max_delay)
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _timed(self, func, arg, submitted):
+        res = func(arg)
+        self.latencies.add(time.monotonic() - submitted)
+        return res
+
+    def _read(self, method, arg):
+        self._count('reads')
+        self.budget.deposit()
+        primary = self._executor.submit(self._timed, getattr(self.primary, method), arg, time.monotonic())
+        done, _ = wait([primary], timeout=self.delay())
+        if done and primary.exception() is None:
+            return primary.result()
+        if not self.budget.withdraw():
+            self._count('over_budget')
+            return primary.result()
+        self._count('hedged')
+        with self._lock:
+            replica = next(self._replica)
+        hedge = self._executor.submit(getattr(replica, method), arg)
+        pending, error = {primary, hedge}, None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        self._count('hedge_wins')
+                    return future.result()
+                error = error or future.exception()
+        raise error
+
+    def _write(self, method, *args, **kwargs):
+        futures = [self._executor.submit(getattr(replica, method), *args, **kwargs) for replica in self.replicas]
+        try:
+            return getattr(self.primary, method)(*args, **kwargs)
+        finally:
+            for future in futures:
+                if future.exception() is not None:
+                    logging.error('Error while writing to a replica: %s', future.exception())
+
+    def get(self, key):
+        return self._read('get', key)
+
+    def get_many(self, keys):
+        return self._read('get_many', keys)
+
+    def set(self, *args, **kwargs):
+        return self._write('set', *args, **kwargs)
+
+    def set_many(self, *args, **kwargs):
+        return self._write('set_many', *args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        return self._write('delete', *args, **kwargs)
+
+    def stats(self):
+        with self._lock:
+            return {'reads': self.reads, 'hedged': self.hedged, 'hedge_wins': self.hedge_wins,
+                    'over_budget': self.over_budget, 'delay_ms': self.delay() * 1000}
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        for client in [self.primary] + self.replicas:
+            client.close()
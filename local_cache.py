@@ -0,0 +1,98 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+def approximate_size(key, value):
+    if isinstance(value, (bytes, str)):
+        return len(key) + len(value)
+    return len(key) + sys.getsizeof(value)
+
+
+class LocalCache:
+    """Thread-safe in-process LRU cache with per-key expiration.
+
+    Entries are evicted in least recently used order once there are more than
+    ``max_entries`` of them or their approximate size exceeds ``max_bytes``
+    (zero disables the limit). Expired entries are dropped when they are read.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=0, ttl=60):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            value, expire_at, size = item
+            if expire_at <= time.monotonic():
+                del self._data[key]
+                self._bytes -= size
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def get_many(self, keys):
+        found = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                found[key] = value
+        return found
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if not ttl else min(ttl, self.ttl)
+        size = approximate_size(key, value)
+        if self.max_bytes and size > self.max_bytes:
+            self.delete(key)
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._data[key] = (value, time.monotonic() + ttl, size)
+            self._bytes += size
+            while (self.max_entries and len(self._data) > self.max_entries
+                   or self.max_bytes and self._bytes > self.max_bytes):
+                _, (_, _, evicted_size) = self._data.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            item = self._data.pop(key, None)
+            if item is not None:
+                self._bytes -= item[2]
+
+    def keys(self):
+        with self._lock:
+            return list(self._data)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._data),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
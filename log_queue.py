@@ -0,0 +1,100 @@
+"""Logging configuration, optionally taking the writing off the request path.
+
+With a queue, request threads only put records on a bounded queue; a background
+thread formats and writes them, and records that find the queue full are dropped
+and counted. Records of successful requests below WARNING can be sampled.
+"""
+
+import logging
+import logging.handlers
+import queue
+import random
+import threading
+
+from metrics import REGISTRY
+
+LOG_FORMAT = '[%(asctime)s] %(levelname).1s %(message)s'
+LOG_DATE_FORMAT = '%Y.%m.%d %H:%M:%S'
+
+
+class SuccessSampler(logging.Filter):
+    """Passes a ``rate`` share of the records below WARNING and every other record.
+
+    A record logged with a ``response_code`` extra other than 200, the summary of a
+    failed request, is always passed.
+    """
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+        self.sampled_out = 0
+
+    def filter(self, record):
+        if (record.levelno >= logging.WARNING or getattr(record, 'response_code', 200) != 200
+                or random.random() < self.rate):
+            return True
+        self.sampled_out += 1
+        return False
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Puts records on a bounded queue unformatted, dropping them when it is full.
+
+    The message is formatted by the writer thread, so the arguments of a log call
+    must not be changed after the call.
+    """
+
+    def __init__(self, queue):
+        super().__init__(queue)
+        self.dropped = 0
+        self._drop_lock = threading.Lock()
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._drop_lock:
+                self.dropped += 1
+
+
+_front = None
+
+
+def setup_logging(filename=None, queue_size=0, sample_rate=1.0, level=logging.INFO):
+    """Replace the handlers of the root logger, returning the QueueListener writing
+    the records when ``queue_size`` is set (stop it to flush the queue on exit)."""
+    global _front
+    handler = logging.FileHandler(filename) if filename else logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(LOG_FORMAT, LOG_DATE_FORMAT))
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    root.setLevel(level)
+    listener = None
+    front = handler
+    if queue_size > 0:
+        front = DroppingQueueHandler(queue.Queue(queue_size))
+        listener = logging.handlers.QueueListener(front.queue, handler)
+        listener.start()
+    if sample_rate < 1:
+        front.addFilter(SuccessSampler(sample_rate))
+    root.addHandler(front)
+    _front = front
+    return listener
+
+
+def log_stats():
+    stats = {}
+    if isinstance(_front, DroppingQueueHandler):
+        stats.update(queued=_front.queue.qsize(), dropped=_front.dropped)
+    for sampler in getattr(_front, 'filters', ()):
+        if isinstance(sampler, SuccessSampler):
+            stats['sampled_out'] = sampler.sampled_out
+    return stats
+
+
+REGISTRY.gauge('log_records', 'Log records queued, dropped on a full queue and sampled out.', ('stat',),
+               lambda: {(name,): value for name, value in log_stats().items()})
@@ -0,0 +1,92 @@
+"""Request phase timings and sampled profiling."""
+
+import cProfile
+import itertools
+import logging
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+
+def mark(ctx, phase, started):
+    """Add the time since ``started`` to ``phase`` in ``ctx['timings']``, returning the current time.
+
+    Timings are kept in milliseconds; a phase entered several times (e.g. auth in a
+    batch) accumulates.
+    """
+    now = time.perf_counter()
+    timings = ctx.setdefault('timings', {})
+    timings[phase] = timings.get(phase, 0.0) + (now - started) * 1000
+    return now
+
+
+def format_timings(timings):
+    return ' '.join('%s=%.2fms' % item for item in timings.items())
+
+
+class SampledProfiler:
+    """Profiles one request in ``every`` with cProfile.
+
+    The samples are added up into one pstats.Stats, written to ``path`` (where
+    ``{pid}`` is replaced by the process id) at most every ``dump_interval``
+    seconds and on close. The file can be read with ``python -m pstats``. Only one
+    request is profiled at a time: a sampled request that overlaps another one is
+    not profiled, since Python 3.12 allows a single active profiler per process
+    (which then also sees the other threads).
+    """
+
+    def __init__(self, every=1000, path='profile-{pid}.prof', dump_interval=60.0):
+        self.every = every
+        self.path = path
+        self.dump_interval = dump_interval
+        self.samples = 0
+        self._counter = itertools.count(1)
+        self._stats = None
+        self._lock = threading.Lock()
+        self._active = threading.Lock()
+        self._dumped_at = time.monotonic()
+
+    def sample(self):
+        """Return a context manager profiling the code it wraps, for one call in ``every``."""
+        if next(self._counter) % self.every or not self._active.acquire(blocking=False):
+            return nullcontext()
+        return self._profile()
+
+    @contextmanager
+    def _profile(self):
+        try:
+            profile = cProfile.Profile()
+            profile.enable()
+            try:
+                yield
+            finally:
+                profile.disable()
+                self._add(profile)
+        finally:
+            self._active.release()
+
+    def _add(self, profile):
+        with self._lock:
+            if self._stats is None:
+                self._stats = pstats.Stats(profile)
+            else:
+                self._stats.add(profile)
+            self.samples += 1
+            if time.monotonic() - self._dumped_at >= self.dump_interval:
+                self._dump()
+
+    def _dump(self):
+        self._dumped_at = time.monotonic()
+        if self._stats is None:
+            return
+        path = self.path.format(pid=os.getpid())
+        try:
+            self._stats.dump_stats(path)
+        except OSError as ex:
+            logging.error("Can't write profile to %s: %s", path, ex)
+
+    def dump(self):
+        with self._lock:
+            self._dump()
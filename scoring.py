@@ -1,20 +1,27 @@
 import hashlib
-import json
 
+from metrics import REGISTRY
+from single_flight import SingleFlight
+from value_codec import JSON_CODEC
 
-def get_score(store, phone, email, birthday=None, gender=None, first_name=None, last_name=None):
+SCORE_LOOKUPS = REGISTRY.counter('score_cache_lookups_total', 'Score cache lookups by result.', ('result',))
+
+# concurrent misses on the same score key compute and cache it once
+score_flights = SingleFlight()
+
+
+def get_score_key(phone, email, birthday=None, gender=None, first_name=None, last_name=None):
     key_parts = [
         first_name or "",
         last_name or "",
         str(phone) or "",
         birthday.strftime("%d.%m.%Y") if birthday is not None else "",
     ]
-    key = "uid:" + hashlib.md5(("".join(key_parts)).encode()).hexdigest()
-    # try get from cache,
-    # fallback to heavy calculation in case of cache miss
-    score = store.cache_get(key) or 0
-    if score:
-        return score
+    return "uid:" + hashlib.md5(("".join(key_parts)).encode()).hexdigest()
+
+
+def compute_score(phone, email, birthday=None, gender=None, first_name=None, last_name=None):
+    score = 0
     if phone:
         score += 1.5
     if email:
@@ -23,11 +30,81 @@ def get_score(store, phone, email, birthday=None, gender=None, first_name=None,
         score += 1.5
     if first_name and last_name:
         score += 0.5
+    return score
+
+
+def get_score(store, phone, email, birthday=None, gender=None, first_name=None, last_name=None):
+    key = get_score_key(phone, email, birthday, gender, first_name, last_name)
+    # try get from cache,
+    # fallback to heavy calculation in case of cache miss
+    score = store.cache_get(key) or 0
+    if score:
+        SCORE_LOOKUPS.inc('hit')
+        return float(score)
+    SCORE_LOOKUPS.inc('miss')
+    return score_flights.do(key, compute_and_cache_score, store, key,
+                            phone, email, birthday, gender, first_name, last_name)
+
+
+def compute_and_cache_score(store, key, *profile):
+    score = compute_score(*profile)
     # cache for 60 minutes
     store.cache_set(key, score, 60 * 60)
     return score
 
 
+def get_score_many(store, profiles):
+    keys = [get_score_key(**profile) for profile in profiles]
+    cached = store.cache_get_many(list(set(keys)))
+    scores, missed = [], {}
+    for key, profile in zip(keys, profiles):
+        score = cached.get(key) or missed.get(key) or 0
+        if score:
+            scores.append(float(score))
+            continue
+        score = missed[key] = compute_score(**profile)
+        scores.append(score)
+    hits = sum(1 for key in keys if cached.get(key))
+    SCORE_LOOKUPS.inc('hit', value=hits)
+    SCORE_LOOKUPS.inc('miss', value=len(keys) - hits)
+    if missed:
+        store.cache_set_many(missed, 60 * 60)
+    return scores
+
+
+async def get_score_async(store, phone, email, birthday=None, gender=None, first_name=None, last_name=None):
+    key = get_score_key(phone, email, birthday, gender, first_name, last_name)
+    score = await store.cache_get(key) or 0
+    if score:
+        return float(score)
+    score = compute_score(phone, email, birthday, gender, first_name, last_name)
+    await store.cache_set(key, score, 60 * 60)
+    return score
+
+
+def get_interests_key(cid):
+    return "i:%s" % cid
+
+
+def decode_interests(raw, codec=JSON_CODEC):
+    return codec.decode(raw) if raw else []
+
+
 def get_interests(store, cid):
-    r = store.get("i:%s" % cid)
-    return json.loads(r) if r else []
+    return decode_interests(store.get(get_interests_key(cid)), store.codec)
+
+
+async def get_interests_async(store, cid):
+    return decode_interests(await store.get(get_interests_key(cid)), store.codec)
+
+
+def get_interests_many(store, cids):
+    keys = {cid: get_interests_key(cid) for cid in cids}
+    found = store.get_many(list(keys.values()))
+    return {cid: decode_interests(found.get(key), store.codec) for cid, key in keys.items()}
+
+
+async def get_interests_many_async(store, cids):
+    keys = {cid: get_interests_key(cid) for cid in cids}
+    found = await store.get_many(list(keys.values()))
+    return {cid: decode_interests(found.get(key), store.codec) for cid, key in keys.items()}
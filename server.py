@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import HTTPServer
+
+
+class ListeningHTTPServer(HTTPServer):
+    request_queue_size = 128
+
+
+class PooledHTTPServer(ListeningHTTPServer):
+    """HTTPServer that hands accepted connections to a bounded pool of worker threads.
+
+    At most ``workers`` connections are handled at once and at most ``queue_size``
+    more wait for a free worker; after that the accept loop blocks and new
+    clients wait in the listen backlog. ``accepted_at`` gives a handler the time its
+    connection was accepted, to tell how long it waited for a worker.
+    """
+
+    def __init__(self, server_address, handler_class, workers, queue_size=None, bind_and_activate=True):
+        super().__init__(server_address, handler_class, bind_and_activate)
+        self.workers = workers
+        self._slots = threading.BoundedSemaphore(workers + (workers if queue_size is None else queue_size))
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='worker')
+        self._local = threading.local()
+
+    def process_request(self, request, client_address):
+        accepted = time.monotonic()
+        self._slots.acquire()
+        try:
+            self._executor.submit(self._process_request_thread, request, client_address, accepted)
+        except RuntimeError:
+            self._slots.release()
+            self.shutdown_request(request)
+
+    def _process_request_thread(self, request, client_address, accepted):
+        self._local.accepted = accepted
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._slots.release()
+
+    def accepted_at(self):
+        return getattr(self._local, 'accepted', None)
+
+    def handle_error(self, request, client_address):
+        logging.exception("Error while handling request from %s", client_address)
+
+    def server_close(self):
+        super().server_close()
+        self._executor.shutdown(wait=True)
+
+
+def bind_server(server, reuse_port=False):
+    if reuse_port:
+        server.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    try:
+        server.server_bind()
+        server.server_activate()
+    except Exception:
+        server.server_close()
+        raise
+    return server
+
+
+class PreforkServer:
+    """Forks ``processes`` children that serve one port and restarts the ones that die.
+
+    ``server_factory`` must return a server created with ``bind_and_activate=False``.
+    With ``reuse_port`` every child binds its own socket with SO_REUSEPORT and the
+    kernel balances connections between them, otherwise the parent binds once and
+    the children accept on the inherited socket. ``child_init`` runs in every child
+    right after the fork, before the child builds its server, and ``child_exit``
+    after the child has closed its server.
+    """
+    restart_delay = 1.0
+
+    def __init__(self, server_factory, processes, reuse_port=False, child_init=None, child_exit=None):
+        self.server_factory = server_factory
+        self.processes = processes
+        self.reuse_port = reuse_port and hasattr(socket, 'SO_REUSEPORT')
+        self.child_init = child_init
+        self.child_exit = child_exit
+        self._listener = None
+        self._children = {}
+        self._running = False
+
+    def serve_forever(self):
+        self._running = True
+        if not self.reuse_port:
+            self._listener = bind_server(self.server_factory())
+        signal.signal(signal.SIGTERM, self._handle_term)
+        for _ in range(self.processes):
+            self._spawn()
+        try:
+            while self._children:
+                try:
+                    pid, status = os.wait()
+                except ChildProcessError:
+                    break
+                started = self._children.pop(pid, None)
+                if started is None or not self._running:
+                    continue
+                logging.warning("Worker %s exited with status %s, restarting", pid, status)
+                if time.monotonic() - started < self.restart_delay:
+                    time.sleep(self.restart_delay)
+                self._spawn()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def stop(self):
+        self._running = False
+        for pid in list(self._children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in list(self._children):
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+            self._children.pop(pid, None)
+        if self._listener is not None:
+            self._listener.server_close()
+            self._listener = None
+
+    def _handle_term(self, signum, frame):
+        self._running = False
+        for pid in list(self._children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def _spawn(self):
+        pid = os.fork()
+        if pid:
+            self._children[pid] = time.monotonic()
+            return pid
+        code = 0
+        try:
+            self._run_child()
+        except SystemExit as ex:
+            code = ex.code or 0
+        except BaseException:
+            logging.exception("Worker %s crashed", os.getpid())
+            code = 1
+        finally:
+            os._exit(code)
+
+    def _run_child(self):
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        if self.child_init is not None:
+            self.child_init()
+        if self._listener is not None:
+            server = self.server_factory()
+            server.socket.close()
+            server.socket = self._listener.socket
+            server.server_address = self._listener.server_address
+        else:
+            server = bind_server(self.server_factory(), reuse_port=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            if self.child_exit is not None:
+                self.child_exit()
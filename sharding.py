@@ -0,0 +1,125 @@
+import hashlib
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+
+POINTS_PER_NODE = 160
+FANOUT_WORKERS = 16
+
+
+def parse_servers(spec, default_port=11211):
+    """``"host1:11211,host2"`` -> [('host1', 11211), ('host2', 11211)]"""
+    servers = []
+    for part in spec.split(','):
+        host, _, port = part.strip().partition(':')
+        servers.append((host, int(port) if port else default_port))
+    return servers
+
+
+def node_name(server):
+    return '%s:%s' % server
+
+
+def key_bytes(key):
+    return key if isinstance(key, bytes) else str(key).encode()
+
+
+class HashRing:
+    """Ketama consistent hashing of keys onto nodes.
+
+    Every node gets ``points`` positions on a 32 bit ring, four from every MD5
+    digest of ``"<node>-<i>"``, and a key belongs to the first node point at or
+    after the first four bytes of its MD5. Adding or removing one of N nodes moves
+    only about 1/N of the keys, the ones that belong to that node.
+    """
+
+    def __init__(self, nodes, points=POINTS_PER_NODE):
+        ring = {}
+        for node in nodes:
+            for i in range(points // 4):
+                digest = hashlib.md5(('%s-%s' % (node, i)).encode()).digest()
+                for j in range(4):
+                    ring.setdefault(int.from_bytes(digest[j * 4:j * 4 + 4], 'little'), node)
+        self.nodes = list(nodes)
+        self._points = sorted(ring)
+        self._nodes = [ring[point] for point in self._points]
+
+    def get_node(self, key):
+        point = int.from_bytes(hashlib.md5(key_bytes(key)).digest()[:4], 'little')
+        return self._nodes[bisect_left(self._points, point) % len(self._points)]
+
+    def split(self, keys):
+        """Groups keys by node, keeping their order."""
+        groups = {}
+        for key in keys:
+            groups.setdefault(self.get_node(key), []).append(key)
+        return groups
+
+
+class ShardedClient:
+    """Spreads keys over one client per node with a HashRing.
+
+    Single key calls go to the node of the key. Multi-key calls are split per node;
+    the first part runs in the calling thread and the others in parallel on a pool
+    of at most ``fanout_workers`` threads. If a node fails the call raises the
+    first error once every node has answered.
+    """
+
+    def __init__(self, clients, fanout_workers=FANOUT_WORKERS, points=POINTS_PER_NODE):
+        self.clients = dict(clients)
+        self.ring = HashRing(self.clients, points)
+        self._executor = ThreadPoolExecutor(max_workers=fanout_workers, thread_name_prefix='fanout')
+
+    def _client(self, key):
+        return self.clients[self.ring.get_node(key)]
+
+    def _fan_out(self, method, parts, **kwargs):
+        """Calls ``method(part, **kwargs)`` on the client of every node in parts."""
+        calls = [(getattr(self.clients[node], method), part) for node, part in parts.items()]
+        futures = [self._executor.submit(func, part, **kwargs) for func, part in calls[1:]]
+        results, error = [], None
+        try:
+            func, part = calls[0]
+            results.append(func(part, **kwargs))
+        except Exception as ex:
+            error = ex
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as ex:
+                error = error or ex
+        if error is not None:
+            raise error
+        return results
+
+    def get(self, key, *args, **kwargs):
+        return self._client(key).get(key, *args, **kwargs)
+
+    def set(self, key, *args, **kwargs):
+        return self._client(key).set(key, *args, **kwargs)
+
+    def delete(self, key, *args, **kwargs):
+        return self._client(key).delete(key, *args, **kwargs)
+
+    def get_many(self, keys, **kwargs):
+        groups = self.ring.split(keys)
+        if not groups:
+            return {}
+        found = {}
+        for part in self._fan_out('get_many', groups, **kwargs):
+            found.update(part)
+        return found
+
+    def set_many(self, values, expire=0, **kwargs):
+        groups = self.ring.split(values)
+        if not groups:
+            return []
+        parts = {node: {key: values[key] for key in group} for node, group in groups.items()}
+        failed = []
+        for part in self._fan_out('set_many', parts, expire=expire, **kwargs):
+            failed.extend(part or ())
+        return failed
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        for client in self.clients.values():
+            client.close()
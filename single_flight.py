@@ -0,0 +1,60 @@
+import threading
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time and shares its outcome.
+
+    The first thread to ask for a key runs the function, the threads asking for the
+    same key meanwhile wait for it and get its result or its exception. A thread that
+    waited longer than ``timeout`` seconds stops waiting and runs the function itself.
+    """
+
+    def __init__(self, timeout=1.0):
+        self.timeout = timeout
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.shared = 0
+        self.timeouts = 0
+
+    def do(self, key, func, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+            else:
+                self.shared += 1
+        if leader:
+            try:
+                call.result = func(*args, **kwargs)
+            except BaseException as ex:
+                call.error = ex
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+            return call.result
+        if not call.done.wait(self.timeout):
+            with self._lock:
+                self.timeouts += 1
+            return func(*args, **kwargs)
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def stats(self):
+        with self._lock:
+            return {'in_flight': len(self._calls), 'calls': self.calls, 'shared': self.shared,
+                    'timeouts': self.timeouts}
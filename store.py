@@ -1,51 +1,338 @@
 import logging
+import threading
 
-from pymemcache.client.base import Client
+from pymemcache.client.base import Client, check_key_helper
 from pymemcache.client.retrying import RetryingClient
 
+from circuit_breaker import CircuitBreaker, CircuitBreakerClient, CircuitOpenError
+from client_pool import ClientPool
+from hedging import HEDGE_WORKERS, HedgedClient
+from local_cache import LocalCache
+from metrics import REGISTRY
+from sharding import ShardedClient, node_name
+from single_flight import SingleFlight
+from value_codec import JSON_CODEC
+from write_behind import WriteBehindQueue
 
-def get_base_client(host, port):
-    return Client((host, port), connect_timeout=0.05, timeout=0.05)
+
+STORE_OPERATIONS = REGISTRY.counter('store_operations_total', 'Store operations by role, operation and result.',
+                                    ('role', 'operation', 'result'))
+
+
+def get_base_client(host, port, default_noreply=True):
+    return Client((host, port), connect_timeout=0.05, timeout=0.05, default_noreply=default_noreply)
+
+
+def check_key(key):
+    return check_key_helper(key, allow_unicode_keys=False)
+
+
+def as_stored(value):
+    # what memcached gives back for a value written without a serializer
+    return value if isinstance(value, bytes) else str(value).encode()
+
+
+class ThreadLocalClient:
+    """Opens a separate memcached connection for every thread that uses it."""
+
+    def __init__(self, host, port):
+        self._host = host
+        self._port = port
+        self._local = threading.local()
+        self._clients = []
+        self._lock = threading.Lock()
+
+    def _client(self):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = get_base_client(self._host, self._port)
+            with self._lock:
+                self._clients.append(client)
+        return client
+
+    def get(self, *args, **kwargs):
+        return self._client().get(*args, **kwargs)
+
+    def set(self, *args, **kwargs):
+        return self._client().set(*args, **kwargs)
+
+    def get_many(self, *args, **kwargs):
+        return self._client().get_many(*args, **kwargs)
+
+    def set_many(self, *args, **kwargs):
+        return self._client().set_many(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        return self._client().delete(*args, **kwargs)
+
+    def close(self):
+        with self._lock:
+            clients, self._clients = self._clients, []
+        for client in clients:
+            client.close()
+        self._local = threading.local()
 
 
 class Store:
-    def __init__(self, host='localhost', port=11211):
-        self._cache_client = RetryingClient(
-            get_base_client(host, port),
-            attempts=2,
-            retry_delay=0.05
-        )
-        self._db_client = RetryingClient(
-            get_base_client(host, port),
-            attempts=3,
-            retry_delay=0.1
-        )
+    """Cache and persistent storage on top of memcached.
+
+    With ``l1_entries`` or ``l1_bytes`` set, values read or written by this process
+    are also kept in a bounded in-process LRU cache for at most ``l1_ttl`` seconds
+    (or the shorter ``expire`` given to ``cache_set``).
+
+    By default every thread gets its own connection per role. With ``pool_size`` set,
+    the threads share a ClientPool of at most ``pool_size`` connections per role
+    instead (see ClientPool for the other ``pool_*`` options). Pooled connections
+    wait for write replies, as the next read may go through another connection.
+
+    ``cache_failure_threshold`` and ``db_failure_threshold`` put a CircuitBreaker in
+    front of the role: after that many failed calls in a row cache reads miss and db
+    reads raise MemoryError at once, until a probe every ``probe_interval`` seconds
+    succeeds.
+
+    Concurrent ``get`` calls for a key missing in the cache share one storage read
+    (see SingleFlight); a caller waits for it at most ``coalesce_timeout`` seconds.
+
+    With ``write_behind`` set, ``cache_set`` and ``cache_set_many`` only queue the
+    values and a background thread writes them with ``set_many`` (see
+    WriteBehindQueue). At most ``write_behind`` keys wait to be written; a writer
+    waits up to ``write_behind_timeout`` seconds for room and then the value is
+    dropped. ``close`` writes whatever is still queued.
+
+    ``cache_servers`` and ``db_servers`` list the (host, port) memcached nodes of
+    a role (``host`` and ``port`` by default); keys are spread over several nodes with
+    consistent hashing (see ShardedClient). Every node gets its own connections,
+    pool and retries, the circuit breaker covers the whole role.
+
+    ``db_replicas`` lists memcached nodes holding copies of the db role. db writes
+    go to every copy and a read the db node has not answered within the
+    ``hedge_percentile`` of its latencies (at most ``hedge_max_delay`` seconds) is
+    also sent to a replica, for at most ``hedge_budget`` of the reads (see
+    HedgedClient). The reads run on a pool of ``hedge_workers`` threads.
+
+    ``codec`` encodes and decodes the stored client interests (JSON by default,
+    see value_codec); the values are kept encoded in memcached and in the L1 cache.
+    """
+
+    def __init__(self, host='localhost', port=11211, l1_entries=0, l1_bytes=0, l1_ttl=60,
+                 pool_size=0, pool_min=0, pool_idle_timeout=60, pool_timeout=1.0,
+                 cache_failure_threshold=0, db_failure_threshold=0, probe_interval=5.0,
+                 coalesce_timeout=1.0, write_behind=0, write_behind_batch=100, write_behind_interval=0.05,
+                 write_behind_timeout=0.1, codec=None, cache_servers=None, db_servers=None, db_replicas=None,
+                 hedge_percentile=95, hedge_max_delay=0.05, hedge_budget=0.05, hedge_workers=HEDGE_WORKERS):
+        self.codec = codec or JSON_CODEC
+        self.local_cache = LocalCache(l1_entries, l1_bytes, l1_ttl) if l1_entries or l1_bytes else None
+        self.pools = {}
+        self.breakers = {}
+        self.flights = SingleFlight(coalesce_timeout)
+        for role, threshold in (('cache', cache_failure_threshold), ('db', db_failure_threshold)):
+            if threshold > 0:
+                self.breakers[role] = CircuitBreaker(role, threshold, probe_interval)
+        pool_options = (pool_size, pool_min, pool_idle_timeout, pool_timeout)
+        self._cache_client = self._guard('cache', self._role_client(
+            'cache', cache_servers or [(host, port)], pool_options, attempts=2, retry_delay=0.05))
+        db_client = self._role_client('db', db_servers or [(host, port)], pool_options, attempts=3, retry_delay=0.1)
+        self.hedged_reads = None
+        if db_replicas:
+            if isinstance(db_client, ShardedClient):
+                raise ValueError('Replicated reads need a single db server')
+            replicas = [self._node_client('db replica %s' % node_name(server), server, pool_options,
+                                          attempts=3, retry_delay=0.1) for server in db_replicas]
+            db_client = self.hedged_reads = HedgedClient(db_client, replicas, hedge_percentile,
+                                                         max_delay=hedge_max_delay, budget=hedge_budget,
+                                                         workers=hedge_workers)
+        self._db_client = self._guard('db', db_client)
+        self.write_queue = None
+        if write_behind > 0:
+            self.write_queue = WriteBehindQueue(self._cache_write_behind, write_behind, write_behind_batch,
+                                                write_behind_interval, write_behind_timeout)
+
+    def _node_client(self, name, server, pool_options, attempts, retry_delay):
+        pool_size, pool_min, pool_idle_timeout, pool_timeout = pool_options
+        host, port = server
+        if pool_size > 0:
+            client = self.pools[name] = ClientPool(lambda: get_base_client(host, port, default_noreply=False),
+                                                   pool_min, pool_size, pool_idle_timeout, pool_timeout)
+        else:
+            client = ThreadLocalClient(host, port)
+        return RetryingClient(client, attempts=attempts, retry_delay=retry_delay)
+
+    def _role_client(self, role, servers, pool_options, attempts, retry_delay):
+        if len(servers) == 1:
+            return self._node_client(role, servers[0], pool_options, attempts, retry_delay)
+        return ShardedClient({node_name(server): self._node_client('%s %s' % (role, node_name(server)), server,
+                                                                   pool_options, attempts, retry_delay)
+                              for server in servers})
+
+    def _guard(self, role, client):
+        breaker = self.breakers.get(role)
+        return client if breaker is None else CircuitBreakerClient(client, breaker)
+
+    def _remember(self, values, expire=None):
+        if self.local_cache is not None:
+            for key, value in values.items():
+                if value is not None:
+                    self.local_cache.set(key, value, expire)
 
     def cache_get(self, key):
+        if self.local_cache is not None:
+            res = self.local_cache.get(key)
+            if res is not None:
+                STORE_OPERATIONS.inc('l1', 'get', 'hit')
+                return res
         try:
             res = self._cache_client.get(key)
+            STORE_OPERATIONS.inc('cache', 'get', 'miss' if res is None else 'hit')
+            self._remember({key: res})
             return res
+        except CircuitOpenError:
+            STORE_OPERATIONS.inc('cache', 'get', 'rejected')
+            return None
         except Exception as ex:
-            logging.error(f'Error while getting value from cache by key {key}: {ex}')
+            STORE_OPERATIONS.inc('cache', 'get', 'error')
+            logging.error('Error while getting value from cache by key %s: %s', key, ex)
 
     def cache_set(self, key, value, expire=60):
+        self._remember({key: as_stored(value)}, expire)
+        if self.write_queue is not None:
+            self._enqueue({key: value}, expire)
+            return
         try:
             self._cache_client.set(key, value, expire)
+            STORE_OPERATIONS.inc('cache', 'set', 'ok')
+        except CircuitOpenError:
+            STORE_OPERATIONS.inc('cache', 'set', 'rejected')
+        except Exception as ex:
+            STORE_OPERATIONS.inc('cache', 'set', 'error')
+            logging.error('Error while setting value %s by key %s: %s', value, key, ex)
+
+    def cache_get_many(self, keys):
+        res = self.local_cache.get_many(keys) if self.local_cache is not None else {}
+        if res:
+            STORE_OPERATIONS.inc('l1', 'get', 'hit', value=len(res))
+        missed = [key for key in keys if key not in res]
+        if not missed:
+            return res
+        try:
+            found = self._cache_client.get_many(missed)
+        except CircuitOpenError:
+            STORE_OPERATIONS.inc('cache', 'get', 'rejected', value=len(missed))
+            return res
         except Exception as ex:
-            logging.error(f'Error while setting value {value} by key {key}: {ex}')
+            STORE_OPERATIONS.inc('cache', 'get', 'error', value=len(missed))
+            logging.error('Error while getting values from cache by keys %s: %s', missed, ex)
+            return res
+        STORE_OPERATIONS.inc('cache', 'get', 'hit', value=len(found))
+        STORE_OPERATIONS.inc('cache', 'get', 'miss', value=len(missed) - len(found))
+        self._remember(found)
+        res.update(found)
+        return res
+
+    def cache_set_many(self, values, expire=60):
+        self._remember({key: as_stored(value) for key, value in values.items()}, expire)
+        if self.write_queue is not None:
+            self._enqueue(values, expire)
+        else:
+            self._cache_write_many(values, expire)
+
+    def _enqueue(self, values, expire):
+        for key, value in values.items():
+            if not self.write_queue.put(key, value, expire):
+                STORE_OPERATIONS.inc('cache', 'set', 'dropped')
+
+    def _cache_write_behind(self, values, expire):
+        # off the request path waiting for the reply costs nothing and nothing is lost on close
+        self._cache_write_many(values, expire, noreply=False)
+
+    def _cache_write_many(self, values, expire, noreply=None):
+        try:
+            self._cache_client.set_many(values, expire, noreply=noreply)
+            STORE_OPERATIONS.inc('cache', 'set', 'ok', value=len(values))
+        except CircuitOpenError:
+            STORE_OPERATIONS.inc('cache', 'set', 'rejected', value=len(values))
+        except Exception as ex:
+            STORE_OPERATIONS.inc('cache', 'set', 'error', value=len(values))
+            logging.error('Error while setting values by keys %s: %s', list(values), ex)
 
     def get(self, key):
         res = self.cache_get(key)
         if res is None:
+            res = self.flights.do(key, self._db_get, key)
+        return res
+
+    def _db_get(self, key):
+        try:
+            res = self._db_client.get(key)
+        except CircuitOpenError as ex:
+            STORE_OPERATIONS.inc('db', 'get', 'rejected')
+            raise MemoryError(ex)
+        except Exception as ex:
+            STORE_OPERATIONS.inc('db', 'get', 'error')
+            logging.error('Error while getting value from storage by key %s: %s', key, ex)
+            raise MemoryError(ex)
+        STORE_OPERATIONS.inc('db', 'get', 'miss' if res is None else 'hit')
+        self._remember({key: res})
+        return res
+
+    def get_many(self, keys):
+        res = self.cache_get_many(keys)
+        missed = [key for key in keys if res.get(key) is None]
+        if missed:
             try:
-                res = self._db_client.get(key)
+                found = self._db_client.get_many(missed)
+            except CircuitOpenError as ex:
+                STORE_OPERATIONS.inc('db', 'get', 'rejected', value=len(missed))
+                raise MemoryError(ex)
             except Exception as ex:
-                logging.error(f'Error while getting value from storage by key {key}: {ex}')
+                STORE_OPERATIONS.inc('db', 'get', 'error', value=len(missed))
+                logging.error('Error while getting values from storage by keys %s: %s', missed, ex)
                 raise MemoryError(ex)
+            STORE_OPERATIONS.inc('db', 'get', 'hit', value=len(found))
+            STORE_OPERATIONS.inc('db', 'get', 'miss', value=len(missed) - len(found))
+            self._remember(found)
+            res.update(found)
         return res
 
     def set(self, key, value):
+        if self.local_cache is not None:
+            self.local_cache.delete(key)
         try:
             self._db_client.set(key, value)
+            STORE_OPERATIONS.inc('db', 'set', 'ok')
+        except Exception as ex:
+            STORE_OPERATIONS.inc('db', 'set', 'error')
+            logging.error('Error while setting value %s by key %s: %s', value, key, ex)
+
+    def set_many(self, values):
+        """Writes values to the storage, returning the keys that were not stored."""
+        if self.local_cache is not None:
+            for key in values:
+                self.local_cache.delete(key)
+        try:
+            failed = self._db_client.set_many(values) or []
         except Exception as ex:
-            logging.error(f'Error while setting value {value} by key {key}: {ex}')
+            STORE_OPERATIONS.inc('db', 'set', 'error', value=len(values))
+            logging.error('Error while setting values by keys %s: %s', list(values), ex)
+            return list(values)
+        STORE_OPERATIONS.inc('db', 'set', 'ok', value=len(values) - len(failed))
+        if failed:
+            STORE_OPERATIONS.inc('db', 'set', 'error', value=len(failed))
+        return failed
+
+    def breaker_stats(self):
+        return {role: breaker.stats() for role, breaker in self.breakers.items()}
+
+    def flight_stats(self):
+        return self.flights.stats()
+
+    def hedge_stats(self):
+        return self.hedged_reads.stats() if self.hedged_reads is not None else {}
+
+    def pool_stats(self):
+        return {role: pool.stats() for role, pool in self.pools.items()}
+
+    def close(self):
+        if self.write_queue is not None:
+            self.write_queue.close()
+        self._cache_client.close()
+        self._db_client.close()
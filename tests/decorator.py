@@ -1,4 +1,6 @@
+import asyncio
 import functools
+import logging
 
 
 def cases(cases):
@@ -12,5 +14,21 @@ def cases(cases):
                 except Exception as ex:
                     print(f"Test: {func.__name__}, case: {case}")
                     raise ex
-        return wrapper
+
+        @functools.wraps(func)
+        async def async_wrapper(*args):
+            for case in cases:
+                new_args = args + (case if isinstance(case, tuple) else (case,))
+                try:
+                    await func(*new_args)
+                except Exception as ex:
+                    print(f"Test: {func.__name__}, case: {case}")
+                    raise ex
+        return async_wrapper if asyncio.iscoroutinefunction(func) else wrapper
     return decorator
+
+
+def enable_logging(test):
+    """Lifts logging.disable for the rest of a test, for tests asserting on logs."""
+    test.addCleanup(logging.disable, logging.root.manager.disable)
+    logging.disable(logging.NOTSET)
@@ -0,0 +1,118 @@
+import http.client
+import json
+import time
+import unittest
+
+import api
+from admission import AdmissionController, parse_priorities
+from benchmarks.common import free_port, quiet, serve_in_thread, signed_request
+from fake_memcached import FakeMemcached
+from server import PooledHTTPServer
+from store import Store
+
+
+class TestAdmissionController(unittest.TestCase):
+    def test_parse_priorities(self):
+        self.assertEqual(parse_priorities("batch=lowest, clients_interests=low"),
+                         {"batch": "lowest", "clients_interests": "low"})
+        self.assertEqual(parse_priorities(""), {})
+        with self.assertRaises(ValueError):
+            parse_priorities("online_score=high")
+
+    def test_in_flight_limit_by_priority(self):
+        controller = AdmissionController(max_in_flight=5, target=0, priorities={"b": "lowest", "c": "low"})
+        for _ in range(3):
+            self.assertIsNone(controller.admit("a"))
+        self.assertEqual(controller.admit("b"), "in_flight")
+        self.assertIsNone(controller.admit("c"))
+        self.assertEqual(controller.admit("c"), "in_flight")
+        # a method without a priority gets the whole limit
+        self.assertIsNone(controller.admit("a"))
+        self.assertEqual(controller.admit("a"), "in_flight")
+        controller.release()
+        self.assertIsNone(controller.admit("a"))
+        self.assertEqual(controller.stats()["shed_in_flight"], 3)
+
+    def test_queue_time_limit_drops_to_target_when_queue_stays_long(self):
+        controller = AdmissionController(target=0.01, interval=0.05)
+        self.assertIsNone(controller.admit("a", queued=0.02))
+        time.sleep(0.06)
+        # the whole interval waited longer than the target
+        self.assertEqual(controller.admit("a", queued=0.02), "queue_time")
+        self.assertEqual(controller.stats()["overloaded"], 1)
+        self.assertIsNone(controller.admit("a", queued=0.001))
+        time.sleep(0.06)
+        self.assertIsNone(controller.admit("a", queued=0.02))
+        self.assertEqual(controller.admit("a", queued=0.2), "queue_time")
+
+    def test_idle_interval_is_not_overloaded(self):
+        controller = AdmissionController(target=0.005, interval=0.05)
+        time.sleep(0.06)
+        self.assertIsNone(controller.admit("x", queued=0.01))
+        self.assertEqual(controller.stats()["overloaded"], 0)
+
+    def test_requests_without_queue_time_do_not_hide_a_standing_queue(self):
+        controller = AdmissionController(target=0.01, interval=0.05)
+        self.assertIsNone(controller.admit("a", queued=0.02))
+        # follow-up requests on kept-alive connections never waited for a worker
+        for _ in range(3):
+            self.assertIsNone(controller.admit("a"))
+        time.sleep(0.06)
+        self.assertEqual(controller.admit("a", queued=0.02), "queue_time")
+        self.assertEqual(controller.stats()["overloaded"], 1)
+
+
+class TestLoadShedding(unittest.TestCase):
+    def setUp(self):
+        self.memcached = FakeMemcached().start()
+        self.memcached.preload({"i:1": '["books"]'})
+        self.store, api.MainHTTPHandler.store = api.MainHTTPHandler.store, Store(port=self.memcached.port)
+        api.MainHTTPHandler.admission = AdmissionController(max_in_flight=5, target=0,
+                                                            priorities={"clients_interests": "lowest"})
+        self.port = free_port()
+        self.server = PooledHTTPServer(("localhost", self.port), quiet(api.MainHTTPHandler), workers=2)
+        serve_in_thread(self.server)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        api.MainHTTPHandler.admission = None
+        api.MainHTTPHandler.store.close()
+        api.MainHTTPHandler.store = self.store
+        self.memcached.stop()
+
+    def post(self, body):
+        conn = http.client.HTTPConnection("localhost", self.port, timeout=5)
+        try:
+            conn.request("POST", "/method", body=json.dumps(body))
+            response = conn.getresponse()
+            return response.status, response.getheader("Retry-After"), json.loads(response.read())
+        finally:
+            conn.close()
+
+    def test_low_priority_shed_first(self):
+        for _ in range(3):
+            api.MainHTTPHandler.admission.admit("online_score")
+        status, retry_after, body = self.post(signed_request("clients_interests", {"client_ids": [1]}))
+        self.assertEqual((status, retry_after), (api.SERVICE_UNAVAILABLE, "1"))
+        self.assertEqual(body, {"error": "Service Unavailable", "code": api.SERVICE_UNAVAILABLE})
+        status, retry_after, body = self.post(signed_request("online_score", {"phone": "79175002040",
+                                                                              "email": "a@b.ru"}))
+        self.assertEqual((status, retry_after), (api.OK, None))
+        self.assertEqual(api.MainHTTPHandler.admission.stats()["in_flight"], 3)
+
+    def test_connection_age_is_not_queue_time(self):
+        api.MainHTTPHandler.admission = AdmissionController(target=0.001, interval=0.05)
+        api.MainHTTPHandler.keepalive_timeout = 5
+        self.addCleanup(setattr, api.MainHTTPHandler, "keepalive_timeout", 0)
+        conn = http.client.HTTPConnection("localhost", self.port, timeout=5)
+        try:
+            conn.request("GET", "/metrics")
+            conn.getresponse().read()
+            time.sleep(0.1)
+            body = json.dumps(signed_request("clients_interests", {"client_ids": [1]}))
+            conn.request("POST", "/method", body=body)
+            self.assertEqual(conn.getresponse().status, api.OK)
+        finally:
+            conn.close()
+        self.assertEqual(api.MainHTTPHandler.admission.stats()["shed_queue_time"], 0)
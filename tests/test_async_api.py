@@ -0,0 +1,73 @@
+import asyncio
+import http.client
+import json
+import logging
+import unittest
+
+import api
+from async_api import AsyncHTTPServer
+from async_store import AsyncStore
+from benchmarks.common import post, signed_request
+from fake_memcached import FakeMemcached
+from store import Store
+from tests.decorator import cases
+
+
+class TestAsyncHTTPServer(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.memcached = FakeMemcached().start()
+        self.memcached.preload({'i:1': '["books", "cars"]', 'i:2': '["music"]'})
+        self.store = Store(port=self.memcached.port)
+        self.async_store = AsyncStore(port=self.memcached.port)
+        self.server = await AsyncHTTPServer('localhost', 0, self.async_store).start()
+        self.serving = asyncio.create_task(self.server.serve_forever())
+
+    async def asyncTearDown(self):
+        self.serving.cancel()
+        await self.server.close()
+        await self.async_store.close()
+        self.store.close()
+        self.memcached.stop()
+
+    @cases([
+        signed_request('online_score', {'phone': '79175002040', 'email': 'stupnikov@otus.ru'}),
+        signed_request('online_score', {'first_name': 'a', 'last_name': 'b', 'gender': 1, 'birthday': '01.01.2000'}),
+        signed_request('online_score', {'phone': '79175002040'}),
+        signed_request('clients_interests', {'client_ids': [1, 2, 3]}),
+        signed_request('clients_interests', {'client_ids': []}),
+        {'account': 'horns&hoofs', 'login': 'h&f', 'method': 'online_score', 'token': '', 'arguments': {}},
+        {},
+    ])
+    async def test_same_responses_as_method_handler(self, body):
+        code, r = await asyncio.to_thread(post, self.server.port, body)
+        response, expected_code = api.method_handler({'body': body, 'headers': {}}, {}, self.store)
+        expected = api.make_response(response, expected_code)
+        self.assertEqual(code, expected_code)
+        self.assertEqual(r, json_round_trip(expected))
+
+    async def test_not_found(self):
+        code, r = await asyncio.to_thread(post, self.server.port, {}, '/unknown')
+        self.assertEqual(code, api.NOT_FOUND)
+        self.assertEqual(r, {'error': 'Not Found', 'code': api.NOT_FOUND})
+
+    async def test_keep_alive(self):
+        def two_requests():
+            conn = http.client.HTTPConnection('localhost', self.server.port, timeout=5)
+            try:
+                body = signed_request('clients_interests', {'client_ids': [2]})
+                return [post(self.server.port, body, conn=conn) for _ in range(2)]
+            finally:
+                conn.close()
+
+        for code, r in await asyncio.to_thread(two_requests):
+            self.assertEqual(code, api.OK)
+            self.assertEqual(r['response'], {'2': ['music']})
+
+
+def json_round_trip(value):
+    return json.loads(json.dumps(value))
+
+
+logging.disable(logging.ERROR)
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import asyncio
+import logging
+import time
+import unittest
+
+from async_store import AsyncStore
+from benchmarks.common import free_port
+from fake_memcached import FakeMemcached
+from store import Store
+from tests.decorator import cases
+
+
+class TestStoreParity(unittest.IsolatedAsyncioTestCase):
+    """Store and AsyncStore must behave the same against the same memcached."""
+
+    def setUp(self):
+        self.memcached = FakeMemcached().start()
+        self.store = Store(port=self.memcached.port)
+        self.async_store = AsyncStore(port=self.memcached.port)
+
+    async def asyncTearDown(self):
+        await self.async_store.close()
+
+    def tearDown(self):
+        self.store.close()
+        self.memcached.stop()
+
+    @cases(['some_value', 42, 3.5, b'\x00bytes'])
+    async def test_cache_set_get(self, value):
+        self.store.cache_set('sync', value)
+        await self.async_store.cache_set('async', value)
+        self.assertEqual(self.store.cache_get('sync'), await self.async_store.cache_get('async'))
+        self.assertEqual(self.store.cache_get('async'), await self.async_store.cache_get('sync'))
+
+    async def test_cache_get_no_value(self):
+        self.assertIsNone(self.store.cache_get('missing'))
+        self.assertIsNone(await self.async_store.cache_get('missing'))
+
+    async def test_cache_set_with_expiration(self):
+        self.store.cache_set('sync', 'value', 1)
+        await self.async_store.cache_set('async', 'value', 1)
+        await asyncio.sleep(1.1)
+        self.assertIsNone(self.store.cache_get('sync'))
+        self.assertIsNone(await self.async_store.cache_get('async'))
+
+    async def test_set_get(self):
+        self.store.set('sync', '["a", "b"]')
+        await self.async_store.set('async', '["a", "b"]')
+        self.assertEqual(self.store.get('async'), await self.async_store.get('sync'))
+        self.assertIsNone(self.store.get('missing'))
+        self.assertIsNone(await self.async_store.get('missing'))
+
+    async def test_get_many(self):
+        self.store.set('stored', 'value')
+        keys = ['stored', 'missing']
+        self.assertEqual(self.store.get_many(keys), await self.async_store.get_many(keys))
+        self.assertEqual(self.store.get_many(keys), {'stored': b'value'})
+
+    async def test_invalid_key(self):
+        self.assertIsNone(self.store.cache_get('bad key'))
+        self.assertIsNone(await self.async_store.cache_get('bad key'))
+
+
+class TestStoreParityDisconnected(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        port = free_port()
+        self.store = Store(port=port)
+        self.async_store = AsyncStore(port=port)
+
+    async def test_cache_get_disconnected(self):
+        self.assertIsNone(self.store.cache_get('some_key'))
+        self.assertIsNone(await self.async_store.cache_get('some_key'))
+
+    async def test_cache_set_disconnected(self):
+        self.store.cache_set('some_key', 'value')
+        await self.async_store.cache_set('some_key', 'value')
+
+    async def test_get_disconnected(self):
+        with self.assertRaises(MemoryError):
+            self.store.get('some_key')
+        with self.assertRaises(MemoryError):
+            await self.async_store.get('some_key')
+
+    async def test_get_many_disconnected(self):
+        with self.assertRaises(MemoryError):
+            self.store.get_many(['some_key'])
+        with self.assertRaises(MemoryError):
+            await self.async_store.get_many(['some_key'])
+
+    async def test_get_retries(self):
+        started = time.monotonic()
+        with self.assertRaises(MemoryError):
+            await self.async_store.get('some_key')
+        # one cache retry and two db retries
+        self.assertGreaterEqual(time.monotonic() - started, 0.05 + 2 * 0.1)
+
+
+logging.disable(logging.ERROR)
+if __name__ == '__main__':
+    unittest.main()
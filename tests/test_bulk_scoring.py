@@ -0,0 +1,91 @@
+import io
+import json
+import random
+import unittest
+
+import api
+import scoring
+from benchmarks.common import admin_request, signed_request
+from tests.decorator import cases
+
+try:
+    import bulk_scoring
+except ImportError:
+    bulk_scoring = None
+
+VALUES = {
+    "first_name": [None, "", "Ivan", 42],
+    "last_name": [None, "", "Petrov", ["Petrov"]],
+    "email": [None, "", "stupnikov@otus.ru", "stupnikov", 1],
+    "phone": [None, "", "79175002040", 79175002040, "89175002040", 7917500204, True, 7.0],
+    "birthday": [None, "", "01.01.2000", "01.01.1890", "2000-01-01", 20000101],
+    "gender": [None, 0, 1, 2, 3, "1", True],
+}
+
+
+def score_one(arguments):
+    """The per-request path: validation by OnlineScoreRequest, then compute_score."""
+    try:
+        request = api.OnlineScoreRequest(**arguments)
+    except (TypeError, ValueError) as ex:
+        return api.make_response(str(ex), api.INVALID_REQUEST)
+    return api.make_response({"score": scoring.compute_score(**request.fields)}, api.OK)
+
+
+def random_record(rnd):
+    return {label: rnd.choice(values) for label, values in VALUES.items() if rnd.random() < 0.8}
+
+
+@unittest.skipIf(bulk_scoring is None, "numpy is not installed")
+class TestBulkScoring(unittest.TestCase):
+    def test_matches_per_request_path(self):
+        rnd = random.Random(7)
+        records = [random_record(rnd) for _ in range(5000)]
+        expected = [json.dumps(score_one(record)) for record in records]
+        actual = [json.dumps(result) for result in bulk_scoring.score_chunk(records)]
+        self.assertEqual(expected, actual)
+        self.assertIn('"score": 0}', "".join(actual))
+
+    @cases([1, 3, 1000])
+    def test_chunks_keep_order(self, chunk_size):
+        lines = [
+            json.dumps({"phone": "79175002040", "email": "stupnikov@otus.ru"}),
+            "{broken",
+            json.dumps(signed_request("online_score", {"first_name": "a", "last_name": "b"})),
+            json.dumps({"method": "clients_interests", "arguments": {"client_ids": [1]}}),
+            json.dumps([1, 2]),
+            json.dumps({"gender": 1}),
+        ]
+        results = list(bulk_scoring.score_lines(lines, chunk_size))
+        self.assertEqual([r["code"] for r in results], [api.OK, api.BAD_REQUEST, api.OK, api.INVALID_REQUEST,
+                                                        api.INVALID_REQUEST, api.INVALID_REQUEST])
+        self.assertEqual(results[0]["response"], {"score": 3.0})
+        self.assertEqual(results[2]["response"], {"score": 0.5})
+        self.assertEqual(results[5]["error"], api.INSUFFICIENT_DATA)
+
+    def test_method_requests_authorized_like_the_api(self):
+        arguments = {"first_name": "a", "last_name": "b"}
+        forged = dict(signed_request("online_score", arguments), token="bad")
+        lines = [json.dumps(body) for body in [
+            admin_request("online_score", arguments),
+            admin_request("online_score", {"first_name": "a"}),
+            forged,
+            signed_request("clients_interests", {"client_ids": [1]}),
+            signed_request("online_score", None),
+            {"login": "h&f", "method": "online_score", "token": "x", "arguments": {}},
+        ]]
+        self.assertEqual(list(bulk_scoring.score_lines(lines)), [
+            {"response": {"score": 42}, "code": api.OK},
+            {"error": api.INSUFFICIENT_DATA, "code": api.INVALID_REQUEST},
+            {"error": "Forbidden", "code": api.FORBIDDEN},
+            {"error": "Method clients_interests can not be scored offline.", "code": api.INVALID_REQUEST},
+            {"error": "'NoneType' object is not a mapping", "code": api.INVALID_REQUEST},
+            {"error": "unsupported operand type(s) for +: 'NoneType' and 'str'", "code": api.INVALID_REQUEST},
+        ])
+
+    def test_score_file_skips_blank_lines(self):
+        src = io.StringIO('{"phone": "79175002040", "email": "a@b"}\n\n{"gender": 0, "birthday": "01.01.2000"}\n')
+        dst = io.StringIO()
+        self.assertEqual(bulk_scoring.score_file(src, dst), 2)
+        self.assertEqual([json.loads(line) for line in dst.getvalue().splitlines()],
+                         [{"response": {"score": 3.0}, "code": api.OK}, {"response": {"score": 0}, "code": api.OK}])
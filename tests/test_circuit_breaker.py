@@ -0,0 +1,106 @@
+import logging
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from pymemcache.exceptions import MemcacheIllegalInputError
+
+import circuit_breaker
+from benchmarks.common import free_port
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from fake_memcached import FakeMemcached
+from store import Store
+
+
+def failing():
+    raise ConnectionRefusedError()
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_opens_after_threshold(self):
+        breaker = CircuitBreaker('test', failure_threshold=2, probe_interval=10)
+        for _ in range(2):
+            with self.assertRaises(ConnectionRefusedError):
+                breaker.call(failing)
+        self.assertEqual(breaker.state, circuit_breaker.OPEN)
+        func = MagicMock()
+        with self.assertRaises(CircuitOpenError):
+            breaker.call(func)
+        func.assert_not_called()
+        self.assertEqual(breaker.stats()['rejected'], 1)
+
+    def test_success_resets_failures(self):
+        breaker = CircuitBreaker('test', failure_threshold=2)
+        with self.assertRaises(ConnectionRefusedError):
+            breaker.call(failing)
+        breaker.call(lambda: None)
+        with self.assertRaises(ConnectionRefusedError):
+            breaker.call(failing)
+        self.assertEqual(breaker.state, circuit_breaker.CLOSED)
+
+    def test_client_errors_are_not_failures(self):
+        breaker = CircuitBreaker('test', failure_threshold=1)
+
+        def bad_key():
+            raise MemcacheIllegalInputError('bad key')
+
+        with self.assertRaises(MemcacheIllegalInputError):
+            breaker.call(bad_key)
+        self.assertEqual(breaker.state, circuit_breaker.CLOSED)
+
+    def test_half_open_probe(self):
+        breaker = CircuitBreaker('test', failure_threshold=1, probe_interval=10)
+        with self.assertRaises(ConnectionRefusedError):
+            breaker.call(failing)
+        later = time.monotonic() + 11
+        with patch('circuit_breaker.time.monotonic', return_value=later):
+            self.assertTrue(breaker.allow())
+            self.assertEqual(breaker.state, circuit_breaker.HALF_OPEN)
+            # only one probe at a time
+            self.assertFalse(breaker.allow())
+            breaker.record_failure()
+            self.assertEqual(breaker.state, circuit_breaker.OPEN)
+        with patch('circuit_breaker.time.monotonic', return_value=later + 11):
+            breaker.call(lambda: None)
+        self.assertEqual(breaker.state, circuit_breaker.CLOSED)
+
+
+class TestStoreCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        self.port = free_port()
+        self.store = Store(port=self.port, cache_failure_threshold=1, db_failure_threshold=1, probe_interval=0.5)
+
+    def tearDown(self):
+        self.store.close()
+
+    def test_fail_fast_when_open(self):
+        self.store.breakers['cache'].probe_interval = self.store.breakers['db'].probe_interval = 60
+        self.assertIsNone(self.store.cache_get('key'))
+        with self.assertRaises(MemoryError):
+            self.store.get('key')
+        self.assertEqual(self.store.breaker_stats()['cache']['state'], circuit_breaker.OPEN)
+        self.assertEqual(self.store.breaker_stats()['db']['state'], circuit_breaker.OPEN)
+
+        started = time.perf_counter()
+        self.assertIsNone(self.store.cache_get('key'))
+        self.assertEqual(self.store.cache_get_many(['key']), {})
+        with self.assertRaises(MemoryError):
+            self.store.get('key')
+        self.assertLess(time.perf_counter() - started, 0.01)
+
+    def test_recovers_after_probe(self):
+        self.assertIsNone(self.store.cache_get('key'))
+        memcached = FakeMemcached(port=self.port).start()
+        try:
+            memcached.preload({'key': 'value'})
+            self.assertIsNone(self.store.cache_get('key'))
+            time.sleep(0.5)
+            self.assertEqual(self.store.cache_get('key'), b'value')
+            self.assertEqual(self.store.breaker_stats()['cache']['state'], circuit_breaker.CLOSED)
+        finally:
+            memcached.stop()
+
+
+logging.disable(logging.ERROR)
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import logging
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+
+from client_pool import ClientPool, PoolTimeoutError
+from fake_memcached import FakeMemcached
+from store import Store
+
+
+class TestClientPool(unittest.TestCase):
+    def test_min_size_created_up_front(self):
+        pool = ClientPool(MagicMock, min_size=2, max_size=4)
+        self.assertEqual(pool.stats()['size'], 2)
+        self.assertEqual(pool.stats()['idle'], 2)
+
+    def test_clients_reused(self):
+        pool = ClientPool(MagicMock, max_size=4)
+        first = pool.checkout()
+        pool.checkin(first)
+        self.assertIs(pool.checkout(), first)
+        self.assertEqual(pool.stats()['created'], 1)
+
+    def test_checkout_timeout(self):
+        pool = ClientPool(MagicMock, max_size=1, checkout_timeout=0.05)
+        pool.checkout()
+        with self.assertRaises(PoolTimeoutError):
+            pool.checkout()
+        self.assertEqual(pool.stats()['timeouts'], 1)
+        self.assertEqual(pool.stats()['waits'], 1)
+
+    def test_waiting_thread_gets_released_client(self):
+        pool = ClientPool(MagicMock, max_size=1, checkout_timeout=1.0)
+        client = pool.checkout()
+        threading.Timer(0.05, pool.checkin, (client,)).start()
+        self.assertIs(pool.checkout(), client)
+
+    def test_failed_client_discarded(self):
+        pool = ClientPool(MagicMock, max_size=2)
+        with self.assertRaises(ConnectionError):
+            with pool.client() as client:
+                raise ConnectionError()
+        client.close.assert_called_once()
+        self.assertEqual(pool.stats()['size'], 0)
+        self.assertEqual(pool.stats()['destroyed'], 1)
+
+    def test_idle_clients_evicted_down_to_min_size(self):
+        pool = ClientPool(MagicMock, min_size=1, max_size=4, idle_timeout=10)
+        clients = [pool.checkout() for _ in range(3)]
+        for client in clients:
+            pool.checkin(client)
+        with patch('client_pool.time.monotonic', return_value=time.monotonic() + 11):
+            pool.checkin(pool.checkout())
+        self.assertEqual(pool.stats()['size'], 1)
+        self.assertEqual(pool.stats()['destroyed'], 2)
+
+
+class TestPooledStore(unittest.TestCase):
+    def setUp(self):
+        self.memcached = FakeMemcached(latency=0.001).start()
+        self.store = Store(port=self.memcached.port, pool_size=4, pool_min=1)
+
+    def tearDown(self):
+        self.store.close()
+        self.memcached.stop()
+
+    def test_concurrent_operations(self):
+        def worker(n):
+            for i in range(20):
+                key = 'k:%s:%s' % (n, i)
+                self.store.set(key, str(i))
+                if self.store.get(key) != str(i).encode():
+                    return False
+            return True
+
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            self.assertTrue(all(executor.map(worker, range(16))))
+        stats = self.store.pool_stats()
+        self.assertLessEqual(stats['db']['created'], 4)
+        self.assertEqual(stats['db']['in_use'], 0)
+        self.assertEqual(stats['db']['timeouts'], 0)
+
+
+logging.disable(logging.ERROR)
+if __name__ == '__main__':
+    unittest.main()
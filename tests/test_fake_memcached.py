@@ -0,0 +1,90 @@
+import logging
+import random
+import time
+import unittest
+
+from pymemcache.client.base import Client
+
+from fake_memcached import FakeMemcached, parse_latency, parse_size
+from store import Store
+from tests.decorator import cases
+
+
+class TestParsing(unittest.TestCase):
+    @cases(["uniform:0.001,0.002", "normal:0.0015,0.0001", "exp:0.0015", "pareto:0.001,3"])
+    def test_latency_distributions(self, spec):
+        latency = parse_latency(spec, random.Random(1))
+        samples = [latency() for _ in range(1000)]
+        self.assertTrue(all(sample >= 0 for sample in samples))
+        self.assertAlmostEqual(sum(samples) / len(samples), 0.0015, delta=0.0005)
+
+    def test_constant_latency(self):
+        self.assertEqual(parse_latency("0.01"), 0.01)
+
+    def test_unknown_distribution(self):
+        with self.assertRaises(ValueError):
+            parse_latency("gamma:1,2")
+
+    @cases([("1024", 1024), ("2k", 2048), ("1.5m", 3 << 19), ("1G", 1 << 30)])
+    def test_size(self, spec, size):
+        self.assertEqual(parse_size(spec), size)
+
+
+class TestFakeMemcached(unittest.TestCase):
+    def setUp(self):
+        self.disabled = logging.root.manager.disable
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(self.disabled)
+        self.memcached.stop()
+
+    def client(self):
+        return Client(("localhost", self.memcached.port), connect_timeout=0.1, timeout=0.1, default_noreply=False)
+
+    def test_memory_cap_evicts_least_recently_used(self):
+        self.memcached = FakeMemcached(max_bytes=200).start()
+        client = self.client()
+        client.set("a", b"x" * 40)
+        client.set("b", b"x" * 40)
+        client.get("a")
+        client.set("c", b"x" * 40)
+        self.assertEqual(client.get_many(["a", "b", "c"]), {"a": b"x" * 40, "c": b"x" * 40})
+        stats = self.memcached.stats()
+        self.assertEqual(stats["evictions"], 1)
+        self.assertLessEqual(stats["bytes"], 200)
+        self.assertEqual(client.stats()[b"evictions"], 1)
+
+    def test_command_latency(self):
+        self.memcached = FakeMemcached(command_latency={"get": 0.05}).start()
+        client = self.client()
+        started = time.perf_counter()
+        client.set("a", b"1")
+        self.assertLess(time.perf_counter() - started, 0.05)
+        started = time.perf_counter()
+        client.get("a")
+        self.assertGreaterEqual(time.perf_counter() - started, 0.05)
+
+    def test_dropped_reply_is_a_cache_miss(self):
+        self.memcached = FakeMemcached(drop_rate=1.0).start()
+        self.memcached.preload({"uid:1": "3.0"})
+        store = Store(port=self.memcached.port)
+        self.assertIsNone(store.cache_get("uid:1"))
+        with self.assertRaises(MemoryError):
+            store.get("uid:1")
+        # two cache attempts for cache_get, then two more and three storage attempts for get
+        self.assertEqual(self.memcached.stats()["drops"], 2 + 2 + 3)
+
+    def test_resets_retried_by_store(self):
+        self.memcached = FakeMemcached(reset_rate=0.5, seed=3).start()
+        self.memcached.preload({"i:%s" % i: "[]" for i in range(20)})
+        store = Store(port=self.memcached.port)
+        values = []
+        for i in range(20):
+            try:
+                values.append(store.get("i:%s" % i))
+            except MemoryError:
+                pass
+        self.assertGreater(self.memcached.stats()["resets"], 0)
+        self.assertGreater(len(values), 10)
+        self.assertEqual(set(values), {b"[]"})
@@ -228,6 +228,49 @@ class TestArgumentsField(unittest.TestCase):
         self.assertEqual(self.nullable_field, value)
 
 
+class TestRequestSchema(unittest.TestCase):
+    def test_fields_in_definition_order(self):
+        self.assertEqual([f.label for f in api.MethodRequest._fields],
+                         ['account', 'login', 'token', 'arguments', 'method'])
+
+    def test_inherited_fields(self):
+        class ExtendedRequest(api.MethodRequest):
+            extra = api.CharField(required=True, nullable=False)
+
+        self.assertEqual([f.label for f in ExtendedRequest._fields],
+                         ['account', 'login', 'token', 'arguments', 'method', 'extra'])
+        with self.assertRaises(ValueError):
+            ExtendedRequest(login='a', token='b', arguments={}, method='m')
+        request = ExtendedRequest(login='a', token='b', arguments={}, method='m', extra='e')
+        self.assertEqual(request.fields, {'account': None, 'login': 'a', 'token': 'b', 'arguments': {},
+                                          'method': 'm', 'extra': 'e'})
+
+    def test_values_stored_in_slots(self):
+        request = api.OnlineScoreRequest(first_name='a', last_name='b')
+        self.assertFalse(hasattr(request, '__dict__'))
+        self.assertEqual(request.first_name, 'a')
+        self.assertIsNone(request.email)
+        self.assertEqual(request.fields['last_name'], 'b')
+
+    @cases([
+        ({}, ValueError),
+        ({'login': 'a', 'token': 'b', 'arguments': {}}, ValueError),
+        ({'login': 'a', 'token': 'b', 'arguments': {}, 'method': None}, ValueError),
+        ({'login': 1, 'token': 'b', 'arguments': {}, 'method': 'm'}, TypeError),
+        ({'login': 'a', 'token': 'b', 'arguments': [], 'method': 'm'}, TypeError),
+    ])
+    def test_invalid_method_request(self, kwargs, error):
+        with self.assertRaises(error):
+            api.MethodRequest(**kwargs)
+
+    def test_field_set_directly(self):
+        request = api.MethodRequest(login='a', token='b', arguments={}, method='m')
+        request.login = 'c'
+        self.assertEqual(request.login, 'c')
+        with self.assertRaises(ValueError):
+            request.method = None
+
+
 logging.disable(logging.ERROR)
 if __name__ == "__main__":
     unittest.main()
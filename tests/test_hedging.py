@@ -0,0 +1,123 @@
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock
+
+from api import hedge_workers
+from fake_memcached import FakeMemcached
+from hedging import HedgeBudget, HedgedClient, LatencyTracker
+from store import Store
+from tests.decorator import enable_logging
+enable_logging
+
+
+def slow(value, delay):
+    def call(arg):
+        time.sleep(delay)
+        return value
+    return call
+
+
+class TestHedging(unittest.TestCase):
+    def test_latency_percentile(self):
+        tracker = LatencyTracker(percentile=90, window=10, refresh=10)
+        for i in range(1, 10):
+            tracker.add(i)
+        self.assertIsNone(tracker.value)
+        tracker.add(10)
+        self.assertEqual(tracker.value, 10)
+        for i in range(1, 11):
+            tracker.add(i / 1000)
+        self.assertEqual(tracker.value, 0.01)
+
+    def test_budget(self):
+        budget = HedgeBudget(ratio=0.5, burst=1)
+        self.assertTrue(budget.withdraw())
+        self.assertFalse(budget.withdraw())
+        budget.deposit()
+        budget.deposit()
+        self.assertTrue(budget.withdraw())
+
+    def make_client(self, primary_delay, replica_delay=0, budget=1.0):
+        primary, replica = MagicMock(), MagicMock()
+        primary.get.side_effect = slow(b'primary', primary_delay)
+        replica.get.side_effect = slow(b'replica', replica_delay)
+        client = HedgedClient(primary, [replica], max_delay=0.01, budget=budget)
+        self.addCleanup(client.close)
+        return client, primary, replica
+
+    def test_fast_primary_not_hedged(self):
+        client, primary, replica = self.make_client(0)
+        self.assertEqual(client.get('k'), b'primary')
+        replica.get.assert_not_called()
+
+    def test_slow_primary_hedged(self):
+        client, primary, replica = self.make_client(0.2)
+        started = time.monotonic()
+        self.assertEqual(client.get('k'), b'replica')
+        self.assertLess(time.monotonic() - started, 0.1)
+        self.assertEqual({key: client.stats()[key] for key in ('reads', 'hedged', 'hedge_wins')},
+                         {'reads': 1, 'hedged': 1, 'hedge_wins': 1})
+
+    def test_failed_primary_answered_by_replica(self):
+        client, primary, replica = self.make_client(0)
+        primary.get.side_effect = ConnectionError('down')
+        self.assertEqual(client.get('k'), b'replica')
+
+    def test_budget_caps_hedges(self):
+        client, primary, replica = self.make_client(0.03)
+        client.budget = HedgeBudget(ratio=0, burst=1)
+        self.assertEqual(client.get('k'), b'replica')
+        self.assertEqual(client.get('k'), b'primary')
+        self.assertEqual(client.stats()['over_budget'], 1)
+
+    def test_latency_counts_wait_for_a_pool_thread(self):
+        primary = MagicMock()
+        primary.get.side_effect = slow(b'primary', 0.02)
+        client = HedgedClient(primary, [MagicMock()], budget=0, workers=1)
+        self.addCleanup(client.close)
+        client.budget = HedgeBudget(ratio=0, burst=0)
+        client.latencies = LatencyTracker(percentile=100, window=2, refresh=2)
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            for future in [executor.submit(client.get, 'k') for _ in range(2)]:
+                self.assertEqual(future.result(), b'primary')
+        # the second read waited for the first one to free the only thread
+        self.assertGreaterEqual(client.latencies.value, 0.035)
+
+    def test_writes_go_to_every_node(self):
+        enable_logging(self)
+        client, primary, replica = self.make_client(0)
+        replica.set.side_effect = ConnectionError('down')
+        with self.assertLogs(level='ERROR'):
+            client.set('k', 'v')
+        primary.set.assert_called_once_with('k', 'v')
+        replica.set.assert_called_once_with('k', 'v')
+
+
+class TestStoreReplicas(unittest.TestCase):
+    def test_pool_sized_from_request_threads(self):
+        opts = MagicMock(workers=64, hedge_workers=0, db_replicas='10.0.0.5:11211,10.0.0.6:11211,10.0.0.7:11211')
+        self.assertEqual(hedge_workers(opts), 192)
+        opts.db_replicas = '10.0.0.5:11211'
+        self.assertEqual(hedge_workers(opts), 128)
+        opts.workers = 0
+        self.assertEqual(hedge_workers(opts), 2)
+        opts.hedge_workers = 16
+        self.assertEqual(hedge_workers(opts), 16)
+
+    def test_store_hedges_slow_db_node(self):
+        cache, primary, replica = FakeMemcached().start(), FakeMemcached(latency=0.04).start(), FakeMemcached().start()
+        store = Store(port=primary.port, cache_servers=[('localhost', cache.port)],
+                      db_replicas=[('localhost', replica.port)], pool_size=2, hedge_max_delay=0.005, hedge_budget=1.0)
+        try:
+            store.set('i:1', '["books"]')
+            self.assertEqual(replica.stats()['curr_items'], 1)
+            started = time.monotonic()
+            self.assertEqual(store.get_many(['i:1']), {'i:1': b'["books"]'})
+            self.assertLess(time.monotonic() - started, 0.035)
+            self.assertEqual(store.hedge_stats()['hedge_wins'], 1)
+        finally:
+            store.close()
+            cache.stop()
+            primary.stop()
+            replica.stop()
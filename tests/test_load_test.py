@@ -0,0 +1,36 @@
+import json
+import unittest
+
+import api
+from benchmarks import load_test
+from tests.decorator import cases
+
+
+class TestLoadTest(unittest.TestCase):
+    def test_parse_mix(self):
+        self.assertEqual(load_test.parse_mix("online_score=3,admin"), {"online_score": 3.0, "admin": 1.0})
+        with self.assertRaises(ValueError):
+            load_test.parse_mix("unknown=1")
+
+    def test_make_requests_follow_mix(self):
+        requests = load_test.make_requests({"invalid": 1}, 5)
+        self.assertEqual([kind for kind, _, _ in requests], ["invalid"] * 5)
+        self.assertEqual({expected for _, _, expected in requests}, {api.INVALID_REQUEST})
+        self.assertEqual(json.loads(requests[0][1])["method"], "online_score")
+
+    def test_report(self):
+        results = [("admin", 0.01, True), ("admin", 0.03, False), ("invalid", 0.02, True)]
+        report = load_test.report(results, 1.0)
+        self.assertEqual(report["summary"]["requests"], 3)
+        self.assertEqual(report["summary"]["errors"], 1)
+        self.assertAlmostEqual(report["by_kind"]["admin"]["p999_ms"], 30)
+
+    @cases([
+        ({"rps": 100, "p99_ms": 10}, {"rps": 95, "p99_ms": 10.5}, []),
+        ({"rps": 100, "p99_ms": 10}, {"rps": 80, "p99_ms": 10}, ["rps"]),
+        ({"rps": 100, "p99_ms": 10}, {"rps": 120, "p99_ms": 12}, ["p99_ms"]),
+        ({"rps": 0, "p99_ms": 10}, {"rps": 10, "p99_ms": 5}, []),
+    ])
+    def test_compare(self, baseline, current, regressed):
+        regressions = load_test.compare({"summary": baseline}, {"summary": current}, 10)
+        self.assertEqual([message.split(":")[0] for message in regressions], regressed)
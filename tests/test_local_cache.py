@@ -0,0 +1,65 @@
+import logging
+import time
+import unittest
+from unittest.mock import patch
+
+from local_cache import LocalCache
+
+
+class TestLocalCache(unittest.TestCase):
+    def test_get_set(self):
+        cache = LocalCache()
+        self.assertIsNone(cache.get('key'))
+        cache.set('key', b'value')
+        self.assertEqual(cache.get('key'), b'value')
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_evicts_least_recently_used_by_entries(self):
+        cache = LocalCache(max_entries=2)
+        cache.set('a', b'1')
+        cache.set('b', b'2')
+        cache.get('a')
+        cache.set('c', b'3')
+        self.assertEqual(cache.get_many(['a', 'b', 'c']), {'a': b'1', 'c': b'3'})
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_evicts_by_bytes(self):
+        cache = LocalCache(max_entries=0, max_bytes=20)
+        cache.set('a', b'x' * 9)
+        cache.set('b', b'x' * 9)
+        self.assertEqual(cache.stats()['bytes'], 20)
+        cache.set('c', b'x' * 9)
+        self.assertEqual(cache.keys(), ['b', 'c'])
+        self.assertEqual(cache.stats()['bytes'], 20)
+
+    def test_too_large_value_not_cached(self):
+        cache = LocalCache(max_bytes=10)
+        cache.set('a', b'x' * 20)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(len(cache), 0)
+
+    def test_ttl_respects_shorter_expire(self):
+        cache = LocalCache(ttl=60)
+        now = time.monotonic()
+        cache.set('short', b'1', ttl=5)
+        cache.set('default', b'2')
+        cache.set('long', b'3', ttl=3600)
+        with patch('local_cache.time.monotonic', return_value=now + 10):
+            self.assertIsNone(cache.get('short'))
+            self.assertEqual(cache.get('default'), b'2')
+        with patch('local_cache.time.monotonic', return_value=now + 61):
+            self.assertIsNone(cache.get('long'))
+        self.assertEqual(cache.stats()['expirations'], 2)
+
+    def test_delete(self):
+        cache = LocalCache()
+        cache.set('a', b'1')
+        cache.delete('a')
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['bytes'], 0)
+
+
+logging.disable(logging.ERROR)
+if __name__ == '__main__':
+    unittest.main()
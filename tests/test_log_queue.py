@@ -0,0 +1,90 @@
+import logging
+import os
+import queue
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+import api
+import log_queue
+from log_queue import DroppingQueueHandler, SuccessSampler, setup_logging
+from tests.decorator import enable_logging
+enable_logging
+
+
+class TestLogQueue(unittest.TestCase):
+    def setUp(self):
+        enable_logging(self)
+        self.root = logging.getLogger()
+        self.handlers, self.level = self.root.handlers[:], self.root.level
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "api.log")
+
+    def tearDown(self):
+        for handler in self.root.handlers[:]:
+            self.root.removeHandler(handler)
+            handler.close()
+        for handler in self.handlers:
+            self.root.addHandler(handler)
+        self.root.setLevel(self.level)
+        log_queue._front = None
+        self.dir.cleanup()
+
+    def test_full_queue_drops(self):
+        handler = DroppingQueueHandler(queue.Queue(2))
+        logger = logging.Logger("test")
+        logger.addHandler(handler)
+        for i in range(5):
+            logger.info("request %s", i)
+        self.assertEqual(handler.dropped, 3)
+        self.assertEqual(handler.queue.qsize(), 2)
+
+    def test_records_queued_unformatted(self):
+        handler = DroppingQueueHandler(queue.Queue(2))
+        logger = logging.Logger("test")
+        logger.addHandler(handler)
+        logger.info("request %s", {"id": 1})
+        record = handler.queue.get_nowait()
+        self.assertEqual(record.msg, "request %s")
+        self.assertEqual(record.getMessage(), "request {'id': 1}")
+
+    def test_sampler_keeps_warnings(self):
+        sampler = SuccessSampler(0.0)
+        logger = logging.Logger("test")
+        self.assertFalse(sampler.filter(logger.makeRecord("test", logging.INFO, "", 0, "ok", (), None)))
+        self.assertTrue(sampler.filter(logger.makeRecord("test", logging.ERROR, "", 0, "error", (), None)))
+        self.assertEqual(sampler.sampled_out, 1)
+
+    def test_sampler_keeps_failed_requests(self):
+        sampler = SuccessSampler(0.0)
+        logger = logging.Logger("test")
+        for code, kept in ((200, False), (422, True), (500, True)):
+            record = logger.makeRecord("test", logging.INFO, "", 0, {"code": code}, (), None,
+                                       extra={"response_code": code})
+            self.assertEqual(sampler.filter(record), kept)
+        self.assertEqual(sampler.sampled_out, 1)
+
+    def test_queued_logging_written_by_listener(self):
+        listener = setup_logging(self.path, queue_size=100, sample_rate=0.0)
+        logging.info("sampled out")
+        logging.warning("slow request %s", 42)
+        listener.stop()
+        with open(self.path) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(len(lines), 1)
+        self.assertTrue(lines[0].endswith("W slow request 42"))
+        self.assertEqual(log_queue.log_stats(), {"queued": 0, "dropped": 0, "sampled_out": 1})
+
+    def test_synchronous_logging(self):
+        self.assertIsNone(setup_logging(self.path))
+        logging.info("request %s", 1)
+        with open(self.path) as f:
+            self.assertTrue(f.read().endswith("I request 1\n"))
+        self.assertEqual(log_queue.log_stats(), {})
+
+    def test_worker_listener_stopped_on_exit(self):
+        listener = MagicMock()
+        with patch.object(api, "worker_log_listener", listener):
+            with patch.object(api.MainHTTPHandler, "store", MagicMock()):
+                api.shutdown_worker(MagicMock(warmup_keys=None))
+        listener.stop.assert_called_once_with()
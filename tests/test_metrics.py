@@ -0,0 +1,99 @@
+import http.client
+import logging
+import threading
+import unittest
+
+import api
+from benchmarks.common import free_port, post, quiet, serve_in_thread, signed_request
+from metrics import Counter, Histogram, Registry
+from server import ListeningHTTPServer
+from store import Store
+
+
+class TestMetrics(unittest.TestCase):
+    def test_counter_sums_thread_shards(self):
+        counter = Counter('requests_total', 'Requests.', ('code',))
+
+        def work():
+            for _ in range(1000):
+                counter.inc(200)
+            counter.inc(404, value=2)
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(counter.values(), {(200,): 4000, (404,): 8})
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram('duration_seconds', 'Duration.', buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value)
+        self.assertEqual(list(histogram.samples()), [
+            'duration_seconds_bucket{le="0.1"} 2',
+            'duration_seconds_bucket{le="1.0"} 3',
+            'duration_seconds_bucket{le="+Inf"} 4',
+            'duration_seconds_sum 2.65',
+            'duration_seconds_count 4',
+        ])
+
+    def test_render(self):
+        registry = Registry()
+        registry.counter('errors_total', 'Errors.', ('message',)).inc('say "hi"\n')
+        registry.gauge('queue', 'Queue.', ('stat',), lambda: {('size',): 3})
+        self.assertEqual(registry.render(), '\n'.join([
+            '# HELP errors_total Errors.',
+            '# TYPE errors_total counter',
+            'errors_total{message="say \\"hi\\"\\n"} 1',
+            '# HELP queue Queue.',
+            '# TYPE queue gauge',
+            'queue{stat="size"} 3',
+        ]) + '\n')
+
+    def test_duplicate_name_rejected(self):
+        registry = Registry()
+        registry.counter('errors_total', 'Errors.')
+        with self.assertRaises(ValueError):
+            registry.counter('errors_total', 'Errors.')
+
+
+class TestMetricsEndpoint(unittest.TestCase):
+    def setUp(self):
+        self.disabled = logging.root.manager.disable
+        logging.disable(logging.CRITICAL)
+        self.port = free_port()
+        self.store = api.MainHTTPHandler.store
+        api.MainHTTPHandler.store = Store(l1_entries=10)
+        self.server = ListeningHTTPServer(("localhost", self.port), quiet(api.MainHTTPHandler))
+        serve_in_thread(self.server)
+
+    def tearDown(self):
+        logging.disable(self.disabled)
+        self.server.shutdown()
+        self.server.server_close()
+        api.MainHTTPHandler.store.close()
+        api.MainHTTPHandler.store = self.store
+
+    def get(self, path):
+        conn = http.client.HTTPConnection("localhost", self.port, timeout=5)
+        try:
+            conn.request("GET", path)
+            response = conn.getresponse()
+            return response.status, response.getheader("Content-Type"), response.read().decode()
+        finally:
+            conn.close()
+
+    def test_metrics(self):
+        before = api.METHOD_REQUESTS.values().get(("online_score", api.INVALID_REQUEST), 0)
+        post(self.port, signed_request("online_score", {"phone": "79175002040"}))
+        status, content_type, text = self.get("/metrics")
+        self.assertEqual(status, api.OK)
+        self.assertTrue(content_type.startswith("text/plain"))
+        self.assertIn('method_requests_total{method="online_score",code="422"} %s' % (before + 1), text)
+        self.assertIn('# TYPE http_request_duration_seconds histogram', text)
+        self.assertIn('store_local_cache{stat="entries"} 0', text)
+
+    def test_unknown_path(self):
+        status, _, text = self.get("/status")
+        self.assertEqual(status, api.NOT_FOUND)
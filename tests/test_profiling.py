@@ -0,0 +1,111 @@
+import logging
+import os
+import pstats
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import api
+from benchmarks.common import free_port, post, quiet, serve_in_thread, signed_request
+from profiling import SampledProfiler, format_timings, mark
+from server import ListeningHTTPServer
+from store import Store
+from tests.decorator import enable_logging
+enable_logging
+
+
+def busy():
+    return sum(range(1000))
+
+
+class TestPhaseTimings(unittest.TestCase):
+    def setUp(self):
+        enable_logging(self)
+
+    def test_mark_accumulates(self):
+        ctx = {}
+        started = time.perf_counter() - 0.002
+        now = mark(ctx, 'auth', started)
+        mark(ctx, 'auth', now - 0.001)
+        self.assertGreaterEqual(ctx['timings']['auth'], 3.0)
+        self.assertEqual(format_timings({'read': 1, 'auth': 0.25}), 'read=1.00ms auth=0.25ms')
+
+    def test_method_handler_phases(self):
+        ctx = {}
+        request = signed_request("online_score", {"phone": "79175002040"})
+        with self.assertLogs(level=logging.ERROR):
+            _, code = api.method_handler({"body": request, "headers": {}}, ctx, Store())
+        self.assertEqual(code, api.INVALID_REQUEST)
+        self.assertEqual(list(ctx['timings']), ['validate', 'auth'])
+
+
+class TestSampledProfiler(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'profile-{pid}.prof')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_samples_one_in_every(self):
+        profiler = SampledProfiler(every=3, path=self.path, dump_interval=3600)
+        for _ in range(7):
+            with profiler.sample():
+                busy()
+        self.assertEqual(profiler.samples, 2)
+        self.assertFalse(os.listdir(self.dir.name))
+        profiler.dump()
+        stats = pstats.Stats(self.path.format(pid=os.getpid()))
+        calls = [v[0] for k, v in stats.stats.items() if k[2] == 'busy']
+        self.assertEqual(calls, [2])
+
+    def test_periodic_dump(self):
+        profiler = SampledProfiler(every=1, path=self.path, dump_interval=0)
+        with profiler.sample():
+            busy()
+        self.assertTrue(os.path.exists(self.path.format(pid=os.getpid())))
+
+    def test_overlapping_samples_profile_one_request(self):
+        profiler = SampledProfiler(every=1, path=self.path, dump_interval=3600)
+        barrier = threading.Barrier(4)
+
+        def request():
+            with profiler.sample():
+                barrier.wait(timeout=5)
+                busy()
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            for future in [executor.submit(request) for _ in range(4)]:
+                future.result()
+        self.assertEqual(profiler.samples, 1)
+        with profiler.sample():
+            busy()
+        self.assertEqual(profiler.samples, 2)
+
+
+class TestSlowRequestLog(unittest.TestCase):
+    def setUp(self):
+        enable_logging(self)
+        self.port = free_port()
+        self.server = ListeningHTTPServer(("localhost", self.port), quiet(api.MainHTTPHandler))
+        serve_in_thread(self.server)
+
+    def tearDown(self):
+        api.MainHTTPHandler.slow_request_threshold = None
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_slow_request_logged_with_phases(self):
+        api.MainHTTPHandler.slow_request_threshold = 0
+        with self.assertLogs(level=logging.WARNING) as logs:
+            post(self.port, signed_request("online_score", {"phone": "79175002040"}))
+            # the response is sent before the request is logged
+            deadline = time.monotonic() + 2
+            while not any("Slow request" in line for line in logs.output) and time.monotonic() < deadline:
+                time.sleep(0.01)
+        message = [line for line in logs.output if "Slow request" in line][0]
+        self.assertIn("Slow request /method", message)
+        for phase in ("read", "decode", "validate", "auth", "serialize", "write"):
+            self.assertIn(phase + "=", message)
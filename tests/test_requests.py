@@ -1,7 +1,9 @@
 import hashlib
 import json
 import logging
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from types import SimpleNamespace
 import unittest
 from store import Store
 from unittest import mock
@@ -124,7 +126,7 @@ class TestSuite(unittest.TestCase):
         {"client_ids": [1, 2], "date": "19.07.2017"},
         {"client_ids": [0]},
     ])
-    @mock.patch('store.Store.get', return_value='["interests"]')
+    @mock.patch('store.Store.get_many', side_effect=lambda keys: {key: '["interests"]' for key in keys})
     def test_valid_interests_request(self, arguments, *mocked):
         request = {"account": "horns&hoofs", "login": "h&f", "method": "clients_interests", "arguments": arguments}
         self.set_valid_auth(request)
@@ -135,6 +137,147 @@ class TestSuite(unittest.TestCase):
                             for v in response.values()))
         self.assertEqual(self.context.get("nclients"), len(arguments["client_ids"]))
 
+    @mock.patch('store.Store.get_many', side_effect=MemoryError('storage is down'))
+    def test_interests_request_storage_error(self, *mocked):
+        request = {"account": "horns&hoofs", "login": "h&f", "method": "clients_interests",
+                   "arguments": {"client_ids": [1, 2]}}
+        self.set_valid_auth(request)
+        _, code = self.get_response(request)
+        self.assertEqual(api.INTERNAL_ERROR, code)
+
+
+class TestBatch(unittest.TestCase):
+    set_valid_auth = TestSuite.set_valid_auth
+
+    def setUp(self):
+        self.context = {}
+        self.headers = {}
+        self.store = Store()
+
+    def get_response(self, items, max_size=api.MAX_BATCH_SIZE):
+        return api.batch_handler({"body": items, "headers": self.headers}, self.context, self.store, max_size)
+
+    def make_request(self, method, arguments, login="h&f"):
+        request = {"account": "horns&hoofs", "login": login, "method": method, "arguments": arguments}
+        self.set_valid_auth(request)
+        return request
+
+    @cases([{}, [], "batch", None])
+    def test_invalid_batch(self, items):
+        response, code = self.get_response(items)
+        self.assertEqual(api.INVALID_REQUEST, code)
+        self.assertTrue(len(response))
+
+    def test_batch_too_large(self):
+        items = [self.make_request("online_score", {"first_name": "a", "last_name": "b"})] * 3
+        response, code = self.get_response(items, max_size=2)
+        self.assertEqual(api.INVALID_REQUEST, code)
+        self.assertTrue(len(response))
+
+    @mock.patch('store.Store.cache_get_many', return_value={})
+    @mock.patch('store.Store.cache_set_many')
+    @mock.patch('store.Store.get_many', side_effect=lambda keys: {key: '["%s"]' % key for key in keys})
+    def test_mixed_batch(self, mocked_get_many, mocked_cache_set_many, mocked_cache_get_many):
+        items = [
+            self.make_request("online_score", {"phone": "79175002040", "email": "stupnikov@otus.ru"}),
+            self.make_request("clients_interests", {"client_ids": [1, 2]}),
+            self.make_request("online_score", {"first_name": "a", "last_name": "b"}),
+            self.make_request("clients_interests", {"client_ids": [2, 3]}),
+            self.make_request("online_score", {"phone": "79175002040", "email": "stupnikov@otus.ru"}, login="admin"),
+            {"account": "horns&hoofs", "login": "h&f", "method": "online_score", "token": "", "arguments": {}},
+            self.make_request("online_score", {"phone": "79175002040"}),
+            [],
+        ]
+        response, code = self.get_response(items)
+        self.assertEqual(api.OK, code)
+        self.assertEqual([r["code"] for r in response], [api.OK, api.OK, api.OK, api.OK, api.OK, api.FORBIDDEN,
+                                                         api.INVALID_REQUEST, api.INVALID_REQUEST])
+        self.assertEqual(response[0]["response"], {"score": 3.0})
+        self.assertEqual(response[1]["response"], {1: ["i:1"], 2: ["i:2"]})
+        self.assertEqual(response[2]["response"], {"score": 0.5})
+        self.assertEqual(response[3]["response"], {2: ["i:2"], 3: ["i:3"]})
+        self.assertEqual(response[4]["response"], {"score": 42})
+        mocked_get_many.assert_called_once()
+        self.assertEqual(sorted(mocked_get_many.call_args[0][0]), ["i:1", "i:2", "i:3"])
+        mocked_cache_get_many.assert_called_once()
+        mocked_cache_set_many.assert_called_once()
+        self.assertEqual(len(mocked_cache_set_many.call_args[0][0]), 2)
+
+    @mock.patch('store.Store.cache_get_many', return_value={})
+    @mock.patch('store.Store.cache_set_many')
+    def test_auth_checked_once_per_credentials(self, *mocked):
+        items = [self.make_request("online_score", {"first_name": "a", "last_name": "b"})] * 5
+        with mock.patch('api.check_auth', wraps=api.check_auth) as mocked_check_auth:
+            response, code = self.get_response(items)
+        self.assertEqual(api.OK, code)
+        self.assertTrue(all(r["code"] == api.OK for r in response))
+        mocked_check_auth.assert_called_once()
+
+    @mock.patch('store.Store.cache_get_many', return_value={})
+    @mock.patch('store.Store.cache_set_many')
+    @mock.patch('store.Store.get_many', side_effect=MemoryError('storage is down'))
+    def test_storage_error(self, *mocked):
+        items = [
+            self.make_request("clients_interests", {"client_ids": [1]}),
+            self.make_request("online_score", {"first_name": "a", "last_name": "b"}),
+        ]
+        response, code = self.get_response(items)
+        self.assertEqual(api.OK, code)
+        self.assertEqual([r["code"] for r in response], [api.INTERNAL_ERROR, api.OK])
+
+
+class TestAuthVerifier(unittest.TestCase):
+    def setUp(self):
+        self.verifier = api.AuthVerifier(max_entries=2)
+
+    def make_request(self, login, token, account="horns&hoofs"):
+        return SimpleNamespace(account=account, login=login, token=token, is_admin=login == api.ADMIN_LOGIN)
+
+    def user_token(self, login, account="horns&hoofs"):
+        return hashlib.sha512((account + login + api.SALT).encode()).hexdigest()
+
+    def admin_token(self, hour):
+        return hashlib.sha512((hour.strftime("%Y%m%d%H") + api.ADMIN_SALT).encode()).hexdigest()
+
+    def test_user_digest_is_cached_after_success(self):
+        request = self.make_request("h&f", self.user_token("h&f"))
+        self.assertTrue(self.verifier.check(request))
+        self.assertTrue(self.verifier.check(request))
+        self.assertEqual((1, 1), (self.verifier.hits, self.verifier.misses))
+
+    def test_counters_from_many_threads(self):
+        request = self.make_request("h&f", "bad")
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda _: self.verifier.check(request), range(400)))
+        self.assertEqual(self.verifier.stats()["misses"], 400)
+
+    @cases([None, "", "bad"])
+    def test_invalid_user_token(self, token):
+        self.assertFalse(self.verifier.check(self.make_request("h&f", token)))
+        self.assertFalse(self.verifier.check(self.make_request("h&f", token)))
+        self.assertEqual(0, self.verifier.stats()["entries"])
+
+    def test_cache_is_bounded(self):
+        for login in ("a", "b", "c"):
+            self.assertTrue(self.verifier.check(self.make_request(login, self.user_token(login))))
+        self.assertEqual(2, self.verifier.stats()["entries"])
+        self.assertTrue(self.verifier.check(self.make_request("a", self.user_token("a"))))
+        self.assertEqual(0, self.verifier.hits)
+
+    def test_admin_token(self):
+        hour = datetime.now()
+        self.assertTrue(self.verifier.check(self.make_request(api.ADMIN_LOGIN, self.admin_token(hour))))
+        self.assertFalse(self.verifier.check(self.make_request(api.ADMIN_LOGIN, None)))
+        stale = self.admin_token(hour - timedelta(hours=2))
+        self.assertFalse(self.verifier.check(self.make_request(api.ADMIN_LOGIN, stale)))
+
+    def test_previous_admin_token_within_grace(self):
+        previous = self.admin_token(datetime.now() - timedelta(hours=1))
+        self.verifier.admin_grace = 3600
+        self.assertTrue(self.verifier.check(self.make_request(api.ADMIN_LOGIN, previous)))
+        self.verifier.admin_grace = 0
+        self.assertFalse(self.verifier.check(self.make_request(api.ADMIN_LOGIN, previous)))
+
 
 logging.disable(logging.ERROR)
 if __name__ == "__main__":
@@ -0,0 +1,274 @@
+import http.client
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler
+from unittest.mock import patch
+
+import api
+import scoring
+from benchmarks.common import free_port, post, quiet, serve_in_thread, signed_request, wait_for_port
+from fake_memcached import FakeMemcached
+from server import ListeningHTTPServer, PooledHTTPServer, PreforkServer
+from store import Store
+from tests.decorator import cases
+
+
+class TestThreadSafeStore(unittest.TestCase):
+    def setUp(self):
+        self.memcached = FakeMemcached().start()
+        self.store = Store(port=self.memcached.port)
+
+    def tearDown(self):
+        self.store.close()
+        self.memcached.stop()
+
+    def test_store_shared_between_threads(self):
+        def worker(n):
+            for i in range(50):
+                key = 'k:%s:%s' % (n, i)
+                self.store.set(key, str(i))
+                if self.store.get(key) != str(i).encode():
+                    return False
+            return True
+
+        threads = 8
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            self.assertTrue(all(executor.map(worker, range(threads))))
+
+
+class TestPooledHTTPServer(unittest.TestCase):
+    def setUp(self):
+        self.memcached = FakeMemcached(latency=0.03).start()
+        self.memcached.preload({'i:1': '["books"]'})
+        self.store, api.MainHTTPHandler.store = api.MainHTTPHandler.store, Store(port=self.memcached.port)
+        self.port = free_port()
+        self.server = PooledHTTPServer(('localhost', self.port), quiet(api.MainHTTPHandler), workers=4)
+        serve_in_thread(self.server)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        api.MainHTTPHandler.store.close()
+        api.MainHTTPHandler.store = self.store
+        self.memcached.stop()
+
+    def test_requests_served_concurrently(self):
+        body = signed_request('clients_interests', {'client_ids': [1, 1, 1]})
+        barrier = threading.Barrier(4)
+
+        def worker(_):
+            barrier.wait()
+            return post(self.port, body)
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(worker, range(4)))
+        elapsed = time.monotonic() - started
+        self.assertTrue(all(code == api.OK for code, _ in results))
+        self.assertEqual(results[0][1]['response'], {'1': ['books']})
+        self.assertLess(elapsed, 4 * 3 * 0.03)
+
+
+class TestKeepAlive(unittest.TestCase):
+    def setUp(self):
+        self.disabled = logging.root.manager.disable
+        logging.disable(logging.CRITICAL)
+        self.port = free_port()
+        api.MainHTTPHandler.keepalive_timeout = 0.5
+        api.MainHTTPHandler.keepalive_requests = 3
+        self.server = PooledHTTPServer(('localhost', self.port), quiet(api.MainHTTPHandler), workers=2)
+        serve_in_thread(self.server)
+        self.body = signed_request('online_score', {'first_name': 'a', 'last_name': 'b'}, login='admin')
+        self.body['token'] = api.admin_digest(datetime.now()).decode()
+
+    def tearDown(self):
+        logging.disable(self.disabled)
+        api.MainHTTPHandler.keepalive_timeout = 0
+        api.MainHTTPHandler.keepalive_requests = 100
+        self.server.shutdown()
+        self.server.server_close()
+
+    def connect(self):
+        sock = socket.create_connection(('localhost', self.port), timeout=5)
+        self.addCleanup(sock.close)
+        return sock
+
+    def request(self, body=None):
+        data = json.dumps(body or self.body).encode()
+        return b'POST /method HTTP/1.1\r\nHost: localhost\r\nContent-Length: %d\r\n\r\n%s' % (len(data), data)
+
+    def read_responses(self, sock, count):
+        responses = []
+        reader = sock.makefile('rb')
+        self.addCleanup(reader.close)
+        for _ in range(count):
+            status = int(reader.readline().split()[1])
+            headers = http.client.parse_headers(reader)
+            body = reader.read(int(headers['Content-Length']))
+            responses.append((status, headers.get('Connection'), json.loads(body)))
+        return responses
+
+    def test_connection_reused_up_to_cap(self):
+        sock = self.connect()
+        results = []
+        for _ in range(3):
+            sock.sendall(self.request())
+            results.extend(self.read_responses(sock, 1))
+        self.assertEqual([status for status, _, _ in results], [api.OK] * 3)
+        self.assertEqual([connection for _, connection, _ in results], [None, None, 'close'])
+        self.assertEqual(results[0][2]['response'], {'score': 42})
+        self.assertEqual(sock.recv(1), b'')
+
+    def test_pipelined_requests(self):
+        sock = self.connect()
+        sock.sendall(self.request() + self.request({'method': 'online_score'}))
+        results = self.read_responses(sock, 2)
+        self.assertEqual([status for status, _, _ in results], [api.OK, api.INVALID_REQUEST])
+
+    def test_idle_connection_closed(self):
+        sock = self.connect()
+        sock.sendall(self.request())
+        self.read_responses(sock, 1)
+        started = time.monotonic()
+        self.assertEqual(sock.recv(1), b'')
+        self.assertLess(time.monotonic() - started, 2)
+
+    def test_content_length_sent(self):
+        conn = http.client.HTTPConnection('localhost', self.port, timeout=5)
+        self.addCleanup(conn.close)
+        for _ in range(2):
+            status, _ = post(self.port, self.body, conn=conn)
+            self.assertEqual(status, api.OK)
+        conn.request('GET', '/metrics')
+        response = conn.getresponse()
+        self.assertEqual(int(response.getheader('Content-Length')), len(response.read()))
+
+
+class TestStreaming(unittest.TestCase):
+    def setUp(self):
+        self.disabled = logging.root.manager.disable
+        logging.disable(logging.CRITICAL)
+        self.memcached = FakeMemcached().start()
+        self.memcached.preload({'i:%s' % cid: '["i%s"]' % cid for cid in range(1, 6)})
+        self.store, api.MainHTTPHandler.store = api.MainHTTPHandler.store, Store(port=self.memcached.port)
+        api.MainHTTPHandler.keepalive_timeout = 0.5
+        api.MainHTTPHandler.stream_batch_size = 2
+        self.port = free_port()
+        self.server = PooledHTTPServer(('localhost', self.port), quiet(api.MainHTTPHandler), workers=2)
+        serve_in_thread(self.server)
+        self.body = signed_request('clients_interests', {'client_ids': [1, 2, 3, 2, 4, 5]})
+
+    def tearDown(self):
+        logging.disable(self.disabled)
+        api.MainHTTPHandler.keepalive_timeout = 0
+        api.MainHTTPHandler.stream_batch_size = api.STREAM_BATCH_SIZE
+        self.server.shutdown()
+        self.server.server_close()
+        api.MainHTTPHandler.store.close()
+        api.MainHTTPHandler.store = self.store
+        self.memcached.stop()
+
+    def post(self, body, conn, accept=api.NDJSON_CONTENT_TYPE):
+        conn.request('POST', '/method', body=json.dumps(body), headers={'Accept': accept})
+        response = conn.getresponse()
+        return response, response.read()
+
+    def test_interests_streamed_in_chunks(self):
+        conn = http.client.HTTPConnection('localhost', self.port, timeout=5)
+        self.addCleanup(conn.close)
+        with patch('scoring.get_interests_many', wraps=scoring.get_interests_many) as get_many:
+            response, data = self.post(self.body, conn)
+        self.assertEqual(response.status, api.OK)
+        self.assertEqual(response.getheader('Transfer-Encoding'), 'chunked')
+        self.assertEqual(response.getheader('Content-Type'), api.NDJSON_CONTENT_TYPE)
+        self.assertEqual([json.loads(line) for line in data.splitlines()],
+                         [{'client_id': cid, 'interests': ['i%s' % cid]} for cid in range(1, 6)])
+        self.assertEqual([call.args[1] for call in get_many.call_args_list], [[1, 2], [3, 4], [5]])
+        # the connection stays usable after the last chunk
+        response, data = self.post(self.body, conn, accept='application/json')
+        self.assertEqual(json.loads(data)['response'], {str(cid): ['i%s' % cid] for cid in range(1, 6)})
+
+    def test_storage_error_ends_stream_with_error_line(self):
+        conn = http.client.HTTPConnection('localhost', self.port, timeout=5)
+        self.addCleanup(conn.close)
+        with patch('scoring.get_interests_many', side_effect=[{1: [], 2: []}, MemoryError('down')]):
+            response, data = self.post(self.body, conn)
+        lines = [json.loads(line) for line in data.splitlines()]
+        self.assertEqual(response.status, api.OK)
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(lines[-1], {'error': 'Internal Server Error', 'code': api.INTERNAL_ERROR})
+
+    def test_invalid_request_not_streamed(self):
+        conn = http.client.HTTPConnection('localhost', self.port, timeout=5)
+        self.addCleanup(conn.close)
+        response, data = self.post({**self.body, 'token': 'bad'}, conn)
+        self.assertEqual((response.status, json.loads(data)['code']), (api.FORBIDDEN, api.FORBIDDEN))
+        self.assertIsNone(response.getheader('Transfer-Encoding'))
+
+
+class PidHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(str(os.getpid()).encode())
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run_prefork(port, started, reuse_port):
+    server = PreforkServer(lambda: ListeningHTTPServer(('localhost', port), PidHandler, bind_and_activate=False),
+                           processes=2, reuse_port=reuse_port, child_init=lambda: started.put(os.getpid()))
+    server.restart_delay = 0.1
+    server.serve_forever()
+
+
+class TestPreforkServer(unittest.TestCase):
+    def get_pid(self, port):
+        conn = http.client.HTTPConnection('localhost', port, timeout=5)
+        try:
+            conn.request('GET', '/')
+            return int(conn.getresponse().read())
+        finally:
+            conn.close()
+
+    @cases([False, True])
+    def test_children_served_and_restarted(self, reuse_port):
+        ctx = multiprocessing.get_context('fork')
+        started = ctx.Queue()
+        port = free_port()
+        parent = ctx.Process(target=run_prefork, args=(port, started, reuse_port))
+        parent.start()
+        try:
+            children = {started.get(timeout=5), started.get(timeout=5)}
+            wait_for_port(port)
+            self.assertIn(self.get_pid(port), children)
+
+            killed = children.pop()
+            os.kill(killed, signal.SIGKILL)
+            restarted = started.get(timeout=5)
+            self.assertNotIn(restarted, children | {killed})
+            children.add(restarted)
+            for _ in range(5):
+                self.assertIn(self.get_pid(port), children)
+        finally:
+            parent.terminate()
+            parent.join(5)
+        self.assertEqual(parent.exitcode, 0)
+        for pid in children:
+            with self.assertRaises(ProcessLookupError):
+                os.kill(pid, 0)
+
+
+logging.disable(logging.ERROR)
+if __name__ == '__main__':
+    unittest.main()
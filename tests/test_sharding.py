@@ -0,0 +1,78 @@
+import time
+import unittest
+from collections import Counter
+from unittest.mock import MagicMock
+
+from fake_memcached import FakeMemcached
+from sharding import HashRing, ShardedClient, parse_servers
+from store import Store
+from tests.decorator import cases
+
+KEYS = ['i:%s' % i for i in range(10000)]
+
+
+class TestHashRing(unittest.TestCase):
+    def test_parse_servers(self):
+        self.assertEqual(parse_servers('a:11212, b'), [('a', 11212), ('b', 11211)])
+
+    def test_keys_spread_evenly(self):
+        ring = HashRing(['a:1', 'b:1', 'c:1', 'd:1'])
+        shares = Counter(ring.get_node(key) for key in KEYS)
+        self.assertEqual(set(shares), {'a:1', 'b:1', 'c:1', 'd:1'})
+        for count in shares.values():
+            self.assertLess(abs(count - 2500), 2500 * 0.25)
+
+    def test_ring_independent_of_node_order(self):
+        first, second = HashRing(['a:1', 'b:1', 'c:1']), HashRing(['c:1', 'a:1', 'b:1'])
+        self.assertTrue(all(first.get_node(key) == second.get_node(key) for key in KEYS[:1000]))
+
+    @cases([(['a:1', 'b:1', 'c:1'], ['a:1', 'b:1', 'c:1', 'd:1']),
+            (['a:1', 'b:1', 'c:1', 'd:1'], ['a:1', 'c:1', 'd:1'])])
+    def test_resize_moves_only_keys_of_changed_node(self, before, after):
+        old, new = HashRing(before), HashRing(after)
+        changed = set(before) ^ set(after)
+        moved = [key for key in KEYS if old.get_node(key) != new.get_node(key)]
+        self.assertTrue(all(old.get_node(key) in changed or new.get_node(key) in changed for key in moved))
+        self.assertLess(len(moved) / len(KEYS), 1.5 / len(max(before, after, key=len)))
+
+    def test_split_keeps_order(self):
+        ring = HashRing(['a:1', 'b:1'])
+        groups = ring.split(KEYS[:100])
+        self.assertEqual(sorted(sum(groups.values(), [])), sorted(KEYS[:100]))
+        for group in groups.values():
+            self.assertEqual(group, sorted(group, key=KEYS.index))
+
+
+class TestShardedClient(unittest.TestCase):
+    def test_node_errors_raised_after_all_parts(self):
+        good, bad = MagicMock(), MagicMock()
+        good.get_many.side_effect = lambda keys: {key: b'1' for key in keys}
+        bad.get_many.side_effect = ConnectionError('down')
+        client = ShardedClient({'a:1': good, 'b:1': bad})
+        with self.assertRaises(ConnectionError):
+            client.get_many(KEYS[:50])
+        good.get_many.assert_called_once()
+        client.close()
+
+    def test_store_spreads_keys_over_nodes(self):
+        nodes = [FakeMemcached(latency=0.02).start() for _ in range(3)]
+        servers = [('localhost', node.port) for node in nodes]
+        store = Store(cache_servers=servers, db_servers=servers, pool_size=2)
+        try:
+            values = {key: str(i) for i, key in enumerate(KEYS[:60])}
+            store.cache_set_many(values)
+            self.assertEqual(sum(node.stats()['curr_items'] for node in nodes), 60)
+            self.assertTrue(all(node.stats()['curr_items'] for node in nodes))
+            started = time.monotonic()
+            found = store.get_many(list(values))
+            # nodes are read in parallel, so the latency is paid about once
+            self.assertLess(time.monotonic() - started, 0.05)
+            self.assertEqual(found, {key: value.encode() for key, value in values.items()})
+            store.set('i:1', 'db')
+            self.assertEqual(store.get('i:1'), b'db')
+            self.assertEqual(set(store.pool_stats()), {'%s localhost:%s' % (role, node.port)
+                                                       for role in ('cache', 'db') for node in nodes})
+        finally:
+            store.close()
+            for node in nodes:
+                node.stop()
@@ -0,0 +1,89 @@
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+
+import scoring
+from fake_memcached import FakeMemcached
+from single_flight import SingleFlight
+from store import Store
+
+
+class TestSingleFlight(unittest.TestCase):
+    def run_concurrently(self, flights, func, callers=8):
+        started = threading.Barrier(callers)
+
+        def call():
+            started.wait()
+            return flights.do('key', func)
+
+        with ThreadPoolExecutor(callers) as executor:
+            futures = [executor.submit(call) for _ in range(callers)]
+        return futures
+
+    def test_concurrent_calls_share_result(self):
+        flights = SingleFlight()
+        func = MagicMock(side_effect=lambda: time.sleep(0.1) or 42)
+        futures = self.run_concurrently(flights, func)
+        self.assertEqual([future.result() for future in futures], [42] * 8)
+        func.assert_called_once()
+        self.assertEqual(flights.stats(), {'in_flight': 0, 'calls': 1, 'shared': 7, 'timeouts': 0})
+
+    def test_error_propagated_to_waiters(self):
+        flights = SingleFlight()
+
+        def failing():
+            time.sleep(0.1)
+            raise MemoryError('storage is down')
+
+        futures = self.run_concurrently(flights, failing, callers=4)
+        for future in futures:
+            self.assertIsInstance(future.exception(), MemoryError)
+        self.assertEqual(flights.stats()['calls'], 1)
+
+    def test_waiter_runs_call_after_timeout(self):
+        flights = SingleFlight(timeout=0.05)
+        release = threading.Event()
+        leader = threading.Thread(target=flights.do, args=('key', release.wait))
+        leader.start()
+        time.sleep(0.02)
+        self.assertEqual(flights.do('key', lambda: 'own'), 'own')
+        release.set()
+        leader.join()
+        self.assertEqual(flights.stats()['timeouts'], 1)
+
+    def test_sequential_calls_not_shared(self):
+        flights = SingleFlight()
+        func = MagicMock(return_value=1)
+        flights.do('key', func)
+        flights.do('key', func)
+        self.assertEqual(func.call_count, 2)
+
+
+class TestCoalescedReads(unittest.TestCase):
+    def setUp(self):
+        self.memcached = FakeMemcached(latency=0.03).start()
+        # pooled clients wait for set replies, so the computation outlasts the other misses
+        self.store = Store(port=self.memcached.port, pool_size=4)
+
+    def tearDown(self):
+        self.store.close()
+        self.memcached.stop()
+
+    def test_store_get_coalesced(self):
+        self.memcached.preload({'i:1': b'["books"]'})
+        with patch.object(self.store, '_db_client', wraps=self.store._db_client) as db_client:
+            with patch.object(self.store, 'cache_get', return_value=None):
+                with ThreadPoolExecutor(4) as executor:
+                    values = list(executor.map(lambda _: self.store.get('i:1'), range(4)))
+        self.assertEqual(values, [b'["books"]'] * 4)
+        self.assertEqual(db_client.get.call_count, 1)
+
+    def test_get_score_miss_computed_once(self):
+        profile = {'phone': '79175002040', 'email': 'stupnikov@otus.ru'}
+        with patch('scoring.compute_score', wraps=scoring.compute_score) as compute:
+            with ThreadPoolExecutor(4) as executor:
+                scores = list(executor.map(lambda _: scoring.get_score(self.store, **profile), range(4)))
+        self.assertEqual(scores, [3.0] * 4)
+        self.assertEqual(compute.call_count, 1)
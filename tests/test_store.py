@@ -1,6 +1,7 @@
 import logging
 import time
 import unittest
+from fake_memcached import FakeMemcached
 from store import Store
 from mockcache import Client as MockClient
 from unittest.mock import patch
@@ -52,6 +53,12 @@ class TestStoreCacheMethods(unittest.TestCase):
         self.assertEqual(store.get(key), value)
         mocked_cache_get.assert_called_once_with(key)
 
+    @patch('store.Store.cache_get_many', return_value={})
+    def test_get_many_disconnected(self, mocked_cache_get_many):
+        store = Store(port='8080')
+        with self.assertRaises(MemoryError):
+            store.get_many(['some_key'])
+
     @patch('store.Store.cache_get', return_value=None)
     def test_get_disconnected(self, mocked_cache_get):
         store = Store(port='8080')
@@ -61,6 +68,74 @@ class TestStoreCacheMethods(unittest.TestCase):
         mocked_cache_get.assert_called_once_with(key)
 
 
+class TestStoreManyMethods(unittest.TestCase):
+    def setUp(self):
+        self.memcached = FakeMemcached().start()
+        self.store = Store(port=self.memcached.port)
+
+    def tearDown(self):
+        self.store.close()
+        self.memcached.stop()
+
+    def test_get_many_cache_hit_and_miss(self):
+        self.memcached.preload({'cached': 'cache_value', 'stored': 'db_value'})
+        with patch.object(self.store, 'cache_get_many', return_value={'cached': b'cache_value'}) as mocked:
+            res = self.store.get_many(['cached', 'stored', 'missing'])
+        mocked.assert_called_once_with(['cached', 'stored', 'missing'])
+        self.assertEqual(res, {'cached': b'cache_value', 'stored': b'db_value'})
+
+    def test_get_many_one_round_trip_per_role(self):
+        cache = FakeMemcached().start()
+        self.addCleanup(cache.stop)
+        store = Store(port=self.memcached.port, cache_servers=[('localhost', cache.port)])
+        self.addCleanup(store.close)
+        cache.preload({'i:%s' % i: str(i) for i in range(50)})
+        self.memcached.preload({'i:%s' % i: str(i) for i in range(100)})
+        with patch.object(store._cache_client, 'get_many', wraps=store._cache_client.get_many) as mocked_cache:
+            with patch.object(store._db_client, 'get_many', wraps=store._db_client.get_many) as mocked_db:
+                res = store.get_many(['i:%s' % i for i in range(100)])
+        self.assertEqual(mocked_cache.call_count, 1)
+        mocked_db.assert_called_once_with(['i:%s' % i for i in range(50, 100)])
+        self.assertEqual(len(res), 100)
+
+
+class TestStoreLocalCache(unittest.TestCase):
+    def setUp(self):
+        self.memcached = FakeMemcached().start()
+        self.store = Store(port=self.memcached.port, l1_entries=100, l1_ttl=60)
+
+    def tearDown(self):
+        self.store.close()
+        self.memcached.stop()
+
+    def test_cache_get_served_locally(self):
+        self.store.cache_set('key', 3.5)
+        with patch.object(self.store._cache_client, 'get') as mocked_get:
+            self.assertEqual(self.store.cache_get('key'), b'3.5')
+        mocked_get.assert_not_called()
+
+    def test_remote_reads_are_remembered(self):
+        self.memcached.preload({'i:1': '["books"]', 'i:2': '["cars"]'})
+        self.assertEqual(self.store.get('i:1'), b'["books"]')
+        self.assertEqual(self.store.get_many(['i:2']), {'i:2': b'["cars"]'})
+        self.memcached.flush()
+        self.assertEqual(self.store.get_many(['i:1', 'i:2']), {'i:1': b'["books"]', 'i:2': b'["cars"]'})
+        self.assertEqual(self.store.local_cache.stats()['hits'], 2)
+
+    def test_set_invalidates_local_value(self):
+        self.store.set('key', 'old')
+        self.assertEqual(self.store.get('key'), b'old')
+        self.store.set('key', 'new')
+        # the set is not acknowledged, a read on the same connection waits until it is applied
+        self.store._db_client.get('key')
+        self.assertEqual(self.store.get('key'), b'new')
+
+    def test_cache_set_expire_respected(self):
+        self.store.cache_set('key', 'value', 1)
+        time.sleep(1.1)
+        self.assertIsNone(self.store.cache_get('key'))
+
+
 logging.disable(logging.ERROR)
 if __name__ == '__main__':
     unittest.main()
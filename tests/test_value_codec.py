@@ -0,0 +1,86 @@
+import os
+import tempfile
+import unittest
+
+import convert_interests
+import scoring
+from fake_memcached import FakeMemcached
+from store import Store
+from tests.decorator import cases
+from value_codec import JSON_CODEC, MAGIC, InterestsCodec, is_packed, load_vocabulary, make_codec, save_vocabulary
+
+
+class TestInterestsCodec(unittest.TestCase):
+    def setUp(self):
+        self.codec = InterestsCodec(["books", "cars", "music", "sport"])
+
+    @cases([[], ["books"], ["sport", "books", "sport"], ["music", "cars", "books", "sport"]])
+    def test_round_trip_packed(self, interests):
+        raw = self.codec.encode(interests)
+        self.assertTrue(is_packed(raw))
+        self.assertEqual(len(raw), len(MAGIC) + 1 + 2 * len(interests))
+        self.assertEqual(self.codec.decode(raw), interests)
+
+    @cases([["books", "travel"], ["books", 1], {"books": 1}])
+    def test_unknown_values_stored_as_json(self, value):
+        raw = self.codec.encode(value)
+        self.assertFalse(is_packed(raw))
+        self.assertEqual(raw, JSON_CODEC.encode(value))
+        self.assertEqual(self.codec.decode(raw), value)
+
+    @cases([b'["books", "cars"]', '["books", "cars"]'])
+    def test_reads_json(self, raw):
+        self.assertEqual(self.codec.decode(raw), ["books", "cars"])
+
+    def test_wide_vocabulary(self):
+        codec = InterestsCodec(["i%s" % i for i in range(70000)])
+        raw = codec.encode(["i0", "i69999"])
+        self.assertEqual(raw[len(MAGIC):len(MAGIC) + 1], b"I")
+        self.assertEqual(codec.decode(raw), ["i0", "i69999"])
+
+    def test_index_outside_vocabulary(self):
+        raw = InterestsCodec(["books", "cars", "music", "sport", "travel"]).encode(["travel"])
+        with self.assertRaises(ValueError):
+            self.codec.decode(raw)
+
+    def test_vocabulary_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "interests.txt")
+            save_vocabulary(path, self.codec.vocabulary)
+            self.assertEqual(load_vocabulary(path), self.codec.vocabulary)
+            self.assertEqual(make_codec(path).vocabulary, self.codec.vocabulary)
+        self.assertIs(make_codec(None), JSON_CODEC)
+
+
+class TestConvertInterests(unittest.TestCase):
+    def setUp(self):
+        self.memcached = FakeMemcached().start()
+        self.memcached.preload({"i:1": '["books", "cars"]', "i:2": '["travel"]', "i:3": '[]'})
+        self.codec = InterestsCodec(["books", "cars"])
+        self.store = Store(port=self.memcached.port, pool_size=1, codec=self.codec)
+
+    def tearDown(self):
+        self.store.close()
+        self.memcached.stop()
+
+    def test_parse_ids(self):
+        self.assertEqual(list(convert_interests.parse_ids("1-3, 7,9-10")), [1, 2, 3, 7, 9, 10])
+
+    def test_scan_vocabulary(self):
+        self.assertEqual(convert_interests.scan_vocabulary(self.store, self.codec, range(1, 5)), ["travel"])
+
+    def test_convert_and_back(self):
+        stats = convert_interests.convert(self.store, self.codec, range(1, 5))
+        self.assertEqual((stats["converted"], stats["json"], stats["unchanged"], stats["missing"]), (2, 0, 1, 1))
+        self.assertTrue(is_packed(self.memcached.get_many([b"i:1"])[b"i:1"][1]))
+        self.assertEqual(scoring.get_interests_many(self.store, [1, 2, 3, 4]),
+                         {1: ["books", "cars"], 2: ["travel"], 3: [], 4: []})
+        stats = convert_interests.convert(self.store, self.codec, range(1, 5), target=JSON_CODEC)
+        self.assertEqual(stats["converted"], 2)
+        self.assertEqual(self.memcached.get_many([b"i:1"])[b"i:1"][1], b'["books", "cars"]')
+
+    def test_dry_run(self):
+        stats = convert_interests.convert(self.store, self.codec, [1], dry_run=True)
+        self.assertEqual(stats["converted"], 1)
+        self.assertLess(stats["bytes_after"], stats["bytes_before"])
+        self.assertFalse(is_packed(self.memcached.get_many([b"i:1"])[b"i:1"][1]))
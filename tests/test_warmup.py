@@ -0,0 +1,108 @@
+import io
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+import scoring
+import warmup
+from benchmarks.common import free_port, post, signed_request, start_api, stop_api
+from fake_memcached import FakeMemcached
+from store import Store
+from tests.decorator import cases
+from warmup import Loader, RateLimiter, read_checkpoint, read_records, warm_up, write_checkpoint
+
+
+class TestWarmup(unittest.TestCase):
+    def setUp(self):
+        self.memcached = FakeMemcached().start()
+        self.store = Store(port=self.memcached.port, pool_size=2)
+        self.dir = tempfile.TemporaryDirectory()
+        self.checkpoint = os.path.join(self.dir.name, "load.ckpt")
+
+    def tearDown(self):
+        self.store.close()
+        self.memcached.stop()
+        self.dir.cleanup()
+
+    def dump(self, count):
+        return io.StringIO("".join(json.dumps({"cid": cid, "interests": ["books", str(cid)]}) + "\n"
+                                   for cid in range(1, count + 1)))
+
+    @cases([("jsonl", '{"cid": 7, "interests": ["books", "cars"]}\n\n', 7), ("csv", '7,books,cars\n\n', "7")])
+    def test_read_records(self, fmt, data, cid):
+        self.assertEqual(list(read_records(io.StringIO(data), fmt)), [(1, cid, ["books", "cars"])])
+
+    def test_load_all_records(self):
+        loader = Loader(self.store, parallel=3, batch_size=7, checkpoint=self.checkpoint)
+        self.assertEqual(loader.load(read_records(self.dump(100))), 100)
+        self.assertEqual(self.memcached.stats()["curr_items"], 100)
+        self.assertEqual(scoring.get_interests(self.store, 42), ["books", "42"])
+        self.assertEqual(read_checkpoint(self.checkpoint), 100)
+
+    def test_resume_from_checkpoint(self):
+        write_checkpoint(self.checkpoint, 60)
+        start = read_checkpoint(self.checkpoint)
+        loader = Loader(self.store, batch_size=10, checkpoint=self.checkpoint, start_line=start)
+        self.assertEqual(loader.load(read_records(self.dump(100), skip=start)), 40)
+        self.assertIsNone(self.store.get_many(["i:60"]).get("i:60"))
+        self.assertIsNotNone(self.store.get_many(["i:61"]).get("i:61"))
+
+    def test_failed_batch_stops_checkpoint(self):
+        real = self.store.set_many
+
+        def set_many(values):
+            return list(values) if "i:15" in values else real(values)
+
+        with patch.object(self.store, "set_many", side_effect=set_many):
+            loader = Loader(self.store, parallel=1, batch_size=10, checkpoint=self.checkpoint)
+            self.assertEqual(loader.load(read_records(self.dump(30))), 20)
+        self.assertEqual((loader.failed, read_checkpoint(self.checkpoint)), (10, 10))
+
+    def test_rate_limit(self):
+        limiter = RateLimiter(1000)
+        started = time.monotonic()
+        for _ in range(5):
+            limiter.acquire(20)
+        self.assertGreaterEqual(time.monotonic() - started, 0.08)
+
+    def test_warm_up_fills_local_cache(self):
+        self.memcached.preload({"i:1": '["books"]', "i:2": '["cars"]'})
+        store = Store(port=self.memcached.port, l1_entries=10)
+        try:
+            path = os.path.join(self.dir.name, "keys.txt")
+            with open(path, "w") as f:
+                f.write("i:1\ni:2\ni:3\n")
+            self.assertEqual(warm_up(store, warmup.read_keys(path)), 2)
+            self.assertEqual(store.local_cache.get("i:2"), b'["cars"]')
+        finally:
+            store.close()
+
+    def test_hot_keys_recorded_most_recent_first(self):
+        self.memcached.preload({"i:1": '["books"]', "i:2": '["cars"]'})
+        store = Store(port=self.memcached.port, l1_entries=10)
+        try:
+            store.get("i:2")
+            store.get("i:1")
+            path = os.path.join(self.dir.name, "keys.txt")
+            warmup.save_keys(path, warmup.hot_keys(store))
+            self.assertEqual(warmup.read_keys(path), ["i:1", "i:2"])
+        finally:
+            store.close()
+        store = Store(port=self.memcached.port)
+        self.addCleanup(store.close)
+        self.assertEqual(warmup.hot_keys(store), [])
+
+    def test_server_records_hot_keys_on_shutdown(self):
+        self.memcached.preload({"i:1": '["books"]'})
+        path = os.path.join(self.dir.name, "keys.txt")
+        port = free_port()
+        process = start_api(port, "--store-port", self.memcached.port, "--l1-entries", 100, "--warmup-keys", path)
+        try:
+            code, _ = post(port, signed_request("clients_interests", {"client_ids": [1]}))
+            self.assertEqual(code, 200)
+        finally:
+            stop_api(process)
+        self.assertEqual(warmup.read_keys(path), ["i:1"])
@@ -0,0 +1,160 @@
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock
+
+import scoring
+from benchmarks.common import free_port, post, signed_request, start_api, stop_api
+from fake_memcached import FakeMemcached
+from store import Store
+from tests.decorator import enable_logging
+from write_behind import WriteBehindQueue
+enable_logging
+
+
+class TestWriteBehindQueue(unittest.TestCase):
+    def setUp(self):
+        self.flushed = []
+        self.queue = None
+
+    def tearDown(self):
+        if self.queue is not None:
+            self.queue.close()
+
+    def flush(self, values, expire):
+        self.flushed.append((dict(values), expire))
+
+    def test_flush_by_size(self):
+        self.queue = WriteBehindQueue(self.flush, batch_size=3, interval=10)
+        for i in range(3):
+            self.queue.put('k%s' % i, i)
+        deadline = time.monotonic() + 1
+        while not self.flushed and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.flushed, [({'k0': 0, 'k1': 1, 'k2': 2}, 0)])
+
+    def test_flush_by_interval(self):
+        self.queue = WriteBehindQueue(self.flush, batch_size=100, interval=0.05)
+        self.queue.put('k', 1, 60)
+        time.sleep(0.02)
+        self.assertEqual(self.flushed, [])
+        time.sleep(0.1)
+        self.assertEqual(self.flushed, [({'k': 1}, 60)])
+
+    def test_duplicate_keys_coalesced(self):
+        self.queue = WriteBehindQueue(self.flush, interval=10)
+        self.queue.put('k', 1)
+        self.queue.put('k', 2)
+        self.queue.close()
+        self.assertEqual(self.flushed, [({'k': 2}, 0)])
+        self.assertEqual(self.queue.stats()['coalesced'], 1)
+
+    def test_batches_grouped_by_expire(self):
+        self.queue = WriteBehindQueue(self.flush, interval=10)
+        self.queue.put('a', 1, 60)
+        self.queue.put('b', 2, 30)
+        self.queue.put('c', 3, 60)
+        self.queue.close()
+        self.assertCountEqual(self.flushed, [({'a': 1, 'c': 3}, 60), ({'b': 2}, 30)])
+
+    def test_full_queue_blocks_then_drops(self):
+        release = threading.Event()
+        self.queue = WriteBehindQueue(lambda values, expire: release.wait(), max_items=2, batch_size=1,
+                                      interval=10, put_timeout=0.05)
+        self.queue.put('a', 1)
+        time.sleep(0.05)
+        self.queue.put('b', 2)
+        self.queue.put('c', 3)
+        started = time.monotonic()
+        self.assertFalse(self.queue.put('d', 4))
+        self.assertGreaterEqual(time.monotonic() - started, 0.04)
+        release.set()
+        stats = self.queue.stats()
+        self.assertEqual((stats['dropped'], stats['waits']), (1, 1))
+
+    def test_flush_error_logged(self):
+        enable_logging(self)
+        self.queue = WriteBehindQueue(MagicMock(side_effect=ConnectionError('down')), interval=10)
+        self.queue.put('k', 1)
+        with self.assertLogs(level='ERROR'):
+            self.queue.close()
+        self.assertEqual(self.queue.stats()['flushes'], 1)
+
+    def test_put_waiting_when_closed_is_refused(self):
+        release = threading.Event()
+        self.queue = WriteBehindQueue(lambda values, expire: release.wait(), max_items=1, batch_size=1,
+                                      interval=10, put_timeout=5)
+        self.queue.put('a', 1)
+        time.sleep(0.05)
+        self.queue.put('b', 2)
+        errors = []
+
+        def put():
+            try:
+                self.queue.put('c', 3)
+            except RuntimeError as ex:
+                errors.append(ex)
+
+        waiting = threading.Thread(target=put)
+        waiting.start()
+        time.sleep(0.05)
+        closing = threading.Thread(target=self.queue.close)
+        closing.start()
+        time.sleep(0.05)
+        release.set()
+        closing.join(timeout=5)
+        waiting.join(timeout=5)
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(self.queue.stats()['written'], 2)
+
+    def test_put_after_close(self):
+        self.queue = WriteBehindQueue(self.flush)
+        self.queue.close()
+        with self.assertRaises(RuntimeError):
+            self.queue.put('k', 1)
+
+
+class TestStoreWriteBehind(unittest.TestCase):
+    def setUp(self):
+        self.memcached = FakeMemcached(latency=0.03).start()
+        self.store = Store(port=self.memcached.port, write_behind=100, write_behind_interval=10)
+
+    def tearDown(self):
+        self.store.close()
+        self.memcached.stop()
+
+    def test_cache_set_does_not_wait_for_memcached(self):
+        started = time.monotonic()
+        self.store.cache_set('k', 1)
+        self.assertLess(time.monotonic() - started, 0.03)
+        self.assertEqual(self.memcached.stats()['curr_items'], 0)
+
+    def test_close_writes_queued_values(self):
+        profile = {'phone': '79175002040', 'email': 'stupnikov@otus.ru'}
+        self.assertEqual(scoring.get_score(self.store, **profile), 3.0)
+        self.store.cache_set_many({'a': 1, 'b': 2})
+        self.store.close()
+        self.assertEqual(self.memcached.stats()['curr_items'], 3)
+        self.assertEqual(self.store.write_queue.stats()['written'], 3)
+
+
+class TestServerShutdown(unittest.TestCase):
+    def setUp(self):
+        self.memcached = FakeMemcached().start()
+
+    def tearDown(self):
+        self.memcached.stop()
+
+    def test_sigterm_writes_queued_values(self):
+        port = free_port()
+        process = start_api(port, "--store-port", self.memcached.port, "--write-behind", 100,
+                            "--write-behind-interval", 60)
+        try:
+            code, response = post(port, signed_request("online_score", {"phone": "79175002040",
+                                                                        "email": "stupnikov@otus.ru"}))
+            self.assertEqual(code, 200)
+            self.assertEqual(self.memcached.stats()['curr_items'], 0)
+        finally:
+            stop_api(process)
+        self.assertEqual(process.returncode, 0)
+        self.assertEqual(self.memcached.stats()['curr_items'], 1)
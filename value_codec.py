@@ -0,0 +1,80 @@
+import json
+import sys
+from array import array
+
+# JSON never starts with a zero byte, so values with this prefix are packed ones
+MAGIC = b'\x00ic'
+
+
+class JsonCodec:
+    """Values stored as JSON, the format the API has always written."""
+    name = 'json'
+
+    def encode(self, value):
+        return json.dumps(value).encode()
+
+    def decode(self, raw):
+        return json.loads(raw)
+
+
+class InterestsCodec(JsonCodec):
+    """Interest lists stored as indexes into a shared vocabulary.
+
+    A list is packed as ``MAGIC``, the array typecode and its little-endian
+    unsigned 16 bit (or 32 bit for a vocabulary above 65536 entries) indexes.
+    Lists with interests missing from the vocabulary are stored as JSON, and JSON
+    values are decoded as before, so both formats can be read during a migration.
+    Every process must use the same vocabulary; new interests may only be appended.
+    """
+    name = 'interests'
+
+    def __init__(self, vocabulary):
+        self.vocabulary = list(vocabulary)
+        self._ids = {interest: i for i, interest in enumerate(self.vocabulary)}
+        self._typecode = 'H' if len(self.vocabulary) <= 1 << 16 else 'I'
+
+    def packable(self, value):
+        return isinstance(value, list) and all(isinstance(item, str) and item in self._ids for item in value)
+
+    def encode(self, value):
+        if not self.packable(value):
+            return super().encode(value)
+        ids = array(self._typecode, [self._ids[item] for item in value])
+        if sys.byteorder == 'big':
+            ids.byteswap()
+        return MAGIC + self._typecode.encode() + ids.tobytes()
+
+    def decode(self, raw):
+        if not isinstance(raw, bytes) or not raw.startswith(MAGIC):
+            return super().decode(raw)
+        ids = array(chr(raw[len(MAGIC)]))
+        ids.frombytes(raw[len(MAGIC) + 1:])
+        if sys.byteorder == 'big':
+            ids.byteswap()
+        vocabulary = self.vocabulary
+        try:
+            return [vocabulary[i] for i in ids]
+        except IndexError:
+            raise ValueError('Interest index out of the vocabulary of %s entries' % len(self.vocabulary))
+
+
+def is_packed(raw):
+    return isinstance(raw, bytes) and raw.startswith(MAGIC)
+
+
+def load_vocabulary(path):
+    """Reads one interest per line, in index order."""
+    with open(path, encoding='utf-8') as f:
+        return [line.rstrip('\n') for line in f if line.strip()]
+
+
+def save_vocabulary(path, vocabulary):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.writelines(interest + '\n' for interest in vocabulary)
+
+
+JSON_CODEC = JsonCodec()
+
+
+def make_codec(vocabulary_path=None):
+    return InterestsCodec(load_vocabulary(vocabulary_path)) if vocabulary_path else JSON_CODEC
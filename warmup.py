@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Bulk loading of client interests into the storage after a memcached restart.
+
+Reads a JSONL dump with one ``{"cid": 1, "interests": ["books", "cars"]}`` object
+per line, or a CSV one with the client id in the first column and its interests in
+the others, and writes ``i:<cid>`` with ``set_many`` batches, ``--parallel`` at a
+time and at most ``--rate`` keys per second. Every ``--checkpoint-every`` seconds
+the number of lines loaded without a gap is saved to ``--checkpoint``, and a new
+run with the same checkpoint skips them.
+
+    python warmup.py -i interests.jsonl --checkpoint interests.ckpt --parallel 4 --rate 50000
+"""
+
+import csv
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from optparse import OptionParser
+
+from scoring import get_interests_key
+from store import Store
+from value_codec import make_codec
+
+BATCH_SIZE = 500
+
+
+class RateLimiter:
+    """Lets at most ``rate`` units a second through, zero for no limit."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, units=1):
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(self._next, now)
+            self._next = start + units / self.rate
+        if start > now:
+            time.sleep(start - now)
+
+
+def parse_jsonl(line):
+    record = json.loads(line)
+    return record.get('cid', record.get('client_id')), record['interests']
+
+
+def parse_csv(line):
+    row = next(csv.reader([line]))
+    return row[0], [interest for interest in row[1:] if interest]
+
+
+def read_records(src, fmt='jsonl', skip=0):
+    """Yields (line number, cid, interests) for every non-blank line after ``skip``."""
+    parse = parse_csv if fmt == 'csv' else parse_jsonl
+    for number, line in enumerate(src, 1):
+        if number <= skip or not line.strip():
+            continue
+        cid, interests = parse(line)
+        yield number, cid, interests
+
+
+def read_checkpoint(path):
+    try:
+        with open(path) as f:
+            return json.load(f)['line']
+    except FileNotFoundError:
+        return 0
+
+
+def write_checkpoint(path, line):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({'line': line}, f)
+    os.replace(tmp, path)
+
+
+class Loader:
+    """Writes record batches through store.set_many and tracks the loaded prefix of the input."""
+
+    def __init__(self, store, parallel=4, rate=0, batch_size=BATCH_SIZE, checkpoint=None, checkpoint_every=5.0,
+                 start_line=0):
+        self.store = store
+        self.parallel = parallel
+        self.limiter = RateLimiter(rate)
+        self.batch_size = batch_size
+        self.checkpoint = checkpoint
+        self.checkpoint_every = checkpoint_every
+        self.loaded_line = start_line
+        self.keys = 0
+        self.failed = 0
+        # batches done out of order, by the line they start after
+        self._done = {}
+        self._lock = threading.Lock()
+
+    def _write(self, first_line, last_line, values):
+        failed = self.store.set_many(values)
+        with self._lock:
+            self.keys += len(values) - len(failed)
+            self.failed += len(failed)
+            if failed:
+                return
+            self._done[first_line] = last_line
+            while self.loaded_line in self._done:
+                self.loaded_line = self._done.pop(self.loaded_line)
+
+    def _save(self):
+        if self.checkpoint is not None:
+            with self._lock:
+                line = self.loaded_line
+            write_checkpoint(self.checkpoint, line)
+
+    def load(self, records):
+        """Loads (line number, cid, interests) records and returns the keys written."""
+        records = iter(records)
+        started = saved = time.monotonic()
+        previous = self.loaded_line
+        with ThreadPoolExecutor(max_workers=self.parallel) as executor:
+            slots = threading.BoundedSemaphore(self.parallel * 2)
+            while True:
+                batch = list(islice(records, self.batch_size))
+                if not batch:
+                    break
+                values = {get_interests_key(cid): self.store.codec.encode(interests) for _, cid, interests in batch}
+                self.limiter.acquire(len(values))
+                slots.acquire()
+                future = executor.submit(self._write, previous, batch[-1][0], values)
+                future.add_done_callback(lambda _: slots.release())
+                previous = batch[-1][0]
+                now = time.monotonic()
+                if now - saved >= self.checkpoint_every:
+                    saved = now
+                    self._save()
+                    logging.info("%s keys, %.0f keys/s, line %s", self.keys, self.keys / (now - started),
+                                 self.loaded_line)
+        self._save()
+        return self.keys
+
+
+def read_keys(path):
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def save_keys(path, keys):
+    """Writes keys one per line, replacing the file at once."""
+    tmp = '%s.%s.tmp' % (path, os.getpid())
+    with open(tmp, 'w') as f:
+        f.writelines('%s\n' % key for key in keys)
+    os.replace(tmp, path)
+
+
+def hot_keys(store):
+    """Keys of the L1 cache of store, the most recently used first."""
+    return store.local_cache.keys()[::-1] if store.local_cache is not None else []
+
+
+def warm_up(store, keys, batch_size=BATCH_SIZE):
+    """Reads recorded hot keys once, so they are in the L1 cache before the first
+    request. Memcached itself is not written. Returns the number of keys found."""
+    found = 0
+    for i in range(0, len(keys), batch_size):
+        try:
+            found += len(store.get_many(keys[i:i + batch_size]))
+        except MemoryError:
+            pass
+    return found
+
+
+if __name__ == "__main__":
+    op = OptionParser()
+    op.add_option("-i", "--input", action="store", default=None)
+    op.add_option("--format", action="store", default=None)
+    op.add_option("--store-host", action="store", default="localhost")
+    op.add_option("--store-port", action="store", type=int, default=11211)
+    op.add_option("--interests-vocab", action="store", default=None)
+    op.add_option("--batch-size", action="store", type=int, default=BATCH_SIZE)
+    op.add_option("--parallel", action="store", type=int, default=4)
+    op.add_option("--rate", action="store", type=float, default=0)
+    op.add_option("--checkpoint", action="store", default=None)
+    op.add_option("--checkpoint-every", action="store", type=float, default=5.0)
+    (opts, args) = op.parse_args()
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname).1s %(message)s',
+                        datefmt='%Y.%m.%d %H:%M:%S')
+    if not opts.input:
+        op.error("--input is required")
+    fmt = opts.format or ('csv' if opts.input.endswith('.csv') else 'jsonl')
+    start_line = read_checkpoint(opts.checkpoint) if opts.checkpoint else 0
+    # pooled connections wait for the write replies, so failed keys are known
+    store = Store(opts.store_host, opts.store_port, pool_size=opts.parallel, codec=make_codec(opts.interests_vocab))
+    loader = Loader(store, opts.parallel, opts.rate, opts.batch_size, opts.checkpoint, opts.checkpoint_every,
+                    start_line)
+    started = time.perf_counter()
+    try:
+        with open(opts.input, newline='') as src:
+            keys = loader.load(read_records(src, fmt, start_line))
+    finally:
+        store.close()
+    elapsed = time.perf_counter() - started
+    logging.info("%s keys in %.2fs, %.0f keys/s, %s failed, loaded up to line %s", keys, elapsed,
+                 keys / elapsed if elapsed else 0, loader.failed, loader.loaded_line)
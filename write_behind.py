@@ -0,0 +1,122 @@
+import logging
+import threading
+import time
+
+
+class WriteBehindQueue:
+    """Collects cache writes and hands them to ``flush`` in batches from a background thread.
+
+    ``flush(values, expire)`` gets the pending values for one expiration time. A batch
+    is flushed once ``batch_size`` keys are pending or the oldest pending write is
+    ``interval`` seconds old. A write to a key that is still pending replaces the
+    pending value. When ``max_items`` keys are pending a writer waits up to
+    ``put_timeout`` seconds for a flush and then the write is dropped. Closing the
+    queue flushes everything still pending; a write to a closed queue, or one still
+    waiting when it is closed, raises RuntimeError.
+    """
+
+    def __init__(self, flush, max_items=10000, batch_size=100, interval=0.05, put_timeout=0.1):
+        self._flush = flush
+        self.max_items = max(max_items, 1)
+        self.batch_size = max(batch_size, 1)
+        self.interval = interval
+        self.put_timeout = put_timeout
+        self._pending = {}
+        self._oldest = None
+        self._cond = threading.Condition()
+        self._closed = False
+        self.queued = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.waits = 0
+        self.flushes = 0
+        self.written = 0
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._thread.start()
+
+    def put(self, key, value, expire=0):
+        """Queue a write, returning False when it was dropped."""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError('Write-behind queue is closed')
+            if key in self._pending:
+                self.coalesced += 1
+            elif len(self._pending) >= self.max_items:
+                self.waits += 1
+                self._cond.notify_all()
+                deadline = time.monotonic() + self.put_timeout
+                while len(self._pending) >= self.max_items and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.dropped += 1
+                        return False
+                    self._cond.wait(remaining)
+                if self._closed:
+                    # close() has taken the last batch, nothing would write this one
+                    raise RuntimeError('Write-behind queue is closed')
+            self._pending[key] = (value, expire)
+            self.queued += 1
+            if self._oldest is None or len(self._pending) >= self.batch_size:
+                # the writer starts the interval on the first write and flushes a full batch
+                self._oldest = self._oldest or time.monotonic()
+                self._cond.notify_all()
+            return True
+
+    def _take(self):
+        batch, self._pending, self._oldest = self._pending, {}, None
+        self._cond.notify_all()
+        by_expire = {}
+        for key, (value, expire) in batch.items():
+            by_expire.setdefault(expire, {})[key] = value
+        return by_expire
+
+    def _write(self, by_expire):
+        for expire, values in by_expire.items():
+            try:
+                self._flush(values, expire)
+            except Exception:
+                logging.exception('Error while flushing %s cache writes', len(values))
+            with self._cond:
+                self.flushes += 1
+                self.written += len(values)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed:
+                    if len(self._pending) >= self.batch_size:
+                        break
+                    if self._oldest is not None:
+                        remaining = self._oldest + self.interval - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                    else:
+                        self._cond.wait()
+                if self._closed:
+                    return
+                by_expire = self._take()
+            self._write(by_expire)
+
+    def close(self):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        with self._cond:
+            by_expire = self._take()
+        self._write(by_expire)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'pending': len(self._pending),
+                'queued': self.queued,
+                'coalesced': self.coalesced,
+                'dropped': self.dropped,
+                'waits': self.waits,
+                'flushes': self.flushes,
+                'written': self.written,
+            }